@@ -8,6 +8,7 @@ from fastapi_sqlalchemy import DBSessionMiddleware, db
 from starlette.middleware.authentication import AuthenticationMiddleware
 
 from app.shared.bases.base_model import ModelMixin, ModelType
+from app.shared.middleware.async_session import AsyncSessionMiddleware
 from app.shared.middleware.request_logging import LoggingMiddleware
 
 from settings import Config
@@ -53,6 +54,7 @@ app.add_middleware(
     db_url=f"postgresql+psycopg2://{Config.postgres_connection}",
     engine_args={"pool_size": 100000, "max_overflow": 10000},
 )
+app.add_middleware(AsyncSessionMiddleware)
 logger.debug("Middleware registered")
 
 logger.debug("Database connection established")
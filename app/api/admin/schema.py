@@ -233,6 +233,22 @@ class AgentUpdateResponse(BaseResponse):
     response: Optional[AgentUser]
 
 
+class AgentBatch(CamelModel):
+    # The agents an action of the `/manage` endpoints applies to at once.
+    agentIds: List[UUID]
+
+
+class AgentQuotaReset(AgentBatch):
+    balance: int = 0
+
+
+class AgentBatchResponse(BaseResponse):
+    # The ids of the rows a batch action updated.
+    success: bool
+    error: Optional[str]
+    response: Optional[List[UUID]]
+
+
 class AdminUserUpdateName(CamelModel):
     username: str
 
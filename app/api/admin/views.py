@@ -6,6 +6,9 @@ from fastapi import APIRouter, Depends, Request
 from app import logging
 from app.api.admin.models import Admin
 from app.api.admin.schema import (
+    AgentBatch,
+    AgentBatchResponse,
+    AgentQuotaReset,
     AgentUpdateResponse,
     AgentUpdate,
     ListAdminUserResponse,
@@ -113,6 +116,50 @@ async def update_agent(context: AgentUpdate, request: Request):
     return AgentUpdateResponse(success=True, response=agent)
 
 
+@router.post("/manage/deactivate_agents", response_model=AgentBatchResponse)
+async def deactivate_agents(context: AgentBatch, request: Request):
+    """
+    > Deactivate agents and every user they created, in one transaction with
+    one UPDATE per table
+
+    :param context: AgentBatch - the ids of the agents to deactivate
+    :type context: AgentBatch
+    :param request: Request - This is the request object that is passed to the function
+    :type request: Request
+    :return: AgentBatchResponse with the ids of the agents deactivated
+    """
+    logger.info(f"Deactivating {len(context.agentIds)} agents")
+    agents = Agent.update_many(
+        filters={"id__in": context.agentIds}, patch={"active": False}, commit=False
+    )
+    if not agents:
+        logger.info("No agents deactivated")
+        return AgentBatchResponse(success=False, error="Agents not found")
+    users = User.update_many(filters={"agentId__in": agents}, patch={"active": False})
+    logger.info(f"{len(agents)} agents and {len(users)} of their users deactivated")
+    return AgentBatchResponse(success=True, response=agents)
+
+
+@router.post("/manage/reset_quotas", response_model=AgentBatchResponse)
+async def reset_quotas(context: AgentQuotaReset, request: Request):
+    """
+    > Reset the quota balance of agents in one UPDATE
+
+    :param context: AgentQuotaReset - the ids of the agents and the new balance
+    :type context: AgentQuotaReset
+    :param request: Request - This is the request object that is passed to the function
+    :type request: Request
+    :return: AgentBatchResponse with the ids of the quotas reset
+    """
+    logger.info(f"Resetting the quota of {len(context.agentIds)} agents")
+    quotas = Quota.update_many(
+        filters={"agentId__in": context.agentIds}, patch={"balance": context.balance}
+    )
+    if not quotas:
+        return AgentBatchResponse(success=False, error="Quotas not found")
+    return AgentBatchResponse(success=True, response=quotas)
+
+
 @router.post("/manage/remove_agent", response_model=BaseResponse)
 async def remove_agent(user: RemoveUser, request: Request):
     """
@@ -144,8 +191,11 @@ async def list_agents(context: GetUserList, request: Request):
     logger.info(
         f"Listing agents with page {context.params.page} and size {context.params.size}"
     )
-    agent_pages = Agent.list_all_agents(
-        context.params.page, context.params.size, active=context.context.filter.active
+    agent_pages = await Agent.async_list_all_agents(
+        context.params.page,
+        context.params.size,
+        context.params.cursor,
+        active=context.context.filter.active,
     )
     logger.info(f"{len(agent_pages.items)} agents found")
     return ListAdminUserResponse(
@@ -3,13 +3,19 @@
 """
 import datetime
 import uuid
+from typing import Optional
 
 import pytz
-from sqlalchemy import Column, Boolean, ForeignKey, DateTime, String
+from sqlalchemy import Column, Boolean, ForeignKey, DateTime, String, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship, backref, joinedload, defer, load_only
 
-from app.shared.bases.base_model import ModelMixin, paginate, ModelType
+from app.shared.bases.base_model import (
+    ModelMixin,
+    paginate,
+    ModelType,
+    async_paginate,
+)
 import logging
 
 logger = logging.getLogger("agent_models")
@@ -18,6 +24,7 @@ logger.addHandler(logging.StreamHandler())
 
 class Agent(ModelMixin):
     __tablename__ = "Agent"
+    __table_args__ = (Index("ix_Agent_createdAt_id", "createdAt", "id"),)
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
     email = Column(String(255), nullable=False)
@@ -135,7 +142,9 @@ class Agent(ModelMixin):
             return
 
     @classmethod
-    def list_all_agents(cls, page: int = 1, num_items: int = 1, **kwargs):
+    def list_all_agents(
+        cls, page: int = 1, num_items: int = 1, cursor: Optional[str] = None, **kwargs
+    ):
         """
         The list_all_agent_users function returns a list of all agent users in the database.
 
@@ -144,7 +153,18 @@ class Agent(ModelMixin):
         """
         users = cls.where(**kwargs).options(defer("password"))
 
-        return paginate(users, page, num_items)
+        return paginate(users, page, num_items, cursor)
+
+    @classmethod
+    async def async_list_all_agents(
+        cls, page: int = 1, num_items: int = 1, cursor: Optional[str] = None, **kwargs
+    ):
+        """
+        The async_list_all_agents function is list_all_agents on the async
+        session, with the quota each agent is listed with loaded alongside.
+        """
+        agents = cls.select_where(defer("password"), joinedload(cls.quota), **kwargs)
+        return await async_paginate(agents, page, num_items, cursor)
 
     @classmethod
     def get(cls, *_, **kwargs) -> ModelType:
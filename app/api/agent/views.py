@@ -176,6 +176,7 @@ async def get_agent_users(
         User.where(agentId=context.context.filter.id),
         context.params.page,
         context.params.size,
+        context.params.cursor,
     )
     logger.info(
         f"Retrieved {len(agent_users.items)} users for agent with id {context.context.filter.id}"
@@ -198,7 +199,7 @@ async def list_all_users(context: GetAllUsers):
     """
     logger.info("Retrieving all users")
     paged_users: GetUserListItems = User.get_all_users(
-        context.params.page, context.params.size
+        context.params.page, context.params.size, context.params.cursor
     )
     logger.info(f"Retrieved {len(paged_users.items)} users")
     return GetUserListResponse(success=True, response=paged_users)
@@ -35,6 +35,7 @@ from app.shared.auth.auth_handler import sign_jwt, TokenResponse
 from app.shared.auth.password_handler import get_password_hash
 from typing import Union
 from app.shared.auth.password_generator import generate_password
+from app.shared.auth.token_cache import token_cache, token_hash
 from app.shared.auth.token_handler import generate_confirmation_token, confirm_token
 from app.shared.email.mailgun import send_password_email
 from app.shared.twilio.sms import send_sms
@@ -308,7 +309,15 @@ async def verify_otp_login(context: OTPLoginVerify):
                     username=user.username,
                 )
             )
-            User.update(id=user.id, accessToken=response.response.access_token)
+            access_token = response.response.access_token
+            previous_token = user.accessToken
+            User.update(
+                id=user.id,
+                accessToken=access_token,
+                accessTokenHash=token_hash(access_token),
+            )
+            await token_cache.forget(previous_token)
+            await token_cache.remember(access_token, user.id)
             return response
         return BaseResponse(success=False, error=OTPError.UserNotFound)
 
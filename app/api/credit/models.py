@@ -3,6 +3,7 @@
 """
 import uuid
 from datetime import datetime
+from typing import Optional
 import pytz
 from fastapi_sqlalchemy import db
 from pydantic import BaseModel
@@ -17,6 +18,7 @@ from sqlalchemy import (
     ForeignKey,
     Integer,
     Enum,
+    Index,
 )
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship, backref
@@ -122,6 +124,7 @@ class Withdrawal(ModelMixin):
     """
 
     __tablename__ = "Withdrawal"
+    __table_args__ = (Index("ix_Withdrawal_createdAt_id", "createdAt", "id"),)
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
     amount = Column(Integer)
@@ -149,9 +152,11 @@ class Withdrawal(ModelMixin):
     )
 
     @classmethod
-    def get_user_withdrawals(cls, page: int, size: int, **kwargs):
+    def get_user_withdrawals(
+        cls, page: int, size: int, cursor: Optional[str] = None, **kwargs
+    ):
         try:
-            return paginate(Withdrawal.where(**kwargs), page, size)
+            return paginate(Withdrawal.where(**kwargs), page, size, cursor)
         except Exception as e:
             print(e)
             return
@@ -163,6 +168,7 @@ class Deposit(ModelMixin):
     """
 
     __tablename__ = "Deposit"
+    __table_args__ = (Index("ix_Deposit_createdAt_id", "createdAt", "id"),)
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
     amount = Column(Integer)
@@ -127,7 +127,9 @@ async def update_agent_quota(context: UpdateAgentQuota, request: Request):
     :param request: Request
     :return:  UpdateAgentQuotaResponse
     """
-    _updated = Quota.update(agentId=context.agentId, balance=context.quota.balance)
+    _updated = await Quota.async_update(
+        agentId=context.agentId, balance=context.quota.balance
+    )
     return (
         UpdateAgentQuotaResponse(success=True, response=_updated)
         if _updated
@@ -312,7 +314,10 @@ async def get_user_deposits(context: GetUserDeposits, request: Request):
     filters = {k: v for k, v in filters.items() if v}
 
     deposits = paginate(
-        Deposit.where(**filters), context.params.page, context.params.size
+        Deposit.where(**filters),
+        context.params.page,
+        context.params.size,
+        context.params.cursor,
     )
     return (
         GetUserDepositsResponse(success=True, response=deposits)
@@ -82,11 +82,12 @@ class GameSession(ModelMixin):
         backref=backref("gameSession", single_parent=True, uselist=False),
     )
 
+    totalBet = Column(Integer, default=0)
+    totalWin = Column(Integer, default=0)
     createdAt = Column(DateTime, default=lambda: datetime.datetime.now(pytz.utc))
     updatedAt = Column(DateTime, nullable=True)
 
 
-
 class PlayerSession(ModelMixin):
     """
     PlayerSession is a table that stores the player session.
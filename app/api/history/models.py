@@ -5,7 +5,16 @@ import uuid
 from datetime import datetime
 
 import pytz
-from sqlalchemy import Column, Integer, Boolean, ForeignKey, DateTime, JSON, String
+from sqlalchemy import (
+    Column,
+    Integer,
+    Boolean,
+    ForeignKey,
+    DateTime,
+    JSON,
+    String,
+    Index,
+)
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship, backref
 
@@ -86,6 +95,7 @@ class ActionHistory(ModelMixin):
     """
 
     __tablename__ = "ActionHistory"
+    __table_args__ = (Index("ix_ActionHistory_createdAt_id", "createdAt", "id"),)
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
     newValueJson = Column(JSONB)
     path = Column(String(255), nullable=True)
@@ -0,0 +1,98 @@
+import asyncio
+import uuid
+
+import pytest
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+
+from app.api.admin.schema import GetUserList
+from app.api.admin.views import list_agents
+from app.api.agent.models import Agent
+from app.api.credit.models import Quota
+from app.api.game.models import GameList
+from app.api.history.models import ActionHistory, BetDetailHistory
+from app.api.history.schema import GetActionHistory, GetBetHistory
+from app.api.history.views import get_action_history_, get_bet_history_
+from app.api.user.models import User
+from app.shared.bases.async_session import async_db
+
+
+@pytest.fixture
+def rows(engine):
+    """
+    Rows committed for the async session to read, deleted after the test.
+    """
+    name = f"history-{uuid.uuid4().hex[:12]}"
+    session = Session(engine)
+    agent = Agent(email=f"{name}@example.com", password="x", username=name)
+    user = User(phone=name, username=name, agentId=agent.id)
+    game = GameList(id=uuid.uuid4().int % 2**31, eGameName=name, cGameName=name)
+    session.add_all([agent, game])
+    session.flush()
+    user.agentId = agent.id
+    session.add_all([Quota(agentId=agent.id, balance=50), user])
+    session.flush()
+    session.add_all(
+        [
+            ActionHistory(agentId=agent.id, userId=user.id, path="/", ip="::1"),
+            BetDetailHistory(gameId=game.id, ownerId=user.id, betScore=5),
+        ]
+    )
+    session.commit()
+    yield agent, user, game
+    for model, where in (
+        (ActionHistory, ActionHistory.agentId == agent.id),
+        (BetDetailHistory, BetDetailHistory.ownerId == user.id),
+        (User, User.id == user.id),
+        (Quota, Quota.agentId == agent.id),
+        (GameList, GameList.id == game.id),
+        (Agent, Agent.id == agent.id),
+    ):
+        session.execute(delete(model).where(where))
+    session.commit()
+    session.close()
+
+
+def call(view, context):
+    async def main():
+        try:
+            return await view(context, None)
+        finally:
+            await async_db.dispose()
+
+    return asyncio.run(main())
+
+
+def test_action_history_serializes_the_agent_quota(rows):
+    agent, user, _ = rows
+
+    response = call(get_action_history_, GetActionHistory(agentId=agent.id))
+
+    assert response.success
+    (history,) = response.response
+    assert history.agentActionHistory.id == agent.id
+    assert history.agentActionHistory.quota.balance == 50
+    assert history.userActionHistory.phone == user.phone
+
+
+def test_bet_history_serializes_the_game_and_owner(rows):
+    _, user, game = rows
+
+    response = call(get_bet_history_, GetBetHistory(ownerId=user.id))
+
+    assert response.success
+    (history,) = response.response
+    assert (history.game.id, history.owner.id) == (game.id, user.id)
+
+
+def test_agent_list_serializes_the_quota(rows):
+    agent, _, _ = rows
+    context = GetUserList(
+        params={"page": 1, "size": 1000}, context={"filter": {"active": True}}
+    )
+
+    response = call(list_agents, context)
+
+    assert response.success
+    (listed,) = [item for item in response.response.items if item.id == agent.id]
+    assert listed.quota.balance == 50
@@ -9,6 +9,7 @@ from py_linq import Enumerable
 from sqlalchemy import func, select
 from sqlalchemy.orm import joinedload
 
+from app.api.agent.models import Agent
 from app.api.credit.models import Deposit, Withdrawal
 from app.api.game.models import PlayerSession, GameList
 from app.api.history.models import BetDetailHistory, ActionHistory
@@ -53,7 +54,11 @@ async def get_bet_history_(context: GetBetHistory, request: Request):
         :type request: Request
         :return: GetBetHistoryResponse
     """
-    history = BetDetailHistory.read_all(**context.dict())
+    history = await BetDetailHistory.async_read_all(
+        joinedload(BetDetailHistory.game),
+        joinedload(BetDetailHistory.owner),
+        **context.dict(),
+    )
     return (
         GetBetHistoryResponse(success=True, response=history)
         if history
@@ -72,8 +77,11 @@ async def get_action_history_(context: GetActionHistory, request: Request):
     :type request: Request
     :return: GetActionHistoryResponse
     """
-    history = ActionHistory.read_all(
-        **context.dict(exclude_unset=True, exclude_none=True)
+    history = await ActionHistory.async_read_all(
+        joinedload(ActionHistory.userActionHistory),
+        joinedload(ActionHistory.agentActionHistory).joinedload(Agent.quota),
+        joinedload(ActionHistory.adminActionHistory),
+        **context.dict(exclude_unset=True, exclude_none=True),
     )
     return (
         GetActionHistoryResponse(success=True, response=history)
@@ -15,6 +15,7 @@ from sqlalchemy import (
     ForeignKey,
     Text,
     Integer,
+    Index,
 )
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship, backref, defer, joinedload, load_only
@@ -36,6 +37,7 @@ class User(ModelMixin):
     """
 
     __tablename__ = "User"
+    __table_args__ = (Index("ix_User_createdAt_id", "createdAt", "id"),)
 
     id = Column(Integer, primary_key=True, autoincrement=True, unique=True, index=True)
     phone = Column(String(255), nullable=False, unique=True)
@@ -51,6 +53,8 @@ class User(ModelMixin):
     updatedAt = Column(DateTime, default=lambda: datetime.now(pytz.utc))
     token = Column(String(255), nullable=True)
     accessToken = Column(Text, nullable=True)
+    # SHA-256 of accessToken, what sockets look users up by.
+    accessTokenHash = Column(String(64), nullable=True, index=True)
     online = Column(Boolean, default=False)
     agentId = Column(
         UUID(as_uuid=True),
@@ -94,13 +98,16 @@ class User(ModelMixin):
         return paginate(users, page, items)
 
     @classmethod
-    def get_all_users(cls, page_cursor: int, num_items: int) -> GetUserListItems:
+    def get_all_users(
+        cls, page_cursor: int, num_items: int, cursor: Optional[str] = None
+    ) -> GetUserListItems:
         """
         > This function returns a list of users, paginated by the `pages_cursor` and `num_items` parameters
 
         :param cls: The class of the model you want to paginate
         :param page_cursor: The page number to start from
         :param num_items: The number of items to return per page
+        :param cursor: The keyset cursor to page from instead of page_cursor
         :return: A dictionary of the paginated results.
         """
         query = cls.where().options(
@@ -109,7 +116,7 @@ class User(ModelMixin):
                 load_only("balance"),
             ),
         )
-        return paginate(query, page_cursor, num_items)
+        return paginate(query, page_cursor, num_items, cursor)
 
     @classmethod
     def remove_user(cls, *_, **kwargs) -> Optional[RemoveUser]:
@@ -0,0 +1,55 @@
+import contextlib
+import importlib
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app.endpoints.urls import APIPrefix
+from app.shared.bases.base_model import ModelMixin
+from settings import Config
+
+# The relationships of the models name models of other apps.
+for route in APIPrefix.include:
+    with contextlib.suppress(ImportError):
+        importlib.import_module(f"app.api.{route}.models")
+
+
+@pytest.fixture(scope="session")
+def engine():
+    if not Config.postgres_connection:
+        pytest.skip("POSTGRES_CONNECTION is not set")
+    engine = create_engine(f"postgresql+psycopg2://{Config.postgres_connection}")
+    try:
+        ModelMixin.metadata.create_all(engine)
+    except OperationalError as e:
+        pytest.skip(f"Postgres is not reachable: {e}")
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session(engine):
+    """
+    A session on the models that is rolled back after the test, commits
+    included: they end a savepoint inside a transaction that is never
+    committed.
+    """
+    connection = engine.connect()
+    transaction = connection.begin()
+    session = Session(bind=connection)
+    session.begin_nested()
+
+    @event.listens_for(session, "after_transaction_end")
+    def restart_savepoint(session, ended):
+        if ended.nested and not ended._parent.nested:
+            session.begin_nested()
+
+    previous = ModelMixin._session
+    ModelMixin.set_session(session)
+    yield session
+    ModelMixin._session = previous
+    session.close()
+    transaction.rollback()
+    connection.close()
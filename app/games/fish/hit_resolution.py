@@ -0,0 +1,288 @@
+"""
+@author: Kuro
+@github: slapglif
+"""
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Union
+from uuid import UUID
+
+import numpy as np
+from sqlalchemy import bindparam, func
+
+from app.api.credit.models import Balance
+from app.api.game.models import GameSession
+from app.api.user.models import User
+from app.games.fish.models import GameResult
+from app.shared.probability.rtp import RtpAggregate
+from settings import Config
+
+logger = logging.getLogger("hit_resolution")
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.DEBUG)
+
+
+def kill_bounds(difficulty: Union[float, np.ndarray]):
+    """
+    The kill_bounds function returns the [low, high) window a uniform draw has
+    to land in for a fish of the given difficulty to be killed.
+
+    :param difficulty: The difficulty of the reward, scalar or array
+    :return: A tuple of (low, high) bounds
+    """
+    difficulty_level = np.asarray(difficulty, dtype=np.float64) / 100
+    return (difficulty_level - 1) * 0.05, difficulty_level * 0.05
+
+
+@dataclass
+class HitEvent:
+    """
+    The HitEvent class is a single shot that hit a reward during a tick.
+    """
+
+    user_id: int
+    reward_id: int
+    bet: int
+    event_id: Optional[int] = None
+    player_session_id: Optional[UUID] = None
+
+
+@dataclass
+class TickResolution:
+    """
+    The TickResolution class holds the outcome of every hit of a tick and the
+    deltas that have to be applied for them.
+    """
+
+    events: List[HitEvent]
+    killed: np.ndarray
+    wins: np.ndarray
+    balance_deltas: Dict[int, int] = field(default_factory=dict)
+    rtp_deltas: Dict[int, int] = field(default_factory=dict)
+    pool_delta: int = 0
+    total_bet: int = 0
+    game_session_id: Optional[UUID] = None
+
+    @property
+    def total_win(self) -> int:
+        return int(self.wins.sum())
+
+    @property
+    def results(self) -> List[dict]:
+        return [
+            {"user_id": event.user_id, "reward_id": event.reward_id, "win": int(win)}
+            for event, win in zip(self.events, self.wins)
+        ]
+
+
+class HitResolver:
+    """
+    The HitResolver class collects the hits of a table during a tick and
+    resolves them together: one vectorized uniform draw per batch against
+    kill windows and payouts precomputed per reward, instead of re-reading the
+    BetEvent and looping the reward pool for every shot as bet_close does.
+    When an RtpAggregate is given, kills are also gated by its check_win rule
+    and the aggregate owns the players' rtp and the session totals, so no rtp
+    or pool deltas are written and the wins are recorded in it once applied.
+    """
+
+    def __init__(
+        self,
+        rewards: Iterable,
+        rng: Optional[np.random.Generator] = None,
+        rtp_pool_max: float = Config.rtp_pool_max,
+        aggregate: Optional[RtpAggregate] = None,
+        game_session_id: Optional[UUID] = None,
+    ):
+        self.rng = rng or np.random.default_rng()
+        self.rtp_pool_max = float(rtp_pool_max)
+        self.aggregate = aggregate
+        self.game_session_id = game_session_id or getattr(
+            aggregate, "game_session_id", None
+        )
+        self.pending: List[HitEvent] = []
+        self.load(rewards)
+
+    def load(self, rewards: Iterable) -> None:
+        """
+        The load function precomputes the lookup arrays of the reward pool.
+        Rewards need an id and a reward, the difficulty falls back to hit_times.
+
+        :param rewards: The rewards of the table
+        """
+        rewards = list(rewards)
+        self.index = {reward.id: i for i, reward in enumerate(rewards)}
+        self.payout = np.array([reward.reward for reward in rewards], dtype=np.int64)
+        difficulty = np.array(
+            [getattr(reward, "difficulty", reward.hit_times) for reward in rewards],
+            dtype=np.float64,
+        )
+        self.kill_low, self.kill_high = kill_bounds(difficulty)
+
+    def submit(self, event: HitEvent) -> None:
+        self.pending.append(event)
+
+    def resolve(self) -> Optional[TickResolution]:
+        """
+        The resolve function settles every pending hit of the tick at once.
+        Hits on rewards that are not in the pool never kill.
+
+        :return: The TickResolution, or None when nothing was hit
+        """
+        events, self.pending = self.pending, []
+        if not events:
+            return None
+
+        count = len(events)
+        rows = np.fromiter(
+            (self.index.get(event.reward_id, -1) for event in events), np.int64, count
+        )
+        users = np.fromiter((event.user_id for event in events), np.int64, count)
+        bets = np.fromiter((event.bet for event in events), np.int64, count)
+
+        known = rows >= 0
+        safe_rows = np.where(known, rows, 0)
+        seeds = self.rng.random(count)
+        killed = (
+            known
+            & (self.kill_low[safe_rows] <= seeds)
+            & (seeds < self.kill_high[safe_rows])
+        )
+        wins = np.where(killed, self.payout[safe_rows], 0)
+
+        if self.aggregate is not None:
+            approved: Dict[int, int] = {}
+            for i in np.flatnonzero(killed):
+                user_id, win = int(users[i]), int(wins[i])
+                if self.aggregate.can_pay(user_id, win, approved.get(user_id, 0)):
+                    approved[user_id] = approved.get(user_id, 0) + win
+                else:
+                    killed[i] = False
+            wins = np.where(killed, wins, 0)
+
+        winners, inverse = np.unique(users, return_inverse=True)
+        user_wins = np.bincount(inverse, weights=wins).astype(np.int64)
+        balance_deltas = {
+            int(user): int(win) for user, win in zip(winners, user_wins) if win
+        }
+        rtp_deltas = (
+            {}
+            if self.aggregate is not None
+            else {
+                user: -int(win * self.rtp_pool_max)
+                for user, win in balance_deltas.items()
+            }
+        )
+        return TickResolution(
+            events=events,
+            killed=killed,
+            wins=wins,
+            balance_deltas=balance_deltas,
+            rtp_deltas=rtp_deltas,
+            pool_delta=int(bets.sum() - wins.sum()),
+            total_bet=int(bets.sum()),
+            game_session_id=(
+                None if self.aggregate is not None else self.game_session_id
+            ),
+        )
+
+    @staticmethod
+    def apply(resolution: TickResolution, session=None, ledger=None) -> None:
+        """
+        The apply function writes the balance, rtp, pool and game result changes
+        of a tick in one transaction, with one executemany per table. The pool
+        delta goes to the totals of the game session, when the resolution has
+        one. With a BetLedger the payouts and game results are buffered in it
+        instead and only the rtp and pool changes are written here.
+
+        :param resolution: The TickResolution to apply
+        :param session: The database session, defaults to the models' session
+        :param ledger: The BetLedger to write the payouts through, if any
+        """
+        session = session or Balance.session
+        if not resolution:
+            return
+        pool = resolution.game_session_id is not None and (
+            resolution.total_bet or resolution.total_win
+        )
+        if not (resolution.balance_deltas or pool):
+            return
+        wins = [
+            (event, int(win))
+            for event, win in zip(resolution.events, resolution.wins)
+            if win
+        ]
+        if ledger is not None:
+            for event, win in wins:
+                ledger.append_result(
+                    event.player_session_id, event.event_id, win, event.user_id
+                )
+            if not (resolution.rtp_deltas or pool):
+                return
+        try:
+            if ledger is None and wins:
+                session.execute(
+                    Balance.__table__.update()
+                    .where(Balance.ownerId == bindparam("owner_id"))
+                    .values(amount=Balance.amount + bindparam("delta")),
+                    [
+                        {"owner_id": user_id, "delta": delta}
+                        for user_id, delta in resolution.balance_deltas.items()
+                    ],
+                )
+                session.execute(
+                    GameResult.__table__.insert(),
+                    [
+                        {
+                            "player_session_id": event.player_session_id,
+                            "event_id": event.event_id,
+                            "win": win,
+                        }
+                        for event, win in wins
+                    ],
+                )
+            if resolution.rtp_deltas:
+                session.execute(
+                    User.__table__.update()
+                    .where(User.id == bindparam("user_id"))
+                    .values(rtp=User.rtp + bindparam("delta")),
+                    [
+                        {"user_id": user_id, "delta": delta}
+                        for user_id, delta in resolution.rtp_deltas.items()
+                    ],
+                )
+            if pool:
+                session.execute(
+                    GameSession.__table__.update()
+                    .where(GameSession.id == resolution.game_session_id)
+                    .values(
+                        totalBet=func.coalesce(GameSession.totalBet, 0)
+                        + resolution.total_bet,
+                        totalWin=func.coalesce(GameSession.totalWin, 0)
+                        + resolution.total_win,
+                    )
+                )
+            session.commit()
+        except Exception as e:
+            logger.error(e)
+            session.rollback()
+            raise
+
+    def flush(self, session=None, ledger=None) -> Optional[TickResolution]:
+        """
+        The flush function resolves the pending hits and applies the result.
+        The wins are only recorded in the RtpAggregate once the apply went
+        through, so a failed write leaves its totals untouched.
+
+        :param session: The database session, defaults to the models' session
+        :param ledger: The BetLedger to write the payouts through, if any
+        :return: The TickResolution, or None when nothing was hit
+        """
+        resolution = self.resolve()
+        if resolution:
+            self.apply(resolution, session, ledger)
+            if self.aggregate is not None:
+                for event, win in zip(resolution.events, resolution.wins):
+                    if win:
+                        self.aggregate.record_win(event.user_id, int(win))
+        return resolution
@@ -0,0 +1,185 @@
+"""
+@author: Kuro
+@github: slapglif
+"""
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import numpy as np
+
+from settings import Config
+
+logger = logging.getLogger("hit_schedule")
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.DEBUG)
+
+SCHEDULE_LENGTH = 9999
+SCHEDULE_VERSION = 1
+
+
+@dataclass
+class HitSchedule:
+    """
+    The HitSchedule class holds the pre-rolled hit tables for every
+    (fish type x bet index) pair, replacing the nested loops of the legacy
+    FishServer.init_bet_arr. Each row of pro_count is a 0/1 schedule of
+    length SCHEDULE_LENGTH where a 1 means the shot at that position kills.
+    """
+
+    pro: np.ndarray
+    pro_count: np.ndarray
+    pro_max: np.ndarray
+    hit_times: np.ndarray
+    control_bet: float
+    seed: Optional[int] = None
+    rng: np.random.Generator = field(default=None, repr=False)
+
+    def __post_init__(self):
+        if self.rng is None:
+            self.rng = np.random.default_rng(self.seed)
+
+    @classmethod
+    def generate(
+        cls,
+        pro: List[int],
+        bet_count: List[float],
+        control_bet: float,
+        seed: Optional[int] = None,
+    ) -> "HitSchedule":
+        """
+        The generate function builds the schedules of every bet index of a
+        fish type in one vectorized pass. The legacy code dropped
+        pro_max_count hits with random gaps and then ran 10 x 5000 random
+        swaps over the first pro_max slots, which is a (slow, approximate)
+        uniform shuffle of that prefix; here the prefix is permuted directly.
+
+        :param pro: The coin multiplier of every fish type, the odds of a hit are 1 / pro
+        :param bet_count: The bet denominations, one schedule is built per entry
+        :param control_bet: The ratio applied to the number of hits per 10000 shots
+        :param seed: The seed of the np.random.Generator, None draws one from the OS
+        :return: A HitSchedule with pro_count shaped (fish types, bets, SCHEDULE_LENGTH)
+        """
+        rng = np.random.default_rng(seed)
+        pro = np.asarray(pro, dtype=np.int32)
+        n_pro, n_bet = len(pro), len(bet_count)
+
+        max_count = (10000 // np.maximum(pro, 1)).astype(np.int64)
+        pro_max_count = np.minimum(
+            (max_count * control_bet).astype(np.int64), SCHEDULE_LENGTH
+        )
+        pro_max = np.minimum(pro_max_count * pro, SCHEDULE_LENGTH)
+
+        pro_count = np.zeros((n_pro, n_bet, SCHEDULE_LENGTH), dtype=np.int8)
+        for i in range(n_pro):
+            prefix, hits = int(pro_max[i]), int(pro_max_count[i])
+            if not prefix or not hits:
+                continue
+            pro_count[i, :, :hits] = 1
+            pro_count[i, :, :prefix] = rng.permuted(pro_count[i, :, :prefix], axis=1)
+
+        logger.info(f"hit schedule generated for {n_pro} fish types x {n_bet} bets")
+        return cls(
+            pro=pro,
+            pro_count=pro_count,
+            pro_max=pro_max.astype(np.int32),
+            hit_times=np.zeros((n_pro, n_bet), dtype=np.int32),
+            control_bet=control_bet,
+            seed=seed,
+            rng=rng,
+        )
+
+    def reshuffle(self, fish_type: int, bet_idx: int) -> None:
+        """
+        The reshuffle function re-rolls a single schedule once its hits are
+        used up and resets its cursor, as get_score did with its random swaps.
+
+        :param fish_type: The index of the fish type
+        :param bet_idx: The index of the bet denomination
+        """
+        prefix = int(self.pro_max[fish_type])
+        row = self.pro_count[fish_type, bet_idx, :prefix]
+        row[:] = self.rng.permuted(row)
+        self.hit_times[fish_type, bet_idx] = 0
+
+    def save(self, path: str) -> str:
+        """
+        The save function writes the schedule to an uncompressed npz file so a
+        restarted node can load it back without generating it again.
+
+        :param path: The file path of the schedule
+        :return: The path the schedule was written to
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "wb") as schedule_file:
+            np.savez(
+                schedule_file,
+                version=SCHEDULE_VERSION,
+                pro=self.pro,
+                pro_count=self.pro_count,
+                pro_max=self.pro_max,
+                control_bet=self.control_bet,
+                seed=-1 if self.seed is None else self.seed,
+            )
+        logger.info(f"hit schedule saved to {path}")
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> "HitSchedule":
+        """
+        The load function reads back a schedule written by save.
+
+        :param path: The file path of the schedule
+        :return: The loaded HitSchedule
+        """
+        with np.load(path) as data:
+            if int(data["version"]) != SCHEDULE_VERSION:
+                raise ValueError(f"unsupported hit schedule version in {path}")
+            pro_count = data["pro_count"]
+            seed = int(data["seed"])
+            return cls(
+                pro=data["pro"],
+                pro_count=pro_count,
+                pro_max=data["pro_max"],
+                hit_times=np.zeros(pro_count.shape[:2], dtype=np.int32),
+                control_bet=float(data["control_bet"]),
+                seed=None if seed < 0 else seed,
+            )
+
+    @classmethod
+    def load_or_generate(
+        cls,
+        pro: List[int],
+        bet_count: List[float],
+        control_bet: float,
+        path: str = Config.hit_schedule_path,
+        seed: Optional[int] = Config.hit_schedule_seed,
+    ) -> "HitSchedule":
+        """
+        The load_or_generate function loads the schedule saved at path when it
+        was built for the same fish config, and generates and saves a new one
+        otherwise.
+
+        :param pro: The coin multiplier of every fish type
+        :param bet_count: The bet denominations
+        :param control_bet: The ratio applied to the number of hits per 10000 shots
+        :param path: The file path of the schedule
+        :param seed: The seed used when a new schedule has to be generated
+        :return: A HitSchedule matching the given config
+        """
+        if os.path.exists(path):
+            try:
+                schedule = cls.load(path)
+                if (
+                    np.array_equal(schedule.pro, pro)
+                    and schedule.pro_count.shape[1] == len(bet_count)
+                    and schedule.control_bet == control_bet
+                ):
+                    return schedule
+                logger.info(f"hit schedule at {path} is stale, regenerating")
+            except (OSError, KeyError, ValueError) as e:
+                logger.error(e)
+        schedule = cls.generate(pro, bet_count, control_bet, seed=seed)
+        schedule.save(path)
+        return schedule
@@ -0,0 +1,459 @@
+"""
+@author: Kuro
+@github: slapglif
+"""
+import asyncio
+import contextlib
+import csv
+import io
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+from enum import Enum
+from typing import Deque, Dict, List, Optional
+from uuid import UUID
+
+import pytz
+from sqlalchemy import bindparam, select, text
+from sqlalchemy.orm import Session
+
+from app.api.credit.models import Balance
+from app.games.fish.models import BetEvent, GameResult
+from settings import Config
+
+logger = logging.getLogger("ledger")
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.DEBUG)
+
+
+class LedgerMode(str, Enum):
+    """
+    The LedgerMode enum sets when buffered events reach the database.
+    sync flushes on every append and raises when the write fails, batched
+    starts a flush in the default executor once flush_events or flush_ms is
+    reached, async only flushes from the background task.
+    """
+
+    sync = "sync"
+    batched = "batched"
+    async_ = "async"
+
+
+class BetLedger:
+    """
+    The BetLedger class is a write-behind buffer for BetEvent rows, GameResult
+    rows and balance changes. Events are appended to in-memory rings and
+    written in bulk with COPY (or a multi-row INSERT when COPY is not
+    available), and balance changes are summed per player and applied with a
+    single executemany. BetEvent ids are reserved from the table's sequence in
+    blocks so callers get an id right away.
+
+    Writes go through a session of the ledger's own, never the models'
+    session, as they may run in an executor thread. The lock only guards the
+    buffers: a flush swaps them out and does its I/O without it, and the
+    balance changes it is writing count as pending until it commits. The
+    generation is odd while a flush commits, so balance can tell whether the
+    amount it read already holds the changes being flushed.
+    """
+
+    def __init__(
+        self,
+        mode: LedgerMode = LedgerMode(Config.ledger_mode),
+        flush_events: int = Config.ledger_flush_events,
+        flush_ms: int = Config.ledger_flush_ms,
+        capacity: int = Config.ledger_capacity,
+        id_block: int = Config.ledger_id_block,
+        use_copy: bool = Config.ledger_use_copy,
+        session=None,
+    ):
+        self.mode = LedgerMode(mode)
+        self.flush_events = flush_events
+        self.flush_ms = flush_ms
+        self.capacity = capacity
+        self.id_block = id_block
+        self.use_copy = use_copy
+        self._session = session
+        self.bets: Deque[dict] = deque()
+        self.results: Deque[dict] = deque()
+        self.balance_deltas: Dict[int, int] = defaultdict(int)
+        self.flushing_deltas: Dict[int, int] = {}
+        self.ids: Deque[int] = deque()
+        self.pending_ids: set = set()
+        self.lock = threading.Lock()
+        self.flushing = threading.Lock()
+        self.committed = threading.Condition(self.lock)
+        self.generation = 0
+        self.flushed_at = time.monotonic()
+        self.task: Optional[asyncio.Task] = None
+        self.refill: Optional[asyncio.Future] = None
+        self.pending_flush: Optional[asyncio.Future] = None
+
+    def session(self):
+        """
+        The session function opens the session of one flush or id reservation,
+        closed on exit. A session given to the ledger is used as is.
+        """
+        if self._session is not None:
+            return contextlib.nullcontext(self._session)
+        return contextlib.closing(Session(bind=BetEvent.session.get_bind()))
+
+    def __len__(self):
+        return len(self.bets) + len(self.results)
+
+    def reserve(self) -> None:
+        """
+        The reserve function reserves a block of BetEvent ids from the
+        sequence with one query.
+        """
+        with self.session() as session:
+            rows = session.execute(
+                text(
+                    "SELECT nextval(pg_get_serial_sequence('\"BetEvent\"', 'id')) "
+                    "FROM generate_series(1, :block)"
+                ),
+                {"block": self.id_block},
+            )
+            ids = [row[0] for row in rows]
+        with self.lock:
+            self.ids.extend(ids)
+
+    def prefetch(self) -> None:
+        """
+        The prefetch function reserves the next block of ids in the default
+        executor while the current one still lasts. Outside an event loop it
+        is a no-op and the block is reserved when the ids run out.
+        """
+        if self.refill is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self.refill = loop.run_in_executor(None, self.reserve)
+        self.refill.add_done_callback(self._refilled)
+
+    def _refilled(self, refill: asyncio.Future) -> None:
+        self.refill = None
+        if refill.exception():
+            logger.error(refill.exception())
+
+    def next_event_id(self) -> int:
+        """
+        The next_event_id function hands out a BetEvent id. The next block is
+        reserved in the background once half of the current one is used, the
+        query only runs inline when the ids ran out before it came back.
+
+        :return: A BetEvent id that is safe to reference before the flush
+        """
+        while True:
+            with self.lock:
+                if self.ids:
+                    event_id = self.ids.popleft()
+                    low = len(self.ids) < self.id_block // 2
+                    break
+            self.reserve()
+        if low:
+            self.prefetch()
+        return event_id
+
+    def pending_balance(self, user_id: int) -> int:
+        """
+        The pending_balance function returns the balance change of a player
+        that is buffered or being flushed, but not yet committed.
+
+        :param user_id: The id of the player
+        :return: The buffered balance delta
+        """
+        with self.lock:
+            return self.balance_deltas.get(user_id, 0) + self.flushing_deltas.get(
+                user_id, 0
+            )
+
+    def balance(self, user_id: int) -> int:
+        """
+        The balance function returns the balance of a player with what the
+        ledger holds for them: the committed amount and the pending changes
+        are read as of one flush generation, so a change is never counted
+        twice or missed while a flush commits it.
+
+        :param user_id: The id of the player
+        :return: The balance
+        """
+        while True:
+            with self.committed:
+                self.committed.wait_for(lambda: self.generation % 2 == 0)
+                generation = self.generation
+                pending = self.balance_deltas.get(
+                    user_id, 0
+                ) + self.flushing_deltas.get(user_id, 0)
+            with self.session() as session:
+                amount = session.execute(
+                    select(Balance.amount).where(Balance.ownerId == user_id)
+                ).scalar()
+            with self.lock:
+                if self.generation == generation:
+                    return (amount or 0) + pending
+
+    def is_pending(self, event_id: int) -> bool:
+        with self.lock:
+            return event_id in self.pending_ids
+
+    def append_bet(self, user_id: int, bet: int, player_session_id: UUID) -> int:
+        """
+        The append_bet function buffers a shot: a BetEvent row and the debit
+        of the bet from the player's balance.
+
+        :param user_id: The id of the player
+        :param bet: The bet amount
+        :param player_session_id: The id of the player session
+        :return: The id of the BetEvent
+        """
+        event_id = self.next_event_id()
+        with self.lock:
+            self.bets.append(
+                {
+                    "id": event_id,
+                    "bet": bet,
+                    "player_session_id": player_session_id,
+                    "createdAt": datetime.now(pytz.utc),
+                }
+            )
+            self.pending_ids.add(event_id)
+            self.balance_deltas[user_id] -= bet
+        self._after_append()
+        return event_id
+
+    def append_result(
+        self,
+        player_session_id: UUID,
+        event_id: int,
+        win: int,
+        user_id: Optional[int] = None,
+    ) -> None:
+        """
+        The append_result function buffers a GameResult row, and the credit of
+        the win when a user_id is given.
+
+        :param player_session_id: The id of the player session
+        :param event_id: The id of the BetEvent that won
+        :param win: The payout
+        :param user_id: The id of the player to credit, None leaves the balance
+        """
+        with self.lock:
+            self.results.append(
+                {
+                    "player_session_id": player_session_id,
+                    "event_id": event_id,
+                    "win": win,
+                }
+            )
+            if user_id is not None:
+                self.balance_deltas[user_id] += win
+        self._after_append()
+
+    def append_balance(self, user_id: int, delta: int) -> None:
+        with self.lock:
+            self.balance_deltas[user_id] += delta
+        self._after_append()
+
+    def due(self) -> bool:
+        return len(self) >= self.flush_events or (
+            (len(self) or self.balance_deltas)
+            and (time.monotonic() - self.flushed_at) * 1000 >= self.flush_ms
+        )
+
+    def _after_append(self) -> None:
+        if self.task is None:
+            self.start()
+        if self.mode == LedgerMode.sync:
+            self.flush()
+        elif (self.mode == LedgerMode.batched and self.due()) or len(
+            self
+        ) >= self.capacity:
+            self.flush_soon()
+
+    def flush_soon(self) -> None:
+        """
+        The flush_soon function starts a flush in the default executor, so the
+        socket handler that appended does not wait on the write. At most one
+        is queued at a time. Outside an event loop it flushes inline.
+        """
+        if self.pending_flush is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        self.pending_flush = loop.run_in_executor(None, self.flush)
+        self.pending_flush.add_done_callback(self._flushed)
+
+    def _flushed(self, flush: asyncio.Future) -> None:
+        self.pending_flush = None
+        if not flush.cancelled() and flush.exception():
+            logger.error(flush.exception())
+
+    @staticmethod
+    def _copy(session, table, columns: List[str], rows: List[dict]) -> None:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(
+                [
+                    (
+                        ""
+                        if row.get(column) is None
+                        else (
+                            row[column].isoformat()
+                            if isinstance(row[column], datetime)
+                            else row[column]
+                        )
+                    )
+                    for column in columns
+                ]
+            )
+        buffer.seek(0)
+        column_list = ", ".join(f'"{column}"' for column in columns)
+        cursor = session.connection().connection.cursor()
+        cursor.copy_expert(
+            f'COPY "{table.name}" ({column_list}) FROM STDIN WITH (FORMAT csv)', buffer
+        )
+
+    def _write(self, session, table, columns: List[str], rows: List[dict]) -> None:
+        if not rows:
+            return
+        if self.use_copy:
+            self._copy(session, table, columns, rows)
+        else:
+            session.execute(table.insert(), rows)
+
+    def _commit(self, session, bets: List[dict]) -> None:
+        """
+        The _commit function commits a flush. The generation is odd while the
+        commit runs, and the deltas stop counting as pending in the same step
+        that makes it even again.
+        """
+        with self.lock:
+            self.generation += 1
+        try:
+            session.commit()
+        except Exception:
+            with self.committed:
+                self.generation += 1
+                self.committed.notify_all()
+            raise
+        with self.committed:
+            self.flushing_deltas = {}
+            self.pending_ids.difference_update(bet["id"] for bet in bets)
+            self.generation += 1
+            self.committed.notify_all()
+
+    def flush(self, wait: bool = True) -> int:
+        """
+        The flush function writes everything buffered in one transaction. On
+        failure the events are put back so the next flush retries them, but
+        in sync mode they are dropped and the error is raised to the caller
+        of the append. One flush runs at a time.
+
+        :param wait: Wait for a flush already running, else return right away
+        :return: The number of rows written
+        """
+        if not self.flushing.acquire(blocking=wait):
+            return 0
+        try:
+            with self.lock:
+                bets, self.bets = list(self.bets), deque()
+                results, self.results = list(self.results), deque()
+                balance_deltas = {
+                    user_id: delta
+                    for user_id, delta in self.balance_deltas.items()
+                    if delta
+                }
+                self.balance_deltas = defaultdict(int)
+                self.flushing_deltas = balance_deltas
+                self.flushed_at = time.monotonic()
+            if not (bets or results or balance_deltas):
+                return 0
+            try:
+                with self.session() as session:
+                    try:
+                        self._write(
+                            session,
+                            BetEvent.__table__,
+                            ["id", "bet", "player_session_id", "createdAt"],
+                            bets,
+                        )
+                        self._write(
+                            session,
+                            GameResult.__table__,
+                            ["player_session_id", "event_id", "win"],
+                            results,
+                        )
+                        if balance_deltas:
+                            session.execute(
+                                Balance.__table__.update()
+                                .where(Balance.ownerId == bindparam("owner_id"))
+                                .values(amount=Balance.amount + bindparam("delta")),
+                                [
+                                    {"owner_id": user_id, "delta": delta}
+                                    for user_id, delta in balance_deltas.items()
+                                ],
+                            )
+                        self._commit(session, bets)
+                    except Exception:
+                        session.rollback()
+                        raise
+            except Exception as e:
+                logger.error(e)
+                with self.lock:
+                    self.flushing_deltas = {}
+                    if self.mode == LedgerMode.sync:
+                        self.pending_ids.difference_update(bet["id"] for bet in bets)
+                    else:
+                        self.bets.extendleft(reversed(bets))
+                        self.results.extendleft(reversed(results))
+                        for user_id, delta in balance_deltas.items():
+                            self.balance_deltas[user_id] += delta
+                if self.mode == LedgerMode.sync:
+                    raise
+                return 0
+            return len(bets) + len(results)
+        finally:
+            self.flushing.release()
+
+    async def run(self) -> None:
+        """
+        The run function is the background flusher of the batched and async
+        modes, writes happen in the default executor off the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.flush_ms / 1000)
+            if self.due():
+                await loop.run_in_executor(None, self.flush)
+
+    def start(self) -> None:
+        """
+        The start function runs the background flusher on the current event
+        loop. It is called on the first append, outside a loop it is a no-op and
+        flushes run inline.
+        """
+        if self.mode == LedgerMode.sync or self.task is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self.task = loop.create_task(self.run())
+        self.prefetch()
+
+    async def stop(self) -> None:
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        await asyncio.get_running_loop().run_in_executor(None, self.flush)
+
+
+bet_ledger = BetLedger()
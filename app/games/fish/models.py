@@ -84,7 +84,7 @@ class Reward(ModelMixin):
     type_id = Column(Integer, ForeignKey("RewardTypes.id"))
     type = relationship(
         "RewardTypes",
-        foreign_keys="RewardTypes.type_id",
+        foreign_keys="Reward.type_id",
         backref=backref("type", single_parent=True, uselist=False)
     )
     createdAt = Column(DateTime, default=lambda: datetime.now(pytz.utc))
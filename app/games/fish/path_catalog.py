@@ -0,0 +1,232 @@
+"""
+@author: Kuro
+@github: slapglif
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Hashable, List, Optional
+
+import numpy as np
+from sqlalchemy import event, text
+
+from app.api.game.models import Paths
+from settings import Config
+
+logger = logging.getLogger("path_catalog")
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.DEBUG)
+
+
+@dataclass(frozen=True)
+class PathRecord:
+    """
+    The PathRecord class is a detached copy of a row of the paths table, so
+    the catalog never holds ORM objects that expire with their session.
+    """
+
+    id: int
+    duration: Optional[datetime]
+    starting: Optional[float]
+    middle: Optional[float]
+    destination: Optional[float]
+
+
+class PathAllocator:
+    """
+    The PathAllocator class hands out the paths of one table. Free paths are
+    kept in a dense free list with a position index per path, so taking a
+    random free path and releasing one are both O(1) swaps instead of scanning
+    the session's paths with Enumerable.
+    """
+
+    __slots__ = ("catalog", "version", "ids", "free", "position", "size", "rng")
+
+    def __init__(
+        self, catalog: "PathCatalog", rng: Optional[np.random.Generator] = None
+    ):
+        self.catalog = catalog
+        self.rng = rng or np.random.default_rng()
+        self.reset()
+
+    def reset(self, taken_ids=()) -> None:
+        """
+        The reset function rebuilds the free list against the current catalog,
+        keeping the paths in taken_ids taken if they still exist.
+
+        :param taken_ids: The ids of the paths that stay taken
+        """
+        count = len(self.catalog)
+        self.version = self.catalog.version
+        self.ids = self.catalog.ids
+        self.free = np.arange(count, dtype=np.int32)
+        self.position = np.arange(count, dtype=np.int32)
+        self.size = count
+        for path_id in taken_ids:
+            if (index := self.catalog.index.get(path_id)) is not None:
+                self._remove(index)
+
+    @property
+    def taken_ids(self) -> List[int]:
+        return self.ids[self.free[self.size :]].tolist()
+
+    def _remove(self, index: int) -> None:
+        slot = self.position[index]
+        if slot >= self.size:
+            return
+        last = self.free[self.size - 1]
+        self.free[slot], self.position[last] = last, slot
+        self.free[self.size - 1], self.position[index] = index, self.size - 1
+        self.size -= 1
+
+    def _sync(self) -> None:
+        # A reload reorders the catalog, taken paths are carried over by id.
+        if self.version != self.catalog.version:
+            self.reset(self.taken_ids)
+
+    def take(self) -> Optional[PathRecord]:
+        """
+        The take function allocates a random free path.
+
+        :return: The PathRecord, or None when every path is taken
+        """
+        self.catalog.maybe_reload()
+        self._sync()
+        if not self.size:
+            return None
+        index = int(self.free[int(self.rng.integers(self.size))])
+        self._remove(index)
+        return self.catalog.paths[index]
+
+    def release(self, path_id: int) -> None:
+        """
+        The release function puts a path back in the free list.
+
+        :param path_id: The id of the path
+        """
+        self._sync()
+        index = self.catalog.index.get(path_id)
+        if index is None or self.position[index] < self.size:
+            return
+        slot = self.position[index]
+        first = self.free[self.size]
+        self.free[slot], self.position[first] = first, slot
+        self.free[self.size], self.position[index] = index, self.size
+        self.size += 1
+
+    def __len__(self):
+        return self.size
+
+
+class PathCatalog:
+    """
+    The PathCatalog class loads the paths table once into arrays and hands out
+    a PathAllocator per table. Writes to Paths through the ORM mark it stale
+    right away, and a fingerprint of the table is polled at most every
+    path_catalog_poll_seconds to pick up changes made by other processes.
+    """
+
+    def __init__(self, poll_seconds: float = Config.path_catalog_poll_seconds):
+        self.poll_seconds = poll_seconds
+        self.lock = threading.RLock()
+        self.version = 0
+        self.fingerprint = None
+        self.checked_at = 0.0
+        self.stale = True
+        self.paths: List[PathRecord] = []
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.index: Dict[int, int] = {}
+        self.allocators: Dict[Hashable, PathAllocator] = {}
+
+    def __len__(self):
+        return len(self.paths)
+
+    @staticmethod
+    def read_fingerprint(session=None):
+        session = session or Paths.session
+        return tuple(
+            session.execute(
+                text(
+                    "SELECT count(*), coalesce(max(id), 0), "
+                    "md5(coalesce(string_agg(paths::text, ',' ORDER BY id), '')) "
+                    "FROM paths"
+                )
+            ).first()
+        )
+
+    def load(self, rows=None, fingerprint=None) -> None:
+        """
+        The load function replaces the catalog with the given rows, or with the
+        rows of the paths table.
+
+        :param rows: The Paths rows, read from the database when omitted
+        :param fingerprint: The fingerprint of the table the rows came from
+        """
+        if rows is None:
+            fingerprint = fingerprint or self.read_fingerprint()
+            rows = Paths.all()
+        with self.lock:
+            self.paths = [
+                PathRecord(
+                    id=row.id,
+                    duration=row.duration,
+                    starting=row.starting,
+                    middle=row.middle,
+                    destination=row.destination,
+                )
+                for row in sorted(rows, key=lambda row: row.id)
+            ]
+            self.ids = np.array([path.id for path in self.paths], dtype=np.int64)
+            self.index = {path.id: i for i, path in enumerate(self.paths)}
+            self.fingerprint = fingerprint
+            self.checked_at = time.monotonic()
+            self.stale = False
+            self.version += 1
+        logger.info(f"path catalog loaded {len(self.paths)} paths")
+
+    def maybe_reload(self) -> bool:
+        """
+        The maybe_reload function reloads the catalog when it was marked stale
+        or the table's fingerprint changed since the last load.
+
+        :return: True when the catalog was reloaded
+        """
+        if not self.stale:
+            if time.monotonic() - self.checked_at < self.poll_seconds:
+                return False
+            self.checked_at = time.monotonic()
+            fingerprint = self.read_fingerprint()
+            if fingerprint == self.fingerprint:
+                return False
+            self.load(fingerprint=fingerprint)
+            return True
+        self.load()
+        return True
+
+    def mark_stale(self, *_) -> None:
+        self.stale = True
+
+    def allocator(self, table: Hashable, rng=None) -> PathAllocator:
+        """
+        The allocator function returns the PathAllocator of a table, creating
+        it on first use.
+
+        :param table: The key of the table, e.g. its room name
+        :param rng: The table's random stream, used when the allocator is created
+        :return: The table's PathAllocator
+        """
+        if (allocator := self.allocators.get(table)) is None:
+            self.maybe_reload()
+            allocator = self.allocators[table] = PathAllocator(self, rng)
+        return allocator
+
+    def drop(self, table: Hashable) -> None:
+        self.allocators.pop(table, None)
+
+
+path_catalog = PathCatalog()
+
+for _event in ("after_insert", "after_update", "after_delete"):
+    event.listen(Paths, _event, path_catalog.mark_stale)
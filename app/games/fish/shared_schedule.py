@@ -0,0 +1,256 @@
+"""
+@author: Kuro
+@github: slapglif
+"""
+import logging
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Optional
+
+import numpy as np
+
+from app.games.fish.hit_schedule import HitSchedule, SCHEDULE_LENGTH
+from settings import Config
+
+logger = logging.getLogger("shared_schedule")
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.DEBUG)
+
+HEADER_FIELDS = 5
+SHARED_VERSION = 2
+# Written last by the publisher: a block is only read once it holds it.
+READY = 0x48495453
+
+_published = set()
+
+
+class SharedHitSchedule:
+    """
+    The SharedHitSchedule class keeps one bit-packed copy of a HitSchedule in
+    multiprocessing.shared_memory so every socket worker on a host reads the
+    same pages instead of holding its own nested lists. The block is laid out
+    as an int32 header (ready, version, fish types, bets, row bytes), the pro
+    and pro_max int32 arrays and then the packed schedule bits. It is created
+    once: the worker whose create succeeds writes it and sets ready last, the
+    others attach and wait for ready, and only the creator unlinks it. It is
+    read-only once published; per-table state lives in a HitCursor.
+    """
+
+    def __init__(self, shm: SharedMemory, owner: bool = False):
+        self.shm = shm
+        self.owner = owner
+        header = np.ndarray((HEADER_FIELDS,), dtype=np.int32, buffer=shm.buf)
+        _, version, n_pro, n_bet, row_bytes = (int(x) for x in header)
+        if version != SHARED_VERSION:
+            raise ValueError(f"unsupported shared hit schedule version {version}")
+        offset = header.nbytes
+        self.pro = np.ndarray((n_pro,), dtype=np.int32, buffer=shm.buf, offset=offset)
+        offset += self.pro.nbytes
+        self.pro_max = np.ndarray(
+            (n_pro,), dtype=np.int32, buffer=shm.buf, offset=offset
+        )
+        offset += self.pro_max.nbytes
+        self.bits = np.ndarray(
+            (n_pro, n_bet, row_bytes), dtype=np.uint8, buffer=shm.buf, offset=offset
+        )
+        if not owner:
+            for array in (self.pro, self.pro_max, self.bits):
+                array.flags.writeable = False
+
+    @property
+    def shape(self):
+        return self.bits.shape[:2]
+
+    @staticmethod
+    def nbytes(n_pro: int, n_bet: int) -> int:
+        row_bytes = (SCHEDULE_LENGTH + 7) // 8
+        return 4 * (HEADER_FIELDS + 2 * n_pro) + n_pro * n_bet * row_bytes
+
+    @staticmethod
+    def _write(shm: SharedMemory, schedule: HitSchedule) -> None:
+        bits = np.packbits(schedule.pro_count.astype(bool), axis=-1)
+        n_pro, n_bet = schedule.pro_count.shape[:2]
+        header = np.array([0, SHARED_VERSION, n_pro, n_bet, bits.shape[-1]], np.int32)
+        layout = np.concatenate(
+            [
+                header.view(np.uint8),
+                schedule.pro.astype(np.int32).view(np.uint8),
+                schedule.pro_max.astype(np.int32).view(np.uint8),
+                bits.ravel(),
+            ]
+        )
+        shm.buf[: layout.nbytes] = layout.tobytes()
+        np.ndarray((1,), dtype=np.int32, buffer=shm.buf)[0] = READY
+
+    @staticmethod
+    def _ready(shm: SharedMemory) -> bool:
+        if shm.size < 4 * HEADER_FIELDS:
+            return False
+        return int(np.ndarray((1,), dtype=np.int32, buffer=shm.buf)[0]) == READY
+
+    @classmethod
+    def publish(
+        cls,
+        schedule: HitSchedule,
+        name: str = Config.hit_schedule_shm,
+        timeout: float = Config.hit_schedule_attach_timeout,
+    ) -> "SharedHitSchedule":
+        """
+        The publish function packs a schedule into a new shared memory block.
+        When the block exists, published by another worker or left by a
+        crashed one, it is attached to instead: a block is never unlinked by
+        a process that did not create it.
+
+        :param schedule: The HitSchedule to share
+        :param name: The name of the shared memory block
+        :param timeout: The seconds to wait for an existing block to be ready
+        :return: The SharedHitSchedule, owning when this call created it
+        """
+        size = cls.nbytes(*schedule.pro_count.shape[:2])
+        try:
+            shm = SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            return cls.attach(name, timeout)
+        _published.add(shm._name)
+        cls._write(shm, schedule)
+        logger.info(f"hit schedule published to shared memory {name} ({size} bytes)")
+        return cls(shm, owner=True)
+
+    @staticmethod
+    def _open(name: str) -> SharedMemory:
+        shm = SharedMemory(name=name)
+        # Attaching processes must not unlink the block when they exit,
+        # only the publisher owns its lifetime.
+        if shm._name not in _published:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+    @classmethod
+    def attach(
+        cls,
+        name: str = Config.hit_schedule_shm,
+        timeout: float = Config.hit_schedule_attach_timeout,
+    ) -> "SharedHitSchedule":
+        """
+        The attach function maps a block published by another process, once
+        its publisher has set it ready.
+
+        :param name: The name of the shared memory block
+        :param timeout: The seconds to wait for the block to be ready
+        :return: A read-only SharedHitSchedule
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                shm = cls._open(name)
+            except ValueError:
+                # Created, but not sized yet.
+                shm = None
+            if shm is not None:
+                if cls._ready(shm):
+                    return cls(shm)
+                shm.close()
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"shared hit schedule {name} is not ready")
+            time.sleep(0.01)
+
+    @classmethod
+    def attach_or_publish(
+        cls,
+        factory: Callable[[], HitSchedule],
+        name: str = Config.hit_schedule_shm,
+    ) -> "SharedHitSchedule":
+        """
+        The attach_or_publish function attaches to the host's schedule and
+        only builds it with factory when no worker has published it yet.
+
+        :param factory: Called to build the HitSchedule when none is published
+        :param name: The name of the shared memory block
+        :return: A SharedHitSchedule
+        """
+        try:
+            return cls.attach(name)
+        except FileNotFoundError:
+            return cls.publish(factory(), name)
+
+    def is_hit(self, fish_type: int, bet_idx: int, position: int) -> bool:
+        """
+        The is_hit function reads one slot of a schedule.
+
+        :param fish_type: The index of the fish type
+        :param bet_idx: The index of the bet denomination
+        :param position: The slot of the schedule
+        :return: True when the shot at that slot kills
+        """
+        byte = self.bits[fish_type, bet_idx, position >> 3]
+        return bool((byte >> (7 - (position & 7))) & 1)
+
+    def row(self, fish_type: int, bet_idx: int) -> np.ndarray:
+        """
+        The row function unpacks a whole schedule into an int8 array.
+
+        :param fish_type: The index of the fish type
+        :param bet_idx: The index of the bet denomination
+        :return: The 0/1 schedule of SCHEDULE_LENGTH slots
+        """
+        return np.unpackbits(self.bits[fish_type, bet_idx])[:SCHEDULE_LENGTH].astype(
+            np.int8
+        )
+
+    def close(self) -> None:
+        self.pro = self.pro_max = self.bits = None
+        self.shm.close()
+
+    def unlink(self) -> None:
+        """
+        The unlink function frees the block, it is only called by the publisher.
+        """
+        self.close()
+        if self.owner:
+            self.shm.unlink()
+            _published.discard(self.shm._name)
+
+
+class HitCursor:
+    """
+    The HitCursor class holds the per-table hit counters over a shared
+    schedule in small int32 arrays local to the worker. Instead of reshuffling
+    the shared schedule when a table runs through it, the cursor restarts at a
+    new random offset, so the shared pages are never written.
+    """
+
+    __slots__ = ("schedule", "hit_times", "offsets", "rng")
+
+    def __init__(
+        self, schedule: SharedHitSchedule, rng: Optional[np.random.Generator] = None
+    ):
+        self.schedule = schedule
+        self.rng = rng or np.random.default_rng()
+        self.hit_times = np.zeros(schedule.shape, dtype=np.int32)
+        self.offsets = self.rng.integers(
+            0, np.maximum(schedule.pro_max, 1)[:, None], size=schedule.shape
+        ).astype(np.int32)
+
+    def next_hit(self, fish_type: int, bet_idx: int, hit_count: int = 10) -> bool:
+        """
+        The next_hit function advances the table's cursor for a fish type and
+        bet and reports whether the shot kills, as get_score did with
+        hit_times and pro_count.
+
+        :param fish_type: The index of the fish type
+        :param bet_idx: The index of the bet denomination
+        :param hit_count: The number of hits the shot counts for, 10 per slot
+        :return: True when the fish is killed
+        """
+        pro_max = int(self.schedule.pro_max[fish_type])
+        if not pro_max:
+            return False
+        position = int(self.hit_times[fish_type, bet_idx]) // 10
+        if position >= pro_max:
+            self.offsets[fish_type, bet_idx] = self.rng.integers(0, pro_max)
+            self.hit_times[fish_type, bet_idx] = 0
+            position = 0
+        self.hit_times[fish_type, bet_idx] += hit_count
+        slot = (int(self.offsets[fish_type, bet_idx]) + position) % pro_max
+        return self.schedule.is_hit(fish_type, bet_idx, slot)
@@ -0,0 +1,412 @@
+"""
+@author: Kuro
+@github: slapglif
+
+Offline Monte Carlo RTP simulator for the fish game. It drives the same kill
+and pool rules as the live code with no database or sockets, so Fish.coin,
+Fish.outPro, the ClickOdd tiers or rtp_pool_max can be checked before they
+are changed:
+
+    python -m app.games.fish.simulator --fish fish.json --shots 10000000
+
+--fish is a JSON list of fish rows with fishType, coin and outPro, and
+optionally a difficulty (or hit_times) for the game rule, which defaults
+to 100.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.games.fish.hit_resolution import kill_bounds
+from app.games.fish.schema import ClickOdd, FishNamespace, GameConfig
+from app.games.fish.spawn_sampler import AliasTable
+from app.games.fish.table_rng import TableStream
+from app.shared.probability.rtp import RtpAggregate
+from settings import Config
+
+logger = logging.getLogger("simulator")
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.INFO)
+
+CHUNK = 1 << 16
+
+
+@dataclass
+class SimulationSpec:
+    """
+    The SimulationSpec class is everything a run needs, it is pickled to the
+    worker processes.
+    """
+
+    fish: List[dict]
+    shots: int
+    rule: str = "game"
+    bets: Sequence[int] = tuple(FishNamespace.betCount)
+    players: int = 4
+    rtp_pool_max: float = float(Config.rtp_pool_max)
+    rtp_user_min: int = int(Config.rtp_user_min)
+    click_odds: List[dict] = field(
+        default_factory=lambda: [odd.dict() for odd in GameConfig().paths]
+    )
+    game_type: int = 1
+    sample_every: int = 100_000
+
+
+@dataclass
+class RunResult:
+    """
+    The RunResult class holds the per fish type sums of one run and its pool
+    trajectory as (shot, total bet, total win) samples, the last one at the
+    final shot.
+    """
+
+    seed: int
+    shots: np.ndarray
+    kills: np.ndarray
+    bet: np.ndarray
+    win: np.ndarray
+    return_sum: np.ndarray
+    return_sq: np.ndarray
+    trajectory: List[tuple]
+    seconds: float = 0.0
+
+    @property
+    def rtp(self) -> float:
+        return float(self.win.sum() / max(self.bet.sum(), 1))
+
+
+@lru_cache(maxsize=1024)
+def pool_limit(click: int, click_odds: tuple) -> int:
+    """
+    The pool_limit function mirrors calculate_poollimit: every ClickOdd tier
+    the click count is under overrides the limit, the sixth tier always does.
+
+    :param click: The player's click count
+    :param click_odds: A tuple of (click, percent, cycle, minpool, maxpool)
+    :return: The pool limit
+    """
+    limit = click_odds[0][4]
+    for i, (tier_click, percent, cycle, minpool, maxpool) in enumerate(click_odds):
+        if i == 5:
+            limit = maxpool if click % percent <= cycle else minpool
+        elif click < tier_click:
+            limit = minpool if click % percent > cycle else maxpool
+    return limit
+
+
+def legacy_kill(stream: TableStream, pool: float, limit: int, max_pool: float) -> bool:
+    """
+    The legacy_kill function mirrors kill_fish for a hit with the given pool.
+    """
+    is_kill = False
+    random_kill = stream.randint(0, 9)
+    if pool < limit:
+        is_kill = random_kill > 7
+    elif random_kill > 7:
+        is_kill = stream.randint(0, 9) < 5
+    return pool < max_pool and (is_kill or limit > 15)
+
+
+class Simulation:
+    """
+    The Simulation class plays the shots of one run. Fish types are drawn by
+    outPro, bets and players uniformly, all in vectorized chunks from one
+    seeded TableStream.
+
+    The game rule kills with the kill_bounds window of GameProbability and
+    pays through an RtpAggregate, only shots that land in the window are
+    looped over in Python. The legacy rule replays kill_fish with the pool
+    ratio and ClickOdd limits of the commented FishServer.
+    """
+
+    def __init__(self, spec: SimulationSpec, seed: int):
+        self.spec = spec
+        self.seed = seed
+        self.stream = TableStream(table="simulator", seed=seed)
+        fish = [row for row in spec.fish if (row.get("outPro") or 0) > 0]
+        self.fish_types = np.array([int(row["fishType"]) for row in fish])
+        self.coins = np.array([float(row.get("coin") or 0) for row in fish])
+        self.spawn = AliasTable(np.arange(len(fish)), [row["outPro"] for row in fish])
+        difficulty = [row.get("difficulty", row.get("hit_times", 100)) for row in fish]
+        self.kill_low, self.kill_high = kill_bounds(np.array(difficulty, np.float64))
+        self.bets = np.asarray(spec.bets, dtype=np.int64)
+        self.click_odds = tuple(
+            (odd["click"], odd["percent"], odd["cycle"], odd["minpool"], odd["maxpool"])
+            for odd in spec.click_odds
+        )
+        self.aggregate = RtpAggregate(
+            game_session_id=None,
+            rtp_pool_max=spec.rtp_pool_max,
+            rtp_user_min=spec.rtp_user_min,
+        )
+        for player in range(spec.players):
+            self.aggregate.seen(player, rtp=0)
+
+    def _chunk_game(self, fish, players, bets, wins, seeds) -> np.ndarray:
+        aggregate = self.aggregate
+        candidates = np.flatnonzero(
+            (self.kill_low[fish] <= seeds) & (seeds < self.kill_high[fish]) & (wins > 0)
+        )
+        base_total = aggregate.total_bet
+        total_bet = base_total + np.cumsum(bets)
+        player_bet = np.zeros(len(bets), dtype=np.int64)
+        base_rtp = dict(aggregate.user_rtp)
+        player_totals = {}
+        for player in range(self.spec.players):
+            mask = players == player
+            player_bet[mask] = np.cumsum(bets[mask])
+            player_totals[player] = int(bets[mask].sum())
+        win_adjust = dict.fromkeys(base_rtp, 0)
+
+        paid = np.zeros(len(bets), dtype=np.int64)
+        for i in candidates:
+            player, win = int(players[i]), int(wins[i])
+            aggregate.total_bet = int(total_bet[i])
+            aggregate.user_rtp[player] = (
+                base_rtp[player] + int(player_bet[i]) + win_adjust[player]
+            )
+            if aggregate.can_pay(player, win):
+                before = aggregate.user_rtp[player]
+                aggregate.record_win(player, win)
+                win_adjust[player] += aggregate.user_rtp[player] - before
+                paid[i] = win
+
+        aggregate.total_bet = int(total_bet[-1])
+        for player, total in player_totals.items():
+            aggregate.user_rtp[player] = base_rtp[player] + total + win_adjust[player]
+        return paid
+
+    def _chunk_legacy(self, fish, players, bets, wins, seeds) -> np.ndarray:
+        aggregate = self.aggregate
+        paid = np.zeros(len(bets), dtype=np.int64)
+        for i in range(len(bets)):
+            aggregate.total_bet += int(bets[i])
+            pool = (
+                aggregate.total_win + int(wins[i]) * self.spec.game_type
+            ) / aggregate.total_bet
+            limit = pool_limit(int(pool), self.click_odds)
+            if wins[i] and legacy_kill(
+                self.stream, pool, limit, self.spec.rtp_pool_max
+            ):
+                aggregate.total_win += int(wins[i])
+                paid[i] = wins[i]
+        return paid
+
+    def run(self) -> RunResult:
+        started = time.perf_counter()
+        n_fish = len(self.fish_types)
+        result = RunResult(
+            seed=self.seed,
+            shots=np.zeros(n_fish, np.int64),
+            kills=np.zeros(n_fish, np.int64),
+            bet=np.zeros(n_fish, np.int64),
+            win=np.zeros(n_fish, np.int64),
+            return_sum=np.zeros(n_fish, np.float64),
+            return_sq=np.zeros(n_fish, np.float64),
+            trajectory=[(0, 0, 0)],
+        )
+        play = self._chunk_game if self.spec.rule == "game" else self._chunk_legacy
+        done = 0
+        while done < self.spec.shots:
+            size = min(CHUNK, self.spec.shots - done)
+            fish = self.spawn.draw_many(size, self.stream)
+            players = self.stream.integers(self.spec.players, size=size)
+            bets = self.bets[self.stream.integers(len(self.bets), size=size)]
+            wins = (bets * self.coins[fish]).astype(np.int64)
+            seeds = self.stream.random(size)
+
+            paid = play(fish, players, bets, wins, seeds)
+
+            result.shots += np.bincount(fish, minlength=n_fish)
+            result.kills += np.bincount(fish, weights=paid > 0, minlength=n_fish).astype(
+                np.int64
+            )
+            result.bet += np.bincount(fish, weights=bets, minlength=n_fish).astype(
+                np.int64
+            )
+            result.win += np.bincount(fish, weights=paid, minlength=n_fish).astype(
+                np.int64
+            )
+            returns = paid / bets
+            result.return_sum += np.bincount(fish, weights=returns, minlength=n_fish)
+            result.return_sq += np.bincount(fish, weights=returns**2, minlength=n_fish)
+            start = done
+            done += size
+            samples = range(
+                (start // self.spec.sample_every + 1) * self.spec.sample_every,
+                done + 1,
+                self.spec.sample_every,
+            )
+            if samples:
+                cum_bet = result.bet.sum() - bets.sum() + np.cumsum(bets)
+                cum_win = result.win.sum() - paid.sum() + np.cumsum(paid)
+                result.trajectory.extend(
+                    (shot, int(cum_bet[shot - start - 1]), int(cum_win[shot - start - 1]))
+                    for shot in samples
+                )
+        if result.trajectory[-1][0] != done:
+            result.trajectory.append(
+                (done, int(result.bet.sum()), int(result.win.sum()))
+            )
+        result.seconds = time.perf_counter() - started
+        return result
+
+
+def run_once(spec: SimulationSpec, seed: int) -> RunResult:
+    return Simulation(spec, seed).run()
+
+
+def simulate(
+    spec: SimulationSpec,
+    runs: int = 1,
+    seed: Optional[int] = None,
+    workers: Optional[int] = None,
+) -> List[RunResult]:
+    """
+    The simulate function spreads independent runs of spec.shots shots over a
+    process pool. Run seeds are spawned from one SeedSequence, so a seed
+    reproduces the whole batch.
+
+    :param spec: The SimulationSpec of every run
+    :param runs: The number of runs
+    :param seed: The base seed, drawn from OS entropy when omitted
+    :param workers: The number of processes, one per CPU when omitted
+    :return: The RunResult of each run
+    """
+    sequence = np.random.SeedSequence(seed)
+    seeds = [
+        int(child.generate_state(2, np.uint64).view(np.uint64)[0])
+        for child in sequence.spawn(runs)
+    ]
+    if runs == 1 or workers == 1:
+        return [run_once(spec, run_seed) for run_seed in seeds]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run_once, [spec] * runs, seeds))
+
+
+def report(spec: SimulationSpec, results: List[RunResult]) -> Dict:
+    """
+    The report function merges the runs into per fish type RTP and variance
+    of the return (win / bet) per shot, plus the spread of the RTP across runs.
+
+    :param spec: The SimulationSpec the runs used
+    :param results: The RunResult of each run
+    :return: A JSON serialisable report
+    """
+    spawnable = [row for row in spec.fish if (row.get("outPro") or 0) > 0]
+    shots = sum(result.shots for result in results)
+    kills = sum(result.kills for result in results)
+    bet = sum(result.bet for result in results)
+    win = sum(result.win for result in results)
+    return_sum = sum(result.return_sum for result in results)
+    return_sq = sum(result.return_sq for result in results)
+    fish = []
+    for i, row in enumerate(spawnable):
+        count = max(int(shots[i]), 1)
+        variance = return_sq[i] / count - (return_sum[i] / count) ** 2
+        fish.append(
+            {
+                "fishType": int(row["fishType"]),
+                "coin": row.get("coin"),
+                "outPro": row["outPro"],
+                "shots": int(shots[i]),
+                "kills": int(kills[i]),
+                "bet": int(bet[i]),
+                "win": int(win[i]),
+                "rtp": float(win[i] / bet[i]) if bet[i] else 0.0,
+                "variance": float(max(variance, 0.0)),
+            }
+        )
+    run_rtp = np.array([result.rtp for result in results])
+    return {
+        "rule": spec.rule,
+        "shots": int(shots.sum()),
+        "rtp": float(win.sum() / max(bet.sum(), 1)),
+        "rtp_std_across_runs": float(run_rtp.std(ddof=1)) if len(results) > 1 else 0.0,
+        "rtp_pool_max": spec.rtp_pool_max,
+        "runs": [
+            {"seed": result.seed, "rtp": result.rtp, "seconds": result.seconds}
+            for result in results
+        ],
+        "fish": fish,
+    }
+
+
+def write_report(path: str, spec: SimulationSpec, results: List[RunResult]) -> Dict:
+    """
+    The write_report function writes report.json, fish.csv and the pool
+    trajectory of every run to trajectory.csv under path.
+    """
+    os.makedirs(path, exist_ok=True)
+    summary = report(spec, results)
+    with open(os.path.join(path, "report.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    with open(os.path.join(path, "fish.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(summary["fish"][0]))
+        writer.writeheader()
+        writer.writerows(summary["fish"])
+    with open(os.path.join(path, "trajectory.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["seed", "shot", "bet", "win", "pool", "rtp"])
+        for result in results:
+            for shot, bet, win in result.trajectory:
+                writer.writerow(
+                    [result.seed, shot, bet, win, bet - win, win / bet if bet else 0]
+                )
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--fish", required=True, help="JSON list of fish rows")
+    parser.add_argument("--shots", type=int, default=10_000_000)
+    parser.add_argument("--runs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--rule", choices=("game", "legacy"), default="game")
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--bets", type=int, nargs="+", default=FishNamespace.betCount)
+    parser.add_argument("--rtp-pool-max", type=float, default=Config.rtp_pool_max)
+    parser.add_argument("--rtp-user-min", type=int, default=Config.rtp_user_min)
+    parser.add_argument("--click-odds", help="JSON list of ClickOdd tiers")
+    parser.add_argument("--sample-every", type=int, default=100_000)
+    parser.add_argument("--out", default="simulation")
+    args = parser.parse_args(argv)
+
+    with open(args.fish) as f:
+        fish = json.load(f)
+    spec = SimulationSpec(
+        fish=fish,
+        shots=-(-args.shots // args.runs),
+        rule=args.rule,
+        bets=tuple(args.bets),
+        players=args.players,
+        rtp_pool_max=float(args.rtp_pool_max),
+        rtp_user_min=int(args.rtp_user_min),
+        sample_every=args.sample_every,
+    )
+    if args.click_odds:
+        with open(args.click_odds) as f:
+            spec.click_odds = [ClickOdd(**odd).dict() for odd in json.load(f)]
+
+    started = time.perf_counter()
+    results = simulate(spec, args.runs, args.seed, args.workers)
+    summary = write_report(args.out, spec, results)
+    logger.info(
+        f"{summary['shots']} shots in {time.perf_counter() - started:.1f}s, "
+        f"rtp {summary['rtp']:.4f} ± {summary['rtp_std_across_runs']:.4f}, "
+        f"report written to {args.out}"
+    )
+
+
+if __name__ == "__main__":
+    main()
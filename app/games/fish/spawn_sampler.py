@@ -0,0 +1,212 @@
+"""
+@author: Kuro
+@github: slapglif
+"""
+
+import heapq
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from app.api.game.models import Fish
+
+# Share of all draws given to each featured fish type, as the legacy
+# _select_fish_type gave fish 25 and 24 a third of the draws each.
+FEATURED_SHARES: Dict[int, float] = {25: 1 / 3, 24: 1 / 3}
+
+
+class AliasTable:
+    """
+    The AliasTable class implements Vose's alias method, giving O(1) draws
+    from a fixed discrete distribution after an O(n) build. It replaces the
+    expanded fish_out_list where every fish type was repeated outPro times.
+    """
+
+    __slots__ = ("values", "prob", "alias")
+
+    def __init__(self, values: Sequence[int], weights: Sequence[float]):
+        weights = np.asarray(weights, dtype=np.float64)
+        if len(values) != len(weights):
+            raise ValueError("values and weights must have the same length")
+        if not len(weights) or (weights < 0).any() or weights.sum() <= 0:
+            raise ValueError("weights must be non-negative with a positive sum")
+
+        n = len(weights)
+        scaled = weights * n / weights.sum()
+        self.values = np.asarray(values)
+        self.prob = np.ones(n, dtype=np.float64)
+        self.alias = np.arange(n, dtype=np.int64)
+
+        small = [i for i in range(n) if scaled[i] < 1.0]
+        large = [i for i in range(n) if scaled[i] >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.prob[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] = scaled[more] + scaled[less] - 1.0
+            (small if scaled[more] < 1.0 else large).append(more)
+        # Whatever is left only differs from 1 by rounding error.
+        for i in small + large:
+            self.prob[i] = 1.0
+
+    def __len__(self):
+        return len(self.values)
+
+    def draw(self, rng: np.random.Generator) -> int:
+        """
+        The draw function picks one value.
+
+        :param rng: The generator to draw from
+        :return: One of the table's values
+        """
+        column = int(rng.integers(len(self.prob)))
+        if rng.random() < self.prob[column]:
+            return int(self.values[column])
+        return int(self.values[self.alias[column]])
+
+    def draw_many(self, k: int, rng: np.random.Generator) -> np.ndarray:
+        """
+        The draw_many function picks k values with two vectorized draws.
+
+        :param k: The number of values to draw
+        :param rng: The generator to draw from
+        :return: An array of k values
+        """
+        columns = rng.integers(len(self.prob), size=k)
+        keep = rng.random(k) < self.prob[columns]
+        return self.values[np.where(keep, columns, self.alias[columns])]
+
+
+def featured_weights(
+    fish_types: Sequence[int], weights: Sequence[float], shares: Dict[int, float]
+) -> List[float]:
+    """
+    The featured_weights function rescales the weights so that every featured
+    fish type present is drawn with its share, and the other types split what
+    is left in proportion to their weights.
+
+    :param fish_types: The fish types
+    :param weights: Their weights
+    :param shares: A mapping of featured fish type to its share of the draws
+    :return: The new weights
+    """
+    present = {t: shares[t] for t in fish_types if t in shares}
+    rest = sum(w for t, w in zip(fish_types, weights) if t not in present)
+    left = 1 - sum(present.values())
+    if not present or rest <= 0 or left <= 0:
+        return list(weights)
+    return [
+        present[t] / left * rest if t in present else w
+        for t, w in zip(fish_types, weights)
+    ]
+
+
+class SpawnSampler:
+    """
+    The SpawnSampler class picks which fish types come out on a tick. Regular
+    spawns are weighted by Fish.outPro through an AliasTable. Fish types that
+    must show up at least every N ticks are kept in a min-heap keyed by the
+    tick they are due, so a tick only looks at the top of the heap instead of
+    counting down every config as the legacy _select_fish_type did.
+    """
+
+    def __init__(
+        self,
+        fish_types: Sequence[int],
+        weights: Sequence[float],
+        guarantees: Optional[Dict[int, int]] = None,
+        rng: Optional[np.random.Generator] = None,
+        tick: int = 0,
+    ):
+        self.table = AliasTable(fish_types, weights)
+        self.rng = rng or np.random.default_rng()
+        self.guarantees = dict(guarantees or {})
+        self.due: Dict[int, int] = {}
+        self.heap: List[tuple] = []
+        for fish_type, interval in self.guarantees.items():
+            self._schedule(fish_type, tick + interval)
+
+    @classmethod
+    def from_fish(
+        cls,
+        fish_configs: Optional[Iterable[Fish]] = None,
+        guarantees: Optional[Dict[int, int]] = None,
+        rng: Optional[np.random.Generator] = None,
+        featured: Optional[Dict[int, float]] = None,
+    ) -> "SpawnSampler":
+        """
+        The from_fish function builds a sampler from the rows of the fish table.
+        Rows without an outPro never spawn on their own. As in the legacy
+        _select_fish_type, a fish with an outPro comes out at least every
+        outPro ticks, and the featured fish types (25 and 24) each take a
+        fixed share of the draws, the others sharing the rest by outPro.
+
+        :param fish_configs: The Fish rows, read from the database when omitted
+        :param guarantees: A mapping of fish type to the max ticks between two
+            spawns, derived from outPro when omitted
+        :param rng: The generator to draw from
+        :param featured: A mapping of fish type to its share of the draws,
+            FEATURED_SHARES when omitted
+        :return: A SpawnSampler
+        """
+        if fish_configs is None:
+            fish_configs = Fish.read_all()
+        spawnable = [fish for fish in fish_configs if fish.outPro and fish.outPro > 0]
+        fish_types = [int(fish.fishType) for fish in spawnable]
+        weights = [float(fish.outPro) for fish in spawnable]
+        if guarantees is None:
+            guarantees = {
+                fish_type: max(1, int(fish.outPro))
+                for fish_type, fish in zip(fish_types, spawnable)
+            }
+        return cls(
+            fish_types=fish_types,
+            weights=featured_weights(
+                fish_types, weights, FEATURED_SHARES if featured is None else featured
+            ),
+            guarantees=guarantees,
+            rng=rng,
+        )
+
+    def _schedule(self, fish_type: int, due: int) -> None:
+        self.due[fish_type] = due
+        heapq.heappush(self.heap, (due, fish_type))
+
+    def _pop_due(self, tick: int) -> Optional[int]:
+        while self.heap and self.heap[0][0] <= tick:
+            due, fish_type = heapq.heappop(self.heap)
+            # Entries superseded by a newer due tick are skipped lazily.
+            if self.due.get(fish_type) == due:
+                return fish_type
+        return None
+
+    def _spawned(self, fish_type: int, tick: int) -> None:
+        if interval := self.guarantees.get(fish_type):
+            self._schedule(fish_type, tick + interval)
+
+    def spawn(self, tick: int, k: int = 1) -> List[int]:
+        """
+        The spawn function returns the fish types that come out on a tick.
+        Overdue guaranteed fish take the first slots, the rest are drawn in a
+        single vectorized alias draw.
+
+        :param tick: The current tick of the table
+        :param k: The number of fish that come out on this tick
+        :return: A list of k fish types
+        """
+        spawned = []
+        while len(spawned) < k and (fish_type := self._pop_due(tick)) is not None:
+            spawned.append(fish_type)
+            self._spawned(fish_type, tick)
+        if remaining := k - len(spawned):
+            drawn = (
+                [self.table.draw(self.rng)]
+                if remaining == 1
+                else self.table.draw_many(remaining, self.rng).tolist()
+            )
+            for fish_type in drawn:
+                fish_type = int(fish_type)
+                spawned.append(fish_type)
+                if fish_type in self.guarantees:
+                    self._spawned(fish_type, tick)
+        return spawned
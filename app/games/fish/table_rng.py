@@ -0,0 +1,177 @@
+"""
+@author: Kuro
+@github: slapglif
+"""
+import logging
+import zlib
+from typing import Dict, Hashable, Optional, Sequence
+
+import numpy as np
+
+from settings import Config
+
+logger = logging.getLogger("table_rng")
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.DEBUG)
+
+
+class TableStream:
+    """
+    The TableStream class is the random stream of one table: a PCG64
+    generator with a recorded seed, read in pre-generated blocks of uniforms.
+    draws counts the uniforms handed out, so the pair (seed, draws) pins the
+    exact position of the stream and replay can jump there without redrawing.
+
+    Every helper is built on those uniforms, and random/integers follow the
+    numpy Generator signatures so a stream can be passed wherever the fish
+    code takes an rng.
+    """
+
+    __slots__ = ("table", "seed", "block_size", "generator", "block", "cursor", "draws")
+
+    def __init__(
+        self,
+        table: Hashable = None,
+        seed: Optional[int] = None,
+        block_size: int = Config.table_rng_block,
+    ):
+        self.table = table
+        self.seed = int(np.random.SeedSequence().entropy if seed is None else seed)
+        self.block_size = block_size
+        self.generator = np.random.Generator(np.random.PCG64(self.seed))
+        self.block = np.empty(0, dtype=np.float64)
+        self.cursor = 0
+        self.draws = 0
+
+    @classmethod
+    def replay(
+        cls,
+        seed: int,
+        draws: int = 0,
+        table: Hashable = None,
+        block_size: int = Config.table_rng_block,
+    ) -> "TableStream":
+        """
+        The replay function rebuilds a stream positioned after draws uniforms.
+        PCG64 yields one 64-bit output per uniform, so the generator is
+        advanced in O(1) to the block holding that position.
+
+        :param seed: The recorded seed of the table
+        :param draws: The recorded draw counter
+        :param table: The key of the table
+        :param block_size: The block size the stream was recorded with
+        :return: A TableStream that continues where the recorded one was
+        """
+        stream = cls(table=table, seed=seed, block_size=block_size)
+        blocks, cursor = divmod(draws, block_size)
+        stream.generator.bit_generator.advance(blocks * block_size)
+        stream.draws = blocks * block_size
+        if cursor:
+            stream._refill()
+            stream.cursor = cursor
+            stream.draws += cursor
+        return stream
+
+    def _refill(self) -> None:
+        self.block = self.generator.random(self.block_size)
+        self.cursor = 0
+
+    def _take(self, count: int) -> np.ndarray:
+        taken = []
+        while count:
+            if self.cursor >= len(self.block):
+                self._refill()
+            chunk = self.block[self.cursor : self.cursor + count]
+            self.cursor += len(chunk)
+            self.draws += len(chunk)
+            count -= len(chunk)
+            taken.append(chunk)
+        return taken[0] if len(taken) == 1 else np.concatenate(taken)
+
+    def random(self, size=None):
+        """
+        The random function returns uniforms in [0, 1).
+
+        :param size: None for a float, else the shape of the array
+        :return: A float or an array of floats
+        """
+        if size is None:
+            if self.cursor >= len(self.block):
+                self._refill()
+            value = self.block[self.cursor]
+            self.cursor += 1
+            self.draws += 1
+            return float(value)
+        shape = (size,) if np.isscalar(size) else tuple(size)
+        return self._take(int(np.prod(shape))).reshape(shape)
+
+    def integers(self, low, high=None, size=None):
+        """
+        The integers function returns integers in [low, high), or [0, low)
+        when high is omitted. low and high may be arrays that broadcast to size.
+
+        :return: An int or an array of ints
+        """
+        if high is None:
+            low, high = 0, low
+        if size is None and np.isscalar(low) and np.isscalar(high):
+            return int(low + int(self.random() * (high - low)))
+        low, high = np.asarray(low), np.asarray(high)
+        if size is None:
+            size = np.broadcast(low, high).shape
+        return (low + np.floor(self.random(size) * (high - low))).astype(np.int64)
+
+    def randint(self, a: int, b: int) -> int:
+        """
+        The randint function mirrors random.randint, both ends included.
+        """
+        return self.integers(a, b + 1)
+
+    def choice(self, options: Sequence):
+        return options[self.integers(len(options))]
+
+    def state(self) -> dict:
+        return {"table": self.table, "seed": self.seed, "draws": self.draws}
+
+
+class TableStreams:
+    """
+    The TableStreams class is the per-process registry of TableStream
+    objects, one per table. With TABLE_RNG_SEED set every table derives its
+    seed from it and its key, otherwise seeds come from OS entropy. Seeds are
+    logged when a stream is created so rounds can be replayed from the logs.
+    """
+
+    streams: Dict[Hashable, TableStream] = {}
+
+    @staticmethod
+    def seed_for(table: Hashable) -> Optional[int]:
+        if Config.table_rng_seed is None:
+            return None
+        return (int(Config.table_rng_seed) << 32) | zlib.crc32(str(table).encode())
+
+    @classmethod
+    def get(cls, table: Hashable) -> TableStream:
+        if (stream := cls.streams.get(table)) is None:
+            stream = cls.streams[table] = TableStream(table, cls.seed_for(table))
+            logger.info(f"rng stream of table {table} seeded with {stream.seed}")
+        return stream
+
+    @classmethod
+    def restore(cls, table: Hashable, seed: int, draws: int) -> TableStream:
+        """
+        The restore function replaces a table's stream with a replayed one.
+
+        :param table: The key of the table
+        :param seed: The recorded seed
+        :param draws: The recorded draw counter
+        :return: The replayed TableStream
+        """
+        stream = cls.streams[table] = TableStream.replay(seed, draws, table)
+        return stream
+
+    @classmethod
+    def drop(cls, table: Hashable) -> Optional[TableStream]:
+        if stream := cls.streams.pop(table, None):
+            logger.info(f"rng stream of table {table} closed at {stream.state()}")
+        return stream
@@ -0,0 +1,154 @@
+import uuid
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.games.fish.hit_resolution import HitEvent, HitResolver, kill_bounds
+from app.shared.probability.rtp import RtpAggregate
+
+rewards = [
+    SimpleNamespace(id=1, reward=10, hit_times=100),
+    SimpleNamespace(id=2, reward=50, hit_times=2000),
+]
+
+
+def test_kill_bounds_matches_prob_distribution_window():
+    low, high = kill_bounds(np.array([100, 2000]))
+    assert np.allclose(low, [0.0, 0.95])
+    assert np.allclose(high, [0.05, 1.0])
+
+
+def test_resolve_batches_all_hits_of_a_tick():
+    resolver = HitResolver(rewards, rng=np.random.default_rng(0), rtp_pool_max=0.5)
+    for _ in range(1000):
+        resolver.submit(HitEvent(user_id=7, reward_id=1, bet=1))
+        resolver.submit(HitEvent(user_id=8, reward_id=2, bet=1))
+    resolver.submit(HitEvent(user_id=9, reward_id=404, bet=1))
+
+    resolution = resolver.resolve()
+
+    assert not resolver.pending
+    assert len(resolution.events) == 2001
+    assert not resolution.killed[-1]
+    assert 0.02 < resolution.killed[0:2000:2].mean() < 0.08
+    assert resolution.balance_deltas[7] == resolution.wins[0:2000:2].sum()
+    assert resolution.balance_deltas[8] == resolution.wins[1:2000:2].sum()
+    assert 9 not in resolution.balance_deltas
+    assert resolution.rtp_deltas[8] == -int(resolution.balance_deltas[8] * 0.5)
+    assert resolution.pool_delta == 2001 - resolution.wins.sum()
+
+
+def test_resolve_without_hits_returns_none():
+    assert HitResolver(rewards).resolve() is None
+
+
+def test_aggregate_gates_kills_and_owns_rtp():
+    aggregate = RtpAggregate(game_session_id=None, rtp_pool_max=1.0, rtp_user_min=0)
+    aggregate.seen(7, rtp=5)
+    aggregate.total_bet = 30
+    resolver = HitResolver(
+        [SimpleNamespace(id=1, reward=20, hit_times=2000)],
+        rng=np.random.default_rng(0),
+        aggregate=aggregate,
+    )
+    resolver.kill_low[:], resolver.kill_high[:] = 0.0, 1.0
+    for _ in range(3):
+        resolver.submit(HitEvent(user_id=7, reward_id=1, bet=1))
+
+    resolution = resolver.resolve()
+
+    assert resolution.killed.tolist() == [True, False, False]
+    assert resolution.balance_deltas == {7: 20}
+    assert resolution.rtp_deltas == {}
+    assert resolution.game_session_id is None
+    assert aggregate.total_win == 0
+    assert aggregate.user_rtp[7] == 5
+
+
+class FakeSession:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.statements = []
+        self.committed = False
+
+    def execute(self, statement, params=None):
+        if self.fail:
+            raise RuntimeError("write failed")
+        self.statements.append((statement, params))
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        pass
+
+
+def aggregate_resolver(aggregate):
+    resolver = HitResolver(
+        [SimpleNamespace(id=1, reward=20, hit_times=2000)],
+        rng=np.random.default_rng(0),
+        aggregate=aggregate,
+    )
+    resolver.kill_low[:], resolver.kill_high[:] = 0.0, 1.0
+    resolver.submit(HitEvent(user_id=7, reward_id=1, bet=1))
+    return resolver
+
+
+def test_aggregate_records_wins_after_apply():
+    aggregate = RtpAggregate(game_session_id=None, rtp_pool_max=1.0, rtp_user_min=0)
+    aggregate.seen(7, rtp=5)
+    aggregate.total_bet = 30
+    session = FakeSession()
+
+    aggregate_resolver(aggregate).flush(session)
+
+    assert session.committed
+    assert aggregate.total_win == 20
+    assert aggregate.user_rtp[7] == -15
+
+
+def test_aggregate_untouched_when_apply_fails():
+    aggregate = RtpAggregate(game_session_id=None, rtp_pool_max=1.0, rtp_user_min=0)
+    aggregate.seen(7, rtp=5)
+    aggregate.total_bet = 30
+
+    with pytest.raises(RuntimeError):
+        aggregate_resolver(aggregate).flush(FakeSession(fail=True))
+
+    assert aggregate.total_win == 0
+    assert aggregate.user_rtp[7] == 5
+
+
+def test_apply_writes_pool_delta_with_balances():
+    game_session_id = uuid.uuid4()
+    resolver = HitResolver(
+        [SimpleNamespace(id=1, reward=20, hit_times=2000)],
+        rng=np.random.default_rng(0),
+        game_session_id=game_session_id,
+    )
+    resolver.kill_low[:], resolver.kill_high[:] = 0.0, 1.0
+    resolver.submit(HitEvent(user_id=7, reward_id=1, bet=3))
+    session = FakeSession()
+
+    resolution = resolver.flush(session)
+
+    assert resolution.pool_delta == 3 - 20
+    tables = [statement.table.name for statement, _ in session.statements]
+    assert tables == ["Balance", "GameResult", "User", "GameSession"]
+    pool = session.statements[-1][0].compile().params
+    assert {3, 20} <= set(pool.values())
+    assert session.committed
+
+
+def test_apply_writes_pool_delta_of_a_tick_without_wins():
+    resolver = HitResolver(rewards, game_session_id=uuid.uuid4())
+    resolver.kill_low[:], resolver.kill_high[:] = 0.0, 0.0
+    resolver.submit(HitEvent(user_id=7, reward_id=1, bet=2))
+    session = FakeSession()
+
+    resolver.flush(session)
+
+    assert [statement.table.name for statement, _ in session.statements] == [
+        "GameSession"
+    ]
@@ -0,0 +1,49 @@
+import numpy as np
+
+from app.games.fish.hit_schedule import HitSchedule, SCHEDULE_LENGTH
+
+pro = [2, 5, 10, 50]
+bet_count = [1, 1.5, 2]
+
+
+def test_generate_shape_and_hit_counts():
+    schedule = HitSchedule.generate(pro, bet_count, control_bet=1.0, seed=1)
+    assert schedule.pro_count.shape == (len(pro), len(bet_count), SCHEDULE_LENGTH)
+    assert schedule.pro_count.dtype == np.int8
+    for i, coin in enumerate(pro):
+        hits = min(10000 // coin, SCHEDULE_LENGTH)
+        assert (schedule.pro_count[i].sum(axis=1) == hits).all()
+        assert not schedule.pro_count[i, :, schedule.pro_max[i]:].any()
+
+
+def test_generate_is_deterministic_for_a_seed():
+    first = HitSchedule.generate(pro, bet_count, control_bet=0.9, seed=42)
+    second = HitSchedule.generate(pro, bet_count, control_bet=0.9, seed=42)
+    assert np.array_equal(first.pro_count, second.pro_count)
+
+
+def test_reshuffle_keeps_hit_count_and_resets_cursor():
+    schedule = HitSchedule.generate(pro, bet_count, control_bet=1.0, seed=3)
+    schedule.hit_times[1, 2] = 500
+    hits = schedule.pro_count[1, 2].sum()
+    schedule.reshuffle(1, 2)
+    assert schedule.pro_count[1, 2].sum() == hits
+    assert schedule.hit_times[1, 2] == 0
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "hit_schedule.npz")
+    schedule = HitSchedule.generate(pro, bet_count, control_bet=1.0, seed=5)
+    schedule.save(path)
+    loaded = HitSchedule.load(path)
+    assert np.array_equal(loaded.pro_count, schedule.pro_count)
+    assert np.array_equal(loaded.pro_max, schedule.pro_max)
+    assert loaded.seed == 5
+
+
+def test_load_or_generate_regenerates_stale_file(tmp_path):
+    path = str(tmp_path / "hit_schedule.npz")
+    HitSchedule.generate(pro, bet_count, control_bet=1.0, seed=5).save(path)
+    schedule = HitSchedule.load_or_generate(pro[:2], bet_count, 1.0, path=path, seed=6)
+    assert schedule.pro_count.shape[0] == 2
+    assert HitSchedule.load(path).seed == 6
@@ -0,0 +1,211 @@
+import asyncio
+import threading
+from itertools import count
+
+import pytest
+
+from app.games.fish.ledger import BetLedger, LedgerMode
+
+
+class Scalar:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+
+class RecordingSession:
+    """
+    Hands out sequence values and records every statement instead of talking
+    to Postgres.
+    """
+
+    def __init__(self, fail=False, amount=100):
+        self.sequence = count(1)
+        self.statements = []
+        self.commits = 0
+        self.commit_threads = []
+        self.rollbacks = 0
+        self.fail = fail
+        self.amount = amount
+        self.before_read = None
+
+    def execute(self, statement, params=None):
+        if "nextval" in str(statement):
+            return [(next(self.sequence),) for _ in range(params["block"])]
+        if str(statement).startswith("SELECT"):
+            if self.before_read:
+                self.before_read, before_read = None, self.before_read
+                before_read()
+            return Scalar(self.amount)
+        if self.fail:
+            raise RuntimeError("database is down")
+        self.statements.append((str(statement), params))
+
+    def commit(self):
+        self.commits += 1
+        self.commit_threads.append(threading.get_ident())
+        for statement, params in self.statements[-1:]:
+            if "UPDATE" in statement:
+                self.amount += sum(row["delta"] for row in params)
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def ledger(session, **kwargs):
+    options = dict(mode=LedgerMode.batched, flush_events=3, flush_ms=60_000)
+    options.update(kwargs)
+    return BetLedger(id_block=2, use_copy=False, session=session, **options)
+
+
+def test_batched_mode_flushes_in_bulk():
+    session = RecordingSession()
+    bets = ledger(session)
+
+    assert [bets.append_bet(7, 5, "session") for _ in range(2)] == [1, 2]
+    assert bets.pending_balance(7) == -10
+    assert bets.is_pending(1) and not session.statements
+
+    bets.append_result("session", 1, 40, user_id=7)
+
+    assert session.commits == 1
+    inserts = [
+        params for statement, params in session.statements if "INSERT" in statement
+    ]
+    assert [len(rows) for rows in inserts] == [2, 1]
+    updates = [
+        params for statement, params in session.statements if "UPDATE" in statement
+    ]
+    assert updates == [[{"owner_id": 7, "delta": 30}]]
+    assert not len(bets) and not bets.pending_balance(7) and not bets.is_pending(1)
+
+
+def test_sync_mode_flushes_every_append():
+    session = RecordingSession()
+    bets = ledger(session, mode=LedgerMode.sync)
+
+    bets.append_bet(7, 5, "session")
+    bets.append_bet(8, 5, "session")
+
+    assert session.commits == 2
+    assert bets.append_bet(9, 5, "session") == 3
+
+
+def test_failed_flush_keeps_events():
+    session = RecordingSession(fail=True)
+    bets = ledger(session, mode=LedgerMode.async_)
+
+    bets.append_bet(7, 5, "session")
+    assert bets.flush() == 0
+
+    assert session.rollbacks == 1
+    assert len(bets) == 1 and bets.pending_balance(7) == -5
+
+    session.fail = False
+    assert bets.flush() == 1
+
+
+def test_balance_being_flushed_stays_pending_until_commit():
+    session = RecordingSession()
+    bets = ledger(session, mode=LedgerMode.async_)
+    seen = []
+    execute = session.execute
+
+    def recording_execute(statement, params=None):
+        if "UPDATE" in str(statement):
+            seen.append((bets.pending_balance(7), bets.lock.acquire(blocking=False)))
+            bets.lock.release()
+        return execute(statement, params)
+
+    session.execute = recording_execute
+    bets.append_bet(7, 5, "session")
+    bets.flush()
+
+    assert seen == [(-5, True)]
+    assert bets.pending_balance(7) == 0
+
+
+def test_flush_without_wait_skips_a_running_flush():
+    bets = ledger(RecordingSession(), mode=LedgerMode.async_)
+    bets.append_bet(7, 5, "session")
+
+    with bets.flushing:
+        assert bets.flush(wait=False) == 0
+
+    assert len(bets) == 1 and bets.flush(wait=False) == 1
+
+
+def test_ids_are_reserved_ahead_off_the_event_loop():
+    session = RecordingSession()
+    bets = BetLedger(id_block=4, use_copy=False, session=session)
+
+    async def main():
+        ids = [bets.next_event_id() for _ in range(3)]
+        assert bets.refill is not None
+        await bets.refill
+        return ids + [bets.next_event_id() for _ in range(5)]
+
+    assert asyncio.run(main()) == list(range(1, 9))
+
+
+def test_sync_mode_raises_a_failed_write_and_drops_it():
+    bets = ledger(RecordingSession(fail=True), mode=LedgerMode.sync)
+
+    with pytest.raises(RuntimeError):
+        bets.append_bet(7, 5, "session")
+
+    assert not len(bets) and not bets.pending_balance(7) and not bets.is_pending(1)
+
+
+def test_batched_mode_flushes_off_the_event_loop():
+    session = RecordingSession()
+    bets = ledger(session)
+
+    async def main():
+        for _ in range(3):
+            bets.append_bet(7, 5, "session")
+        assert bets.pending_flush is not None
+        await bets.pending_flush
+        bets.task.cancel()
+
+    asyncio.run(main())
+
+    assert session.commits == 1
+    assert session.commit_threads[0] != threading.get_ident()
+
+
+def test_balance_reads_the_amount_and_pending_changes_as_one():
+    session = RecordingSession(amount=100)
+    bets = ledger(session, mode=LedgerMode.async_)
+    bets.append_bet(7, 5, "session")
+    assert bets.balance(7) == 95
+
+    # A flush committing between the read of the pending changes and the
+    # read of the amount would count the bet twice.
+    session.before_read = bets.flush
+    assert bets.balance(7) == 95
+    assert session.amount == 95 and bets.pending_balance(7) == 0
+
+
+def test_balance_waits_for_a_commit_in_flight():
+    session = RecordingSession(amount=100)
+    bets = ledger(session, mode=LedgerMode.async_)
+    bets.append_bet(7, 5, "session")
+    read = []
+    commit = session.commit
+
+    def committing():
+        reader = threading.Thread(target=lambda: read.append(bets.balance(7)))
+        reader.start()
+        reader.join(0.1)
+        read.append(reader.is_alive())
+        commit()
+        session.reader = reader
+
+    session.commit = committing
+    bets.flush()
+    session.reader.join(1)
+
+    assert read == [True, 95]
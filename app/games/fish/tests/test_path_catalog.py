@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from app.games.fish.path_catalog import PathAllocator, PathCatalog
+
+
+def rows(*ids):
+    return [
+        SimpleNamespace(id=i, duration=None, starting=i, middle=i, destination=i)
+        for i in ids
+    ]
+
+
+def catalog(*ids):
+    paths = PathCatalog(poll_seconds=3600)
+    paths.load(rows(*ids), fingerprint=ids)
+    return paths
+
+
+def test_take_hands_out_every_path_once():
+    allocator = PathAllocator(catalog(1, 2, 3, 4), rng=np.random.default_rng(0))
+
+    taken = [allocator.take().id for _ in range(4)]
+
+    assert sorted(taken) == [1, 2, 3, 4]
+    assert allocator.take() is None
+    assert sorted(allocator.taken_ids) == [1, 2, 3, 4]
+
+
+def test_release_returns_path_to_free_list():
+    allocator = PathAllocator(catalog(1, 2, 3), rng=np.random.default_rng(0))
+    first = allocator.take().id
+    allocator.take()
+
+    allocator.release(first)
+    allocator.release(first)
+    allocator.release(404)
+
+    assert len(allocator) == 2
+    assert first not in allocator.taken_ids
+
+
+def test_reload_keeps_taken_paths_that_still_exist():
+    paths = catalog(1, 2, 3)
+    allocator = paths.allocator("room")
+    taken = {allocator.take().id, allocator.take().id}
+
+    paths.load(rows(1, 2, 3, 5), fingerprint="changed")
+    allocator.release(404)
+
+    assert set(allocator.taken_ids) == taken
+    assert len(allocator) == 2
+
+    paths.load(rows(5), fingerprint="shrunk")
+    assert allocator.take().id == 5
+    assert allocator.take() is None
@@ -0,0 +1,82 @@
+import threading
+import uuid
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pytest
+
+from app.games.fish.hit_schedule import HitSchedule
+from app.games.fish.shared_schedule import HitCursor, SharedHitSchedule
+
+pro = [2, 5, 10]
+bet_count = [1, 2]
+
+
+def generate():
+    return HitSchedule.generate(pro, bet_count, control_bet=1.0, seed=11)
+
+
+@pytest.fixture
+def shared():
+    schedule = generate()
+    published = SharedHitSchedule.publish(schedule, name=f"test_{uuid.uuid4().hex[:8]}")
+    yield schedule, published
+    published.unlink()
+
+
+def test_attached_copy_matches_schedule(shared):
+    schedule, published = shared
+    attached = SharedHitSchedule.attach(published.shm.name)
+    assert attached.shape == (len(pro), len(bet_count))
+    assert np.array_equal(attached.pro_max, schedule.pro_max)
+    for i in range(len(pro)):
+        for j in range(len(bet_count)):
+            assert np.array_equal(attached.row(i, j), schedule.pro_count[i, j])
+    assert attached.is_hit(0, 0, 3) == bool(schedule.pro_count[0, 0, 3])
+    with pytest.raises(ValueError):
+        attached.bits[0, 0, 0] = 1
+    attached.close()
+
+
+def test_cursor_wraps_without_touching_shared_bits(shared):
+    schedule, published = shared
+    cursor = HitCursor(published, rng=np.random.default_rng(0))
+    before = published.bits.copy()
+    pro_max = int(schedule.pro_max[1])
+    kills = sum(cursor.next_hit(1, 0) for _ in range(pro_max))
+    assert kills == schedule.pro_count[1, 0].sum()
+    cursor.next_hit(1, 0)
+    assert cursor.hit_times[1, 0] == 10
+    assert np.array_equal(published.bits, before)
+
+
+def test_publishing_an_existing_block_attaches_to_it(shared):
+    schedule, published = shared
+
+    again = SharedHitSchedule.publish(generate(), name=published.shm.name)
+    assert not again.owner
+    again.unlink()
+
+    attached = SharedHitSchedule.attach(published.shm.name)
+    assert np.array_equal(attached.row(2, 1), schedule.pro_count[2, 1])
+    attached.close()
+
+
+def test_attach_waits_until_the_block_is_ready():
+    schedule = generate()
+    name = f"test_{uuid.uuid4().hex[:8]}"
+    block = SharedMemory(name=name, create=True, size=SharedHitSchedule.nbytes(3, 2))
+    try:
+        with pytest.raises(TimeoutError):
+            SharedHitSchedule.attach(name, timeout=0.05)
+
+        writer = threading.Timer(0.05, SharedHitSchedule._write, (block, schedule))
+        writer.start()
+        attached = SharedHitSchedule.attach(name, timeout=2)
+        writer.join()
+        assert np.array_equal(attached.pro_max, schedule.pro_max)
+        assert np.array_equal(attached.row(1, 0), schedule.pro_count[1, 0])
+        attached.close()
+    finally:
+        block.close()
+        block.unlink()
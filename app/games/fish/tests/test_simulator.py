@@ -0,0 +1,61 @@
+import json
+
+import numpy as np
+
+from app.games.fish.simulator import (
+    SimulationSpec,
+    pool_limit,
+    simulate,
+    write_report,
+)
+
+fish = [
+    {"fishType": 0, "coin": 0, "outPro": 0},
+    {"fishType": 14, "coin": 2, "outPro": 5, "difficulty": 100},
+    {"fishType": 22, "coin": 20, "outPro": 10, "difficulty": 2000},
+]
+
+
+def test_runs_are_reproducible_from_the_seed():
+    spec = SimulationSpec(fish=fish, shots=50_000, sample_every=10_000)
+
+    first, second = simulate(spec, runs=2, seed=3, workers=1), simulate(
+        spec, runs=2, seed=3, workers=1
+    )
+
+    assert [run.seed for run in first] == [run.seed for run in second]
+    assert first[0].seed != first[1].seed
+    assert np.array_equal(first[0].win, second[0].win)
+    assert first[0].shots.sum() == 50_000
+    assert [shot for shot, _, _ in first[0].trajectory] == list(range(0, 50_001, 10_000))
+
+
+def test_game_rule_pays_through_the_rtp_aggregate():
+    (paying,) = simulate(SimulationSpec(fish=fish, shots=20_000), seed=1)
+    (gated,) = simulate(
+        SimulationSpec(fish=fish, shots=20_000, rtp_user_min=10**12), seed=1
+    )
+
+    assert paying.kills.sum() > 0
+    assert paying.trajectory[-1][2] == paying.win.sum()
+    assert gated.kills.sum() == 0 and gated.rtp == 0
+
+
+def test_report_files(tmp_path):
+    spec = SimulationSpec(fish=fish, shots=20_000, rule="legacy", sample_every=5_000)
+
+    summary = write_report(str(tmp_path), spec, simulate(spec, runs=2, seed=0, workers=1))
+
+    assert [row["fishType"] for row in summary["fish"]] == [14, 22]
+    assert summary["shots"] == 40_000
+    assert all(row["variance"] >= 0 for row in summary["fish"])
+    assert json.loads((tmp_path / "report.json").read_text()) == summary
+    assert len((tmp_path / "trajectory.csv").read_text().splitlines()) == 1 + 2 * 5
+
+
+def test_pool_limit_matches_click_odd_tiers():
+    tiers = ((10, 5, 2, 1, 10), (20, 10, 3, 2, 20))
+
+    assert pool_limit(0, tiers) == 20
+    assert pool_limit(14, tiers) == 2
+    assert pool_limit(25, tiers) == 10
@@ -0,0 +1,72 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.games.fish.spawn_sampler import AliasTable, SpawnSampler
+
+
+def test_alias_table_matches_weights():
+    weights = [1, 2, 3, 4]
+    table = AliasTable([10, 20, 30, 40], weights)
+    draws = table.draw_many(200_000, np.random.default_rng(0))
+    values, counts = np.unique(draws, return_counts=True)
+    assert values.tolist() == [10, 20, 30, 40]
+    assert np.allclose(counts / counts.sum(), np.array(weights) / 10, atol=0.01)
+
+
+def test_alias_table_rejects_bad_weights():
+    with pytest.raises(ValueError):
+        AliasTable([1, 2], [0, 0])
+    with pytest.raises(ValueError):
+        AliasTable([1, 2], [1])
+
+
+def test_guaranteed_fish_spawns_when_due():
+    sampler = SpawnSampler(
+        fish_types=[1, 2, 25],
+        weights=[1000, 1000, 0.0001],
+        guarantees={25: 5},
+        rng=np.random.default_rng(1),
+    )
+    spawned = [sampler.spawn(tick) for tick in range(1, 21)]
+    assert [tick for tick, fish in enumerate(spawned, 1) if 25 in fish] == [5, 10, 15, 20]
+
+
+def test_spawn_k_fish_at_once():
+    sampler = SpawnSampler([1, 2, 3], [1, 1, 1], rng=np.random.default_rng(2))
+    fish = sampler.spawn(tick=1, k=2)
+    assert len(fish) == 2
+    assert set(fish) <= {1, 2, 3}
+
+
+def test_from_fish_skips_rows_without_out_pro():
+    rows = [
+        SimpleNamespace(fishType=1.0, outPro=5.0),
+        SimpleNamespace(fishType=2.0, outPro=0.0),
+        SimpleNamespace(fishType=3.0, outPro=None),
+    ]
+    sampler = SpawnSampler.from_fish(rows, rng=np.random.default_rng(3))
+    assert sampler.table.values.tolist() == [1]
+    assert sampler.spawn(tick=1, k=3) == [1, 1, 1]
+
+
+def test_from_fish_derives_guarantees_and_featured_shares():
+    rows = [
+        SimpleNamespace(fishType=1.0, outPro=100.0),
+        SimpleNamespace(fishType=2.0, outPro=300.0),
+        SimpleNamespace(fishType=24.0, outPro=50.0),
+        SimpleNamespace(fishType=25.0, outPro=7.0),
+    ]
+    sampler = SpawnSampler.from_fish(rows, rng=np.random.default_rng(4))
+    assert sampler.guarantees == {1: 100, 2: 300, 24: 50, 25: 7}
+
+    draws = sampler.table.draw_many(300_000, np.random.default_rng(5))
+    share = {t: float(np.mean(draws == t)) for t in (1, 2, 24, 25)}
+    assert share[24] == pytest.approx(1 / 3, abs=0.01)
+    assert share[25] == pytest.approx(1 / 3, abs=0.01)
+    assert share[2] == pytest.approx(3 * share[1], rel=0.05)
+
+    ticks = [tick for tick in range(1, 200) if 25 in sampler.spawn(tick)]
+    assert ticks[0] <= 7 and max(b - a for a, b in zip(ticks, ticks[1:])) <= 7
+    assert SpawnSampler.from_fish(rows, guarantees={}).guarantees == {}
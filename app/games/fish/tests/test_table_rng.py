@@ -0,0 +1,39 @@
+import numpy as np
+
+from app.games.fish.spawn_sampler import AliasTable
+from app.games.fish.table_rng import TableStream
+
+
+def test_blocks_match_the_plain_generator():
+    stream = TableStream(seed=42, block_size=8)
+    expected = np.random.Generator(np.random.PCG64(42)).random(20)
+
+    drawn = [stream.random() for _ in range(5)] + stream.random(15).tolist()
+
+    assert np.allclose(drawn, expected)
+    assert stream.draws == 20
+
+
+def test_replay_continues_from_the_recorded_position():
+    stream = TableStream(seed=7, block_size=16)
+    for _ in range(3):
+        stream.randint(1, 25)
+        stream.random(11)
+    state = stream.state()
+
+    replayed = TableStream.replay(state["seed"], state["draws"], block_size=16)
+
+    assert replayed.draws == stream.draws
+    assert stream.random(40).tolist() == replayed.random(40).tolist()
+
+
+def test_integers_follow_the_generator_signature():
+    stream = TableStream(seed=1)
+
+    assert 0 <= stream.integers(5) < 5
+    assert 3 <= stream.randint(3, 5) <= 5
+    bounded = stream.integers(0, np.array([[1], [10]]), size=(2, 3))
+    assert bounded.shape == (2, 3) and (bounded[0] == 0).all() and (bounded < 10).all()
+
+    table = AliasTable([1, 2], [1, 3])
+    assert set(table.draw_many(100, stream).tolist()) <= {1, 2}
@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from app.games.fish.tick_engine import TableTicker, TickEngine
+
+
+class FakeClock:
+    """
+    A clock that only moves when slept on or advanced, so ticks land exactly
+    where they are due.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    async def sleep(self, seconds):
+        self.now += seconds
+        await asyncio.sleep(0)
+
+
+async def stop_when(done, stop):
+    await done.wait()
+    await stop()
+
+
+def test_ticks_stay_on_schedule():
+    clock = FakeClock()
+    ticks = []
+
+    async def main():
+        done = asyncio.Event()
+
+        async def on_tick(table, tick, count):
+            ticks.append((tick, count, clock.now))
+            clock.advance(0.05)
+            if tick == 20:
+                done.set()
+
+        engine = TickEngine(tick_rate=8, clock=clock, sleep=clock.sleep)
+        engine.start_table("room", on_tick)
+        await stop_when(done, engine.stop_all)
+
+    asyncio.run(main())
+
+    assert [(tick, count) for tick, count, _ in ticks[:20]] == [
+        (tick, 1) for tick in range(1, 21)
+    ]
+    assert [now for _, _, now in ticks[:20]] == pytest.approx(
+        [tick * 0.125 for tick in range(1, 21)]
+    )
+
+
+def test_missed_ticks_are_caught_up_in_one_batch():
+    clock = FakeClock()
+    batches = []
+
+    async def main():
+        done = asyncio.Event()
+
+        async def on_tick(table, tick, count):
+            batches.append(count)
+            if tick == 1:
+                clock.advance(0.55)
+            if len(batches) == 3:
+                done.set()
+
+        ticker = TableTicker(
+            "room",
+            on_tick,
+            tick_rate=8,
+            max_catch_up=3,
+            clock=clock,
+            sleep=clock.sleep,
+        )
+        ticker.start()
+        await stop_when(done, ticker.stop)
+        return ticker
+
+    ticker = asyncio.run(main())
+
+    assert batches[:3] == [1, 3, 1]
+    assert ticker.tick == sum(batches)
+
+
+def test_events_fire_once_per_missed_period():
+    fired = []
+
+    async def on_tick(table, tick, count):
+        pass
+
+    async def event(tick):
+        fired.append(tick)
+
+    async def main():
+        ticker = TableTicker("room", on_tick)
+        ticker.schedule(event, at_tick=2, every=3)
+        ticker.tick = 9
+        await ticker._fire_events()
+        ticker.tick = 11
+        await ticker._fire_events()
+        return ticker
+
+    ticker = asyncio.run(main())
+
+    assert fired == [9, 11]
+    assert ticker.events[0][0] == 14
@@ -0,0 +1,208 @@
+"""
+@author: Kuro
+@github: slapglif
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional
+
+from settings import Config
+
+logger = logging.getLogger("tick_engine")
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.DEBUG)
+
+# on_tick(table, tick, count): count is above 1 when missed ticks are caught up.
+TickHandler = Callable[[Hashable, int, int], Awaitable[None]]
+# on_scene(table, scene_type)
+SceneHandler = Callable[[Hashable, int], Awaitable[None]]
+Clock = Callable[[], float]
+Sleep = Callable[[float], Awaitable[None]]
+
+SCENE_TYPES = 3
+
+
+class TableTicker:
+    """
+    The TableTicker class drives one table. Ticks are due at fixed offsets
+    from the start on the loop's monotonic clock, so the time spent in the
+    handler or a late wake-up never pushes the following ticks back. When the
+    ticker wakes up more than a tick late, every missed tick is handed to the
+    handler as one batch, up to max_catch_up.
+
+    Scheduled events such as scene changes live in a heap keyed by the tick
+    they are due on and fire once even if several of their periods were
+    missed. The clock and sleep default to the loop's and can be swapped for
+    a fake one.
+    """
+
+    def __init__(
+        self,
+        table: Hashable,
+        on_tick: TickHandler,
+        tick_rate: float = Config.tick_rate,
+        max_catch_up: int = Config.tick_max_catch_up,
+        clock: Optional[Clock] = None,
+        sleep: Sleep = asyncio.sleep,
+    ):
+        self.table = table
+        self.on_tick = on_tick
+        self.interval = 1 / tick_rate
+        self.max_catch_up = max_catch_up
+        self.clock = clock
+        self.sleep = sleep
+        self.tick = 0
+        self.started_at: Optional[float] = None
+        self.events: List[tuple] = []
+        self.sequence = itertools.count()
+        self.task: Optional[asyncio.Task] = None
+
+    def schedule(
+        self,
+        callback: Callable[[int], Awaitable[None]],
+        at_tick: int,
+        every: Optional[int] = None,
+    ) -> None:
+        """
+        The schedule function registers an event on the table's timeline.
+
+        :param callback: Awaited with the tick the event fired on
+        :param at_tick: The tick the event is first due on
+        :param every: Repeat every that many ticks, or run once when None
+        """
+        heapq.heappush(self.events, (at_tick, next(self.sequence), callback, every))
+
+    def schedule_scenes(
+        self,
+        on_scene: SceneHandler,
+        seconds: float = Config.scene_change_seconds,
+        scene_type: int = 0,
+    ) -> None:
+        """
+        The schedule_scenes function changes the scene every seconds, aligned
+        on the wall clock like the legacy job that fired on minute % 20 == 0.
+
+        :param on_scene: Awaited with the table and the new scene type
+        :param seconds: The time between two scene changes
+        :param scene_type: The current scene type
+        """
+        scene = itertools.count(scene_type + 1)
+        every = max(round(seconds / self.interval), 1)
+        first = max(round((seconds - time.time() % seconds) / self.interval), 1)
+
+        async def change_scene(_tick: int) -> None:
+            await on_scene(self.table, next(scene) % SCENE_TYPES)
+
+        self.schedule(change_scene, self.tick + first, every)
+
+    async def _fire_events(self) -> None:
+        while self.events and self.events[0][0] <= self.tick:
+            due, _, callback, every = heapq.heappop(self.events)
+            if every:
+                missed = (self.tick - due) // every
+                self.schedule(callback, due + (missed + 1) * every, every)
+            try:
+                await callback(self.tick)
+            except Exception as e:
+                logger.exception(f"event of table {self.table} failed: {e}")
+
+    async def run(self) -> None:
+        clock = self.clock or asyncio.get_running_loop().time
+        self.started_at = clock() - self.tick * self.interval
+        while True:
+            deadline = self.started_at + (self.tick + 1) * self.interval
+            await self.sleep(max(deadline - clock(), 0))
+            due = int((clock() - self.started_at) / self.interval) - self.tick
+            if due <= 0:
+                continue
+            if due > self.max_catch_up:
+                logger.warning(
+                    f"table {self.table} dropped {due - self.max_catch_up} ticks"
+                )
+                self.started_at += (due - self.max_catch_up) * self.interval
+                due = self.max_catch_up
+            self.tick += due
+            try:
+                await self.on_tick(self.table, self.tick, due)
+            except Exception as e:
+                logger.exception(f"tick {self.tick} of table {self.table} failed: {e}")
+            await self._fire_events()
+
+    def start(self) -> asyncio.Task:
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run())
+        return self.task
+
+    async def stop(self) -> None:
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+class TickEngine:
+    """
+    The TickEngine class keeps one TableTicker task per active table on the
+    socket server's event loop, replacing the schedule + time.sleep loop of
+    the fish scene job that blocked every socket handler.
+    """
+
+    def __init__(
+        self,
+        tick_rate: float = Config.tick_rate,
+        max_catch_up: int = Config.tick_max_catch_up,
+        clock: Optional[Clock] = None,
+        sleep: Sleep = asyncio.sleep,
+    ):
+        self.tick_rate = tick_rate
+        self.max_catch_up = max_catch_up
+        self.clock = clock
+        self.sleep = sleep
+        self.tables: Dict[Hashable, TableTicker] = {}
+
+    def start_table(
+        self,
+        table: Hashable,
+        on_tick: TickHandler,
+        on_scene: Optional[SceneHandler] = None,
+        scene_seconds: float = Config.scene_change_seconds,
+    ) -> TableTicker:
+        """
+        The start_table function starts ticking a table, or returns its ticker
+        when it already runs.
+
+        :param table: The key of the table
+        :param on_tick: Awaited with the table, the tick and the ticks it covers
+        :param on_scene: Awaited with the table and the scene type on scene changes
+        :param scene_seconds: The time between two scene changes
+        :return: The table's TableTicker
+        """
+        if (ticker := self.tables.get(table)) is None:
+            ticker = self.tables[table] = TableTicker(
+                table,
+                on_tick,
+                self.tick_rate,
+                self.max_catch_up,
+                self.clock,
+                self.sleep,
+            )
+            if on_scene is not None:
+                ticker.schedule_scenes(on_scene, scene_seconds)
+        ticker.start()
+        return ticker
+
+    async def stop_table(self, table: Hashable) -> None:
+        if ticker := self.tables.pop(table, None):
+            await ticker.stop()
+
+    async def stop_all(self) -> None:
+        await asyncio.gather(*(self.stop_table(table) for table in list(self.tables)))
+
+
+tick_engine = TickEngine()
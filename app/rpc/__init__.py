@@ -7,6 +7,16 @@ from uvicorn import run
 import logging
 
 from app.endpoints.routes import add_socket_routes
+from app.games.fish.ledger import bet_ledger
+from app.rpc.codec import connection_codecs
+from app.rpc.game.rooms import room_registry
+from app.rpc.game.tables import table_router
+from app.rpc.manager import client_manager
+from app.rpc.presence import presence
+from app.rpc.rate_limit import rate_limiter
+from app.rpc.sessions import connection_token, session_store
+from app.shared.auth.token_cache import token_cache
+from app.shared.probability.rtp import RtpAccounts
 
 logging.basicConfig(
     level=logging.DEBUG,
@@ -18,21 +28,61 @@ logger = logging.getLogger(__name__)
 logger.addHandler(logging.StreamHandler())
 logger.setLevel(logging.DEBUG)
 
-socket = AsyncServer(async_mode="asgi")
-app = ASGIApp(socketio_server=socket)
+
+async def startup():
+    """
+    The startup function hashes the access tokens stored before
+    User.accessTokenHash existed, so their holders resolve without logging in
+    again. Later tokens are hashed when issued. It also starts the presence
+    loop of the worker.
+    """
+    token_cache.backfill()
+    presence.start()
+
+
+async def shutdown():
+    """
+    The shutdown function writes what the worker still holds in memory before
+    it exits.
+    """
+    await bet_ledger.stop()
+    RtpAccounts.close_all()
+    await presence.stop()
+    await table_router.stop()
+
+
+socket = AsyncServer(async_mode="asgi", client_manager=client_manager())
+app = ASGIApp(socketio_server=socket, on_startup=startup, on_shutdown=shutdown)
 socket = add_socket_routes(socket)
 
 
 @socket.on("connect")
-async def connect(sid, environ):
-    print("connect ", sid)
+async def connect(sid, environ, auth=None):
+    logger.info(f"connect {sid}")
+    connection_codecs.negotiate(
+        sid,
+        connection_codecs.offered(environ, auth),
+        connection_codecs.wants_batches(environ, auth),
+    )
+    user_id = await token_cache.resolve(connection_token(environ, auth))
+    if await session_store.restore(sid, user_id) is None:
+        session_store.open(sid)
     await socket.emit("my_response", {"data": "Connected", "count": 0}, room=sid)
-    print("envrionment: \n", environ)
 
 
 @socket.on("disconnect")
 async def disconnect(sid):
-    print("disconnect ", sid)
+    logger.info(f"disconnect {sid}")
+    await connection_codecs.close(sid)
+    rate_limiter.release(sid)
+    record = session_store.drop(sid)
+    if record and record.game_id is not None and record.user_id:
+        await room_registry.release(record.game_id, record.user_id)
+        await table_router.dispatch(record.table, "unseat", {"user_id": record.user_id})
+    if record:
+        # The seat was given back above, only the login outlives the socket.
+        record.leave()
+        await session_store.persist(record)
 
 
 #
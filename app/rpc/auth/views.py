@@ -4,7 +4,6 @@
 import json
 import logging
 
-from py_linq import Enumerable
 
 
 from app.api.auth.schema import (
@@ -15,20 +14,20 @@ from app.api.auth.schema import (
 )
 from app.api.auth.views import start_otp_login, verify_otp_login
 from app.api.user.models import User
-from app.rpc.user.schema import User as UserSchema
 from app.rpc.user.schema import UserResponse
-from app.rpc.game.schema import Session, SocketSession
 from app.shared.middleware.json_encoders import ModelEncoder
 from app.rpc import socket
+from app.rpc.presence import presence
+from app.rpc.rate_limit import rate_limiter
+from app.rpc.sessions import connection_token, session_store
+from app.shared.auth.token_cache import token_cache
 
 logger = logging.getLogger("auth")
 logger.addHandler(logging.StreamHandler())
 logger.setLevel(logging.DEBUG)
 
-default_session = {"sid": None, "state": None}
-
-
 @socket.on("getOTP")
+@rate_limiter.limit("getOTP")
 async def get_OTP(socket_id, context: OTPLoginStart) -> OTPLoginStartResponse:
     """
     This function gets an OTP for login and emits it through a socket.
@@ -43,25 +42,17 @@ async def get_OTP(socket_id, context: OTPLoginStart) -> OTPLoginStartResponse:
     `OTPLoginStartResponse`.
     """
     context = OTPLoginStart(**context)
-    socket_session = await socket.get_session(socket_id)
-    if not socket_session:
-        socket_session = SocketSession.construct(
-            **{context.phoneNumber: default_session}
-        )
-        logger.info(f"session: {socket_session}")
-
-    session = Session(**socket_session.dict().get(context.phoneNumber))
-    if session.state != "sms_wait":
+    record = session_store.open(socket_id)
+    if record.state != "sms_wait" or record.phone_number != context.phoneNumber:
         response: OTPLoginStartResponse = await start_otp_login(context)
-        session.sid = socket_id
-        session.state = "sms_wait"
-        socket_session = socket_session.update_session(session)
-        await socket.save_session(socket_id, socket_session.dict())
-        await socket.emit("getOTP", data=response.dict())
+        record.phone_number = context.phoneNumber
+        record.state = "sms_wait"
+        await socket.emit("getOTP", data=response.dict(), to=socket_id)
     return OTPLoginStartResponse(success=False, error="SMS already sent")
 
 
 @socket.on("verifySMS")
+@rate_limiter.limit("verifySMS")
 async def verify_SMS(socket_id, context: OTPLoginVerify) -> TokenResponse:
     """
     The function verifies a user's login using a one-time password
@@ -76,68 +67,70 @@ async def verify_SMS(socket_id, context: OTPLoginVerify) -> TokenResponse:
     :return: a variable named "result" which is of type TokenResponse.
     """
     context = OTPLoginVerify(**context)
-    socket_session = SocketSession.construct(**await socket.get_session(socket_id))
-    session = Session(**socket_session.dict().get(context.phoneNumber))
+    record = session_store.open(socket_id)
     result = TokenResponse(success=False, error="SMS not sent")
-    logger.info(f"session: {session}")
-    if session.state == "sms_wait":
+    logger.info(f"session: {record}")
+    if record.state == "sms_wait" and record.phone_number == context.phoneNumber:
         result: TokenResponse = await verify_otp_login(context)
 
         if result.success:
-            session.state = "login_success"
-            session.user = UserSchema(**result.response.user_claim.dict())
-            session.user.accessToken = result.response.access_token
-            user = User.read(id=session.user.id)
-            await update_online_users(user)
+            record.state = "login_success"
+            record.user_id = result.response.user_claim.id
+            record.access_token = result.response.access_token
+            await update_online_users(record.user_id)
 
         if not result.success:
-            session.state = "login_failure"
-
-        socket_session = socket_session.update_session(session)
-        await socket.save_session(socket_id, socket_session.dict())
+            record.state = "login_failure"
 
-    await socket.emit("loginResult", result.dict())
+    await socket.emit("loginResult", result.dict(), to=socket_id)
     return TokenResponse(success=False, error="SMS not sent")
 
 
-async def update_online_users(user, online=True):
+async def update_online_users(user_id: int, online=True):
     """
-    This function updates the online status of a user, retrieves a list of online users, logs the list, stores the list in Redis, and returns the list.
+    This function marks a user online or offline in the presence set and
+    returns the online users. User.online is written behind by the presence
+    flusher, so a login or logout no longer reloads every online user.
 
-    :param user: The "user" parameter is an instance of a user model object that represents a user in the system. It is used to update the user's online status and retrieve a list of
-    all online users
-    :param online: The "online" parameter is a boolean value that indicates whether the user is currently online or not. If it is set to True, it means the user is online, and if it is
-    set to False, it means the user is offline. The function updates the "online" attribute of the user, defaults to True (optional)
-    :return: a list of online users, which are instances of the `UserSchema` class.
+    :param user_id: The id of the user logging in or out
+    :param online: True on login, False on logout, defaults to True (optional)
+    :return: The ids of the online users, most recently seen first
     """
-    user.update(**dict(online=online))
-    user.session.commit()
-    online_users = [
-        json.dumps(UserSchema.from_orm(user).dict(), cls=ModelEncoder)
-        for user in User.read_all(online=True)
-    ]
-    logger.info(f"online users: {online_users}")
-    await redis.set("online_users", json.dumps(online_users, cls=ModelEncoder))
+    await (presence.online if online else presence.offline)(user_id)
+    online_users = await presence.online_users()
+    logger.info(f"online users: {await presence.count()}")
     return online_users
 
 
-def get_auth_token(socket):
+@socket.on("heartbeat")
+@rate_limiter.limit("heartbeat")
+async def heartbeat(socket_id):
     """
-    This function retrieves the authorization token from a socket object.
+    The heartbeat function keeps the user of a socket online right away.
+    Clients do not have to send it: the worker refreshes the users of its
+    open sockets on its own, and a user is taken offline presence_ttl seconds
+    after their last connection closed.
+
+    :param socket_id: The id of the socket
+    """
+    if (record := session_store.get(socket_id)) and record.user_id:
+        await presence.heartbeat(record.user_id)
+
+
+def get_auth_token(socket, socket_id):
+    """
+    This function retrieves the authorization token of a socket connection.
 
     :param socket: The `socket` parameter is an object representing a WebSocket connection. It is likely an instance of the `SocketIO` class from the `socketio` library in Python
+    :param socket_id: The id of the socket whose token is read
     :return: The function `get_auth_token` returns the authentication token from the `HTTP_AUTHORIZATION` header of the socket's environment. The token is extracted from the header by
-    splitting the header string at the space character and returning the second element of the resulting list.
+    splitting the header string at the space character and returning the second element of the resulting list, or None when the socket sent no token.
     """
-    return (
-        Enumerable(socket.environ.values())
-        .select(lambda x: x["HTTP_AUTHORIZATION"])
-        .first()
-        .split(" ")[1]
-    )
+    return connection_token(socket.get_environ(socket_id))
 
 
 @socket.on("login")
+@rate_limiter.limit("login")
 async def log_in(socket_id, _context) -> UserResponse:
     """
     The function logs in a user by checking their access token
@@ -150,35 +143,29 @@ async def log_in(socket_id, _context) -> UserResponse:
     :return: a `BaseResponse` object.
     """
     logger.info("login")
-    socket.emit("loginResult", "login")
-    token = get_auth_token(socket)
-    socket_session = SocketSession.construct(**await socket.get_session(socket_id))
-    user = None
-    if token:
-        user = User.read(accessToken=token)
-        logger.info(f"user: {json.dumps(user.to_dict(), cls=ModelEncoder)}")
-
-    for session in socket_session.dict().values():
-        if access_token := session["user"].get("accessToken"):
-            user = User.read(accessToken=access_token)
-            logger.info(f"user: {user} - {socket_session}")
-            break
+    token = get_auth_token(socket, socket_id)
+    record = session_store.open(socket_id)
+    user_id = await token_cache.resolve(token)
+    if record.access_token:
+        user_id = await token_cache.resolve(record.access_token)
 
+    user = User.read(id=user_id) if user_id else None
     if user:
-        socket_session = SocketSession.construct(socket.session(socket_id))
+        logger.info(f"user: {json.dumps(user.to_dict(), cls=ModelEncoder)}")
         response = UserResponse(success=True, response=user)
-        session = Session(sid=socket_id, user=user, state="login_success")
-        socket_session = socket_session.dict()
-        socket_session[user.phoneNumber] = session.json()
-        logger.info(socket_session)
-        await update_online_users(user)
-        await socket.save_session(socket_id, socket_session)
-        await socket.emit("loginResult", response.json())
+        record.user_id = user.id
+        record.phone_number = user.phoneNumber
+        record.access_token = user.accessToken
+        record.state = "login_success"
+        logger.info(record)
+        await update_online_users(user.id)
+        await socket.emit("loginResult", response.json(), to=socket_id)
 
         return response
 
 
 @socket.on("logout")
+@rate_limiter.limit("logout")
 async def log_out(socket_id):
     """
     The function logs out a user by setting their access token to None.
@@ -191,11 +178,19 @@ async def log_out(socket_id):
     :type accessToken: str
     :return: Nothing is being returned explicitly in this function. The function simply updates the access token of a user to None and saves the changes to the database.
     """
-    token = get_auth_token(socket)
+    token = get_auth_token(socket, socket_id)
 
-    user = User.where(accessToken=token).first()
-    await update_online_users(user, online=False)
+    user_id = await token_cache.resolve(token)
+    if not (user := User.read(id=user_id) if user_id else None):
+        return
+    await update_online_users(user.id, online=False)
     user.accessToken = None
+    user.accessTokenHash = None
     user.save()
-    await socket.emit("logoutResult", user.id)
+    await token_cache.forget(token)
+    if record := session_store.get(socket_id):
+        record.user_id = None
+        record.access_token = None
+        record.state = None
+    await socket.emit("logoutResult", user.id, to=socket_id)
     return
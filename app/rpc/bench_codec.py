@@ -0,0 +1,117 @@
+"""
+@author: Kuro
+
+Encode/decode benchmark of the binary socket codec against the JSON path the
+events always took (pydantic .dict() then json.dumps, as socket.io does):
+
+    python -m app.rpc.bench_codec --number 20000
+
+It prints the frame size and the time per encode and decode of each hot
+event, with --json for a machine-readable report.
+"""
+import argparse
+import json
+import timeit
+from typing import Dict, List
+
+from app.api.credit.schema import UserCredit
+from app.games.fish.schema import Fish, PoolInfo
+from app.rpc.codec import CODECS, decode, encode
+from app.rpc.game.schema import PlayerBet
+
+
+def samples(hits: int = 32) -> Dict[str, object]:
+    return {
+        "FishOut": Fish(
+            fish_id=123456,
+            fish_type=17,
+            fish_path="path-0042",
+            coin=300,
+            fish_count=1,
+        ),
+        "fish_hit": [
+            {"user_id": 1000 + i, "reward_id": 17, "win": 300 * (i % 3)}
+            for i in range(hits)
+        ],
+        "pool": PoolInfo(pool=1_250_000, virtualPool=250_000),
+        "loginRoom": PlayerBet(
+            id=42,
+            game_id=7,
+            balance=UserCredit(balance=10_250.5),
+            winscore=1200,
+            betscore=900,
+            betline=9,
+            ip="203.0.113.24",
+        ),
+    }
+
+
+def _json_encode(payload):
+    if isinstance(payload, list):
+        return json.dumps(payload)
+    return json.dumps(payload.dict(), default=str)
+
+
+def bench(number: int = 20000, version: int = max(CODECS)) -> List[dict]:
+    """
+    The bench function times both paths for every sample event.
+
+    :param number: The encodes and decodes timed per event and path
+    :param version: The codec version to benchmark
+    :return: One row per event
+    """
+    rows = []
+    for event, payload in samples().items():
+        frame = encode(version, event, payload)
+        text = _json_encode(payload)
+        assert decode(frame)[0] == event
+        row = {
+            "event": event,
+            "json_bytes": len(text.encode()),
+            "binary_bytes": len(frame),
+            "json_encode_us": timeit.timeit(lambda: _json_encode(payload), number=number)
+            / number
+            * 1e6,
+            "binary_encode_us": timeit.timeit(
+                lambda: encode(version, event, payload), number=number
+            )
+            / number
+            * 1e6,
+            "json_decode_us": timeit.timeit(lambda: json.loads(text), number=number)
+            / number
+            * 1e6,
+            "binary_decode_us": timeit.timeit(lambda: decode(frame), number=number)
+            / number
+            * 1e6,
+        }
+        row["size_ratio"] = row["binary_bytes"] / row["json_bytes"]
+        rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--number", type=int, default=20000)
+    parser.add_argument("--version", type=int, default=max(CODECS))
+    parser.add_argument("--json", action="store_true", help="print JSON rows")
+    args = parser.parse_args()
+
+    rows = bench(args.number, args.version)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(
+        f"{'event':<10} {'bytes json/bin':>15} {'encode us json/bin':>20} "
+        f"{'decode us json/bin':>20}"
+    )
+    for row in rows:
+        print(
+            f"{row['event']:<10} "
+            f"{row['json_bytes']:>7}/{row['binary_bytes']:<7} "
+            f"{row['json_encode_us']:>9.2f}/{row['binary_encode_us']:<10.2f} "
+            f"{row['json_decode_us']:>9.2f}/{row['binary_decode_us']:<10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
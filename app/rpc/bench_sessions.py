@@ -0,0 +1,122 @@
+"""
+@author: Kuro
+
+Memory-per-connection benchmark of the socket session store against the
+pydantic sessions the handlers used to keep:
+
+    python -m app.rpc.bench_sessions --sessions 50000
+
+The legacy side holds, per connection, the socket.io session dict of a
+logged-in player seated at a table ({phoneNumber: Session.dict()} with its
+User schema) and rebuilds the Session model on every event, as login_room
+and verify_SMS did. The new side holds one SessionRecord per sid.
+"""
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict
+
+import pytz
+
+from app.api.user.schema import User
+from app.rpc.game.schema import GameRoom, Session
+from app.rpc.sessions import SessionStore
+
+
+def legacy_session(i: int) -> dict:
+    phone_number = f"+1480{i:07d}"
+    user = User(
+        id=i,
+        phone=phone_number,
+        firstName="Player",
+        lastName=f"{i}",
+        username=f"player{i}",
+        createdAt=datetime.now(pytz.utc),
+        active=True,
+    )
+    session = Session(
+        sid=f"sid-{i:012d}",
+        state="login_success",
+        user=user,
+        game={
+            "game_id": 7,
+            "room": GameRoom(game_id=7, room_name=f"7-{i // 4}", players=[]),
+        },
+    )
+    return {phone_number: session.dict()}
+
+
+def fill_legacy(count: int) -> Dict[str, dict]:
+    return {f"sid-{i:012d}": legacy_session(i) for i in range(count)}
+
+
+def fill_store(count: int) -> SessionStore:
+    store = SessionStore()
+    for i in range(count):
+        record = store.open(f"sid-{i:012d}")
+        record.user_id = i
+        record.phone_number = f"+1480{i:07d}"
+        record.access_token = None
+        record.state = "login_success"
+        record.join(7, f"7-{i // 4}", i % 4)
+    return store
+
+
+def measure(fill: Callable[[int], object], count: int):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sessions = fill(count)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return sessions, (after - before) / count
+
+
+def bench(count: int = 50000, events: int = 20000) -> dict:
+    """
+    The bench function measures the memory per connection of both stores
+    and the time an event spends reading and updating its session.
+
+    :param count: The number of connections
+    :param events: The number of events timed
+    :return: The results
+    """
+    legacy, legacy_bytes = measure(fill_legacy, count)
+    store, store_bytes = measure(fill_store, count)
+
+    sids = [f"sid-{i % count:012d}" for i in range(events)]
+    started = time.perf_counter()
+    for sid in sids:
+        session = Session(**next(iter(legacy[sid].values())))
+        session.state = "in_room"
+    legacy_event_us = (time.perf_counter() - started) / events * 1e6
+
+    started = time.perf_counter()
+    for sid in sids:
+        store.get(sid).state = "in_room"
+    store_event_us = (time.perf_counter() - started) / events * 1e6
+
+    return {
+        "sessions": count,
+        "legacy_bytes_per_session": round(legacy_bytes),
+        "record_bytes_per_session": round(store_bytes),
+        "legacy_total_mb": round(legacy_bytes * count / 2**20, 1),
+        "record_total_mb": round(store_bytes * count / 2**20, 1),
+        "legacy_event_us": round(legacy_event_us, 2),
+        "record_event_us": round(store_event_us, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--sessions", type=int, default=50000)
+    parser.add_argument("--events", type=int, default=20000)
+    args = parser.parse_args()
+    print(json.dumps(bench(args.sessions, args.events), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+@author: Kuro
+"""
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.rpc.codec import (
+    ConnectionCodecs,
+    connection_codecs,
+    encode,
+    encode_batch,
+    to_json,
+)
+from settings import Config
+
+logger = logging.getLogger("broadcast")
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.DEBUG)
+
+
+class RoomQueue:
+    """
+    The RoomQueue class holds the events of a room waiting for the next flush.
+    """
+
+    __slots__ = ("events", "timer")
+
+    def __init__(self):
+        self.events: List[Tuple[str, Any]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class RoomBroadcaster:
+    """
+    The RoomBroadcaster class coalesces the events sent to a room. Events
+    are queued instead of emitted, and a flush sends everything queued for the
+    room as one batch frame per codec: the tick engine flushes its table at
+    the end of every tick, and a room that is not flushed by then goes out
+    flush_ms after its first queued event. A room holding max_events events
+    is flushed at once, so a burst never grows the queue unbounded. Events
+    are only encoded at flush time, once per codec the members of the room
+    use.
+
+    Clients that did not ask for batches get the queued events one by one at
+    flush time, as they do not read batch frames. At every flush, local clients of the room with more than
+    max_backlog packets still waiting in their engine.io queue are
+    disconnected rather than left to buffer without limit.
+    """
+
+    def __init__(
+        self,
+        server=None,
+        codecs: ConnectionCodecs = connection_codecs,
+        flush_ms: float = Config.broadcast_flush_ms,
+        max_events: int = Config.broadcast_max_events,
+        max_backlog: int = Config.broadcast_max_backlog,
+    ):
+        self._server = server
+        self.codecs = codecs
+        self.flush_ms = flush_ms
+        self.max_events = max_events
+        self.max_backlog = max_backlog
+        self.rooms: Dict[Any, RoomQueue] = {}
+        self.flushing: Dict[Any, asyncio.Task] = {}
+        self.sent_batches = 0
+        self.sent_events = 0
+        self.dropped_clients = 0
+
+    @property
+    def server(self):
+        if self._server is None:
+            from app.rpc import socket
+
+            self._server = socket
+        return self._server
+
+    def queue(self, room, event: str, payload) -> None:
+        """
+        The queue function adds an event to the next batch of a room.
+
+        :param room: The room
+        :param event: The name of the event
+        :param payload: A pydantic model, a list of them or plain data
+        """
+        payload = to_json(payload)
+        queue = self.rooms.get(room)
+        if queue is None:
+            queue = self.rooms[room] = RoomQueue()
+        queue.events.append((event, payload))
+        loop = asyncio.get_running_loop()
+        if len(queue.events) >= self.max_events:
+            self._schedule(room, loop)
+        elif queue.timer is None:
+            queue.timer = loop.call_later(
+                self.flush_ms / 1000, self._schedule, room, loop
+            )
+
+    def _schedule(self, room, loop: asyncio.AbstractEventLoop) -> None:
+        if room in self.rooms and room not in self.flushing:
+            self.flushing[room] = loop.create_task(self.flush(room))
+
+    async def flush(self, room) -> int:
+        """
+        The flush function sends the events queued for a room.
+
+        :param room: The room
+        :return: The number of events sent
+        """
+        try:
+            if (queue := self.rooms.pop(room, None)) is None:
+                return 0
+            if queue.timer is not None:
+                queue.timer.cancel()
+            for channel, version, batched in await self.codecs.subscribed(room):
+                if batched:
+                    await self.server.emit(
+                        "batch", encode_batch(version, queue.events), room=channel
+                    )
+                    continue
+                for event, payload in queue.events:
+                    await self.server.emit(
+                        event, encode(version, event, payload), room=channel
+                    )
+            self.sent_batches += 1
+            self.sent_events += len(queue.events)
+            await self._drop_slow_clients(room)
+            return len(queue.events)
+        finally:
+            if self.flushing.get(room) is asyncio.current_task():
+                del self.flushing[room]
+                # Events queued while this flush was sending go out next.
+                if room in self.rooms:
+                    self._schedule(room, asyncio.get_running_loop())
+
+    async def flush_all(self) -> int:
+        return sum(
+            await asyncio.gather(*(self.flush(room) for room in list(self.rooms)))
+        )
+
+    async def _drop_slow_clients(self, room) -> None:
+        manager = self.server.manager
+        if "/" not in manager.rooms:
+            return
+        eio_sockets = getattr(getattr(self.server, "eio", None), "sockets", {})
+        channels = [channel for channel, _, _ in self.codecs.channels(room)]
+        for sid, eio_sid in list(manager.get_participants("/", channels)):
+            eio_socket = eio_sockets.get(eio_sid)
+            if eio_socket is None or eio_socket.queue.qsize() <= self.max_backlog:
+                continue
+            logger.warning(f"dropping slow client {sid} of room {room}")
+            self.dropped_clients += 1
+            await self.server.disconnect(sid)
+
+
+room_broadcaster = RoomBroadcaster()
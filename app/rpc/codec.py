@@ -0,0 +1,541 @@
+"""
+@author: Kuro
+
+Binary codec for the high-frequency socket events. Every frame starts with
+the codec version and an event code, followed by fixed struct records, so
+FishOut, fish_hit, pool and loginRoom payloads carry no key names:
+
+    version u8 | event code u8 | [record count u16] | records
+
+A record is its fixed fields, preceded by a u16 bitmask of the fields that
+are set when the layout has optional fields, then its strings as a u16 byte
+length (0xFFFF for None) and UTF-8 bytes. Field names can be dotted paths
+into nested dicts, e.g. balance.balance.
+
+A batch frame holds several frames of the same version, each behind its u32
+byte length:
+
+    version u8 | 0 u8 | frame count u16 | (length u32 | frame)...
+
+A client asks for the codec when it connects, with auth {"codec": [1]} or
+?codec=1 in the query string. Codec clients get the events of a room
+coalesced into batch frames; JSON clients can ask for batches, sent as a
+list of [event, payload] pairs, with auth {"batch": true} or ?batch=1.
+Clients that ask for neither keep getting the pydantic .dict() payloads as
+JSON, one event at a time. Layouts are never changed in place: a new
+layout is a new version, and the server keeps answering older versions.
+
+JSON is the fallback everywhere, so a client that never negotiated gets
+what every client got before the codec:
+
+- ConnectionCodecs.version() is JSON for a sid negotiate() never kept,
+  which picks JSON itself when the client offers no version it knows.
+  emit(to=sid) then sends the JSON payload, and room_of() puts the client
+  in the plain room, which broadcasts send JSON to one event at a time.
+- encode() and encode_batch() send JSON for an event with no layout in
+  the version, so codec clients still get the events the codec lacks.
+
+Rooms have to be joined through ConnectionCodecs.enter_room, as it counts
+the members that decide which channels a broadcast goes out on.
+"""
+import inspect
+import logging
+import struct
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from urllib.parse import parse_qs
+
+from pydantic import BaseModel
+from redis.asyncio import Redis
+
+from app.rpc.manager import manager_mode
+from settings import Config
+
+logger = logging.getLogger("codec")
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.DEBUG)
+
+JSON = 0
+
+HEADER = struct.Struct("<BB")
+COUNT = struct.Struct("<H")
+LENGTH = struct.Struct("<H")
+FRAME_LENGTH = struct.Struct("<I")
+NULL_STRING = 0xFFFF
+BATCH = 0
+
+
+class CodecError(ValueError):
+    pass
+
+
+def _get(record: dict, path: str):
+    for key in path.split("."):
+        if record is None:
+            return None
+        record = record.get(key)
+    return record
+
+
+def _set(record: dict, path: str, value) -> None:
+    *parents, key = path.split(".")
+    for parent in parents:
+        if value is None:
+            record.setdefault(parent, None)
+            return
+        if record.get(parent) is None:
+            record[parent] = {}
+        record = record[parent]
+    record[key] = value
+
+
+class Layout:
+    """
+    The Layout class is the binary layout of one event in one codec version.
+    """
+
+    def __init__(
+        self,
+        event: str,
+        code: int,
+        fields: Sequence[Tuple[str, str]],
+        strings: Sequence[str] = (),
+        optional: bool = False,
+        repeated: bool = False,
+    ):
+        if optional and len(fields) > 16:
+            raise CodecError(f"{event} has more than 16 optional fields")
+        self.event = event
+        self.code = code
+        self.names = [name for name, _ in fields]
+        self.defaults = [0.0 if fmt in "efd" else 0 for _, fmt in fields]
+        self.strings = list(strings)
+        self.optional = optional
+        self.repeated = repeated
+        self.fields = "".join(fmt for _, fmt in fields)
+        self.record = struct.Struct("<" + ("H" if optional else "") + self.fields)
+        # Records without nested or optional fields or strings are packed and
+        # unpacked a whole batch at a time.
+        self.nested = any("." in name for name in self.names)
+        self.fixed = not (optional or strings or self.nested)
+
+    def _values(self, record: dict) -> list:
+        if self.nested:
+            return [_get(record, name) for name in self.names]
+        return [record.get(name) for name in self.names]
+
+    def _pack_record(self, record: dict, out: List[bytes]) -> None:
+        values = self._values(record)
+        if self.optional:
+            mask = 0
+            for i, value in enumerate(values):
+                if value is None:
+                    values[i] = self.defaults[i]
+                else:
+                    mask |= 1 << i
+            values.insert(0, mask)
+        try:
+            out.append(self.record.pack(*values))
+        except struct.error as e:
+            raise CodecError(f"{self.event}: {e}") from e
+        for name in self.strings:
+            if (value := _get(record, name)) is None:
+                out.append(LENGTH.pack(NULL_STRING))
+                continue
+            data = str(value).encode()
+            if len(data) >= NULL_STRING:
+                raise CodecError(f"{self.event}: {name} is too long")
+            out.append(LENGTH.pack(len(data)))
+            out.append(data)
+
+    def _record(self, values) -> dict:
+        if not self.nested:
+            return dict(zip(self.names, values))
+        record = {}
+        for name, value in zip(self.names, values):
+            _set(record, name, value)
+        return record
+
+    def _unpack_record(self, data: bytes, offset: int) -> Tuple[dict, int]:
+        values = self.record.unpack_from(data, offset)
+        offset += self.record.size
+        if self.optional:
+            mask, *values = values
+            values = [
+                value if mask & (1 << i) else None for i, value in enumerate(values)
+            ]
+        record = self._record(values)
+        for name in self.strings:
+            (length,) = LENGTH.unpack_from(data, offset)
+            offset += LENGTH.size
+            if length == NULL_STRING:
+                _set(record, name, None)
+                continue
+            _set(record, name, data[offset : offset + length].decode())
+            offset += length
+        return record, offset
+
+    def encode(self, version: int, payload) -> bytes:
+        header = HEADER.pack(version, self.code)
+        if not self.repeated:
+            out = [header]
+            self._pack_record(payload, out)
+            return b"".join(out)
+        if len(payload) > 0xFFFF:
+            raise CodecError(f"{self.event}: too many records")
+        if self.fixed:
+            values = [value for record in payload for value in self._values(record)]
+            try:
+                return header + struct.pack(
+                    "<H" + self.fields * len(payload), len(payload), *values
+                )
+            except struct.error as e:
+                raise CodecError(f"{self.event}: {e}") from e
+        out = [header, COUNT.pack(len(payload))]
+        for record in payload:
+            self._pack_record(record, out)
+        return b"".join(out)
+
+    def decode(self, data: bytes, offset: int = HEADER.size):
+        if not self.repeated:
+            return self._unpack_record(data, offset)[0]
+        (count,) = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        if self.fixed:
+            end = offset + count * self.record.size
+            return [
+                self._record(values)
+                for values in self.record.iter_unpack(memoryview(data)[offset:end])
+            ]
+        records = []
+        for _ in range(count):
+            record, offset = self._unpack_record(data, offset)
+            records.append(record)
+        return records
+
+
+CODECS: Dict[int, Dict[str, Layout]] = {
+    1: {
+        layout.event: layout
+        for layout in (
+            # app.games.fish.schema.Fish
+            Layout(
+                "FishOut",
+                1,
+                [
+                    ("fish_id", "I"),
+                    ("fish_type", "H"),
+                    ("coin", "I"),
+                    ("fish_count", "H"),
+                ],
+                strings=["fish_path"],
+                optional=True,
+            ),
+            # TickResolution.results
+            Layout(
+                "fish_hit",
+                2,
+                [("user_id", "I"), ("reward_id", "I"), ("win", "q")],
+                repeated=True,
+            ),
+            # app.games.fish.schema.PoolInfo, or Pool without virtualPool
+            Layout(
+                "pool",
+                3,
+                [("pool", "q"), ("virtualPool", "q")],
+                optional=True,
+            ),
+            # app.rpc.game.schema.PlayerBet, of the balance only the amount
+            Layout(
+                "loginRoom",
+                4,
+                [
+                    ("id", "I"),
+                    ("game_id", "I"),
+                    ("balance.balance", "d"),
+                    ("winscore", "q"),
+                    ("betscore", "q"),
+                    ("betline", "I"),
+                ],
+                strings=["ip"],
+                optional=True,
+            ),
+        )
+    }
+}
+
+
+def to_json(payload):
+    """
+    The to_json function turns a payload into what the JSON clients get,
+    the .dict() of pydantic models as the events always sent.
+
+    :param payload: A pydantic model, a list of them or plain data
+    :return: The JSON payload
+    """
+    if isinstance(payload, BaseModel):
+        return payload.dict()
+    if isinstance(payload, (list, tuple)):
+        return [to_json(item) for item in payload]
+    return payload
+
+
+def encode(version: int, event: str, payload) -> Any:
+    """
+    The encode function encodes an event for a codec version. Events without
+    a layout in the version are sent as JSON.
+
+    :param version: The codec version, JSON for none
+    :param event: The name of the event
+    :param payload: A pydantic model, a list of them or plain data
+    :return: The binary frame, or the JSON payload
+    """
+    payload = to_json(payload)
+    if version == JSON or (layout := CODECS[version].get(event)) is None:
+        return payload
+    return layout.encode(version, payload)
+
+
+def encode_batch(version: int, events: Sequence[Tuple[str, Any]]) -> Any:
+    """
+    The encode_batch function encodes several events as one frame. When an
+    event has no layout in the version, the batch is sent as JSON pairs.
+
+    :param version: The codec version, JSON for none
+    :param events: The (event, payload) pairs
+    :return: The batch frame, or a list of [event, payload] pairs
+    """
+    if len(events) > 0xFFFF:
+        raise CodecError("too many events in a batch")
+    if version == JSON or any(event not in CODECS[version] for event, _ in events):
+        return [[event, to_json(payload)] for event, payload in events]
+    out = [HEADER.pack(version, BATCH), COUNT.pack(len(events))]
+    for event, payload in events:
+        frame = CODECS[version][event].encode(version, to_json(payload))
+        out.append(FRAME_LENGTH.pack(len(frame)))
+        out.append(frame)
+    return b"".join(out)
+
+
+def decode(data: bytes) -> Tuple[str, Any]:
+    """
+    The decode function decodes a binary frame.
+
+    :param data: The frame
+    :return: The name of the event and its payload
+    """
+    version, code = HEADER.unpack_from(data)
+    if version not in CODECS:
+        raise CodecError(f"unknown codec version {version}")
+    if code == BATCH:
+        (count,) = COUNT.unpack_from(data, HEADER.size)
+        offset = HEADER.size + COUNT.size
+        events = []
+        for _ in range(count):
+            (length,) = FRAME_LENGTH.unpack_from(data, offset)
+            offset += FRAME_LENGTH.size
+            events.append(decode(data[offset : offset + length]))
+            offset += length
+        return "batch", events
+    for layout in CODECS[version].values():
+        if layout.code == code:
+            return layout.event, layout.decode(data)
+    raise CodecError(f"unknown event code {code} in codec version {version}")
+
+
+# The members of every channel of a room, when the socket workers share them.
+MEMBERS = "codec:members:{%s}"
+
+
+class ConnectionCodecs:
+    """
+    The ConnectionCodecs class remembers the codec each connection agreed on
+    and whether it takes batches. Connections join rooms through it, under
+    the room name suffixed with their codec version, or with #batch for JSON
+    batches, so a broadcast is encoded once per codec instead of once per
+    client and every worker delivers the right frames.
+
+    It also counts the members of every channel, so a broadcast only goes
+    out on the channels someone joined. Behind the Redis socket manager the
+    members of a room may be on any worker, and the counts are kept in
+    Redis instead.
+    """
+
+    def __init__(self, redis: Optional[Redis] = None, shared: Optional[bool] = None):
+        self.versions: Dict[str, int] = {}
+        self.batching: Set[str] = set()
+        self.joined: Dict[str, Set[Tuple[Any, Any]]] = {}
+        self.members: Dict[Any, int] = {}
+        self._redis = redis
+        self.shared = manager_mode() == "redis" if shared is None else shared
+
+    @property
+    def redis(self) -> Redis:
+        if self._redis is None:
+            self._redis = Redis.from_url(Config.socket_redis_url, decode_responses=True)
+        return self._redis
+
+    @staticmethod
+    def _asked(environ: Optional[dict], auth: Optional[dict], key: str):
+        if isinstance(auth, dict) and auth.get(key) is not None:
+            return auth[key]
+        if environ:
+            return parse_qs(environ.get("QUERY_STRING", "")).get(key)
+        return None
+
+    @classmethod
+    def offered(
+        cls, environ: Optional[dict] = None, auth: Optional[dict] = None
+    ) -> List[int]:
+        if (offered := cls._asked(environ, auth, "codec")) is None:
+            return []
+        if not isinstance(offered, (list, tuple)):
+            offered = str(offered).split(",")
+        versions = []
+        for version in offered:
+            try:
+                versions.append(int(version))
+            except (TypeError, ValueError):
+                continue
+        return versions
+
+    @classmethod
+    def wants_batches(
+        cls, environ: Optional[dict] = None, auth: Optional[dict] = None
+    ) -> bool:
+        asked = cls._asked(environ, auth, "batch")
+        if isinstance(asked, list):
+            asked = asked[-1]
+        return str(asked).lower() in ("1", "true")
+
+    def negotiate(self, sid: str, offered: Iterable[int], batch: bool = False) -> int:
+        """
+        The negotiate function picks the newest codec version both sides
+        know, or JSON.
+
+        :param sid: The id of the socket
+        :param offered: The codec versions the client knows
+        :param batch: Whether a JSON client takes batches
+        :return: The codec version of the connection
+        """
+        self.forget(sid)
+        version = max(set(offered) & set(CODECS), default=JSON)
+        if version != JSON:
+            self.versions[sid] = version
+        elif batch:
+            self.batching.add(sid)
+        return version
+
+    def forget(self, sid: str) -> None:
+        self.versions.pop(sid, None)
+        self.batching.discard(sid)
+
+    def version(self, sid: str) -> int:
+        # Connections that never negotiated, or settled on JSON, fall back here.
+        return self.versions.get(sid, JSON)
+
+    @staticmethod
+    def room_for(room, version: int, batch: bool = False):
+        if version != JSON:
+            return f"{room}#v{version}"
+        return f"{room}#batch" if batch else room
+
+    @classmethod
+    def channels(cls, room) -> List[Tuple[Any, int, bool]]:
+        """
+        The channels function lists the rooms a broadcast to room goes out on.
+
+        :param room: The room
+        :return: (room name, codec version, batched) for every channel
+        """
+        return [(room, JSON, False), (cls.room_for(room, JSON, True), JSON, True)] + [
+            (cls.room_for(room, version), version, True) for version in CODECS
+        ]
+
+    async def subscribed(self, room) -> List[Tuple[Any, int, bool]]:
+        """
+        The subscribed function lists the channels of a room that have
+        members.
+
+        :param room: The room
+        :return: (room name, codec version, batched) for every channel joined
+        """
+        if not self.shared:
+            return [c for c in self.channels(room) if self.members.get(c[0])]
+        try:
+            counts = await self.redis.hgetall(MEMBERS % room)
+        except Exception as e:
+            logger.error(e)
+            return self.channels(room)
+        return [c for c in self.channels(room) if int(counts.get(str(c[0]), 0)) > 0]
+
+    def room_of(self, sid: str, room):
+        return self.room_for(room, self.version(sid), sid in self.batching)
+
+    async def _count(self, room, channel, delta: int) -> None:
+        if (members := self.members.get(channel, 0) + delta) > 0:
+            self.members[channel] = members
+        else:
+            self.members.pop(channel, None)
+        if self.shared:
+            await self.redis.hincrby(MEMBERS % room, str(channel), delta)
+
+    # AsyncServer.enter_room and leave_room are coroutines from
+    # python-socketio 5.10 on and plain functions before.
+    async def enter_room(self, server, sid: str, room, namespace=None) -> None:
+        channel = self.room_of(sid, room)
+        entered = server.enter_room(sid, channel, namespace=namespace)
+        if inspect.isawaitable(entered):
+            await entered
+        joined = self.joined.setdefault(sid, set())
+        if (room, channel) not in joined:
+            joined.add((room, channel))
+            await self._count(room, channel, 1)
+
+    async def leave_room(self, server, sid: str, room, namespace=None) -> None:
+        channel = self.room_of(sid, room)
+        left = server.leave_room(sid, channel, namespace=namespace)
+        if inspect.isawaitable(left):
+            await left
+        if (room, channel) in self.joined.get(sid, ()):
+            self.joined[sid].discard((room, channel))
+            await self._count(room, channel, -1)
+
+    async def close(self, sid: str) -> None:
+        """
+        The close function forgets a connection that closed and takes it out
+        of the channels it joined, as the disconnect handler does. socket.io
+        itself already took it out of the rooms.
+
+        :param sid: The id of the socket
+        """
+        for room, channel in self.joined.pop(sid, ()):
+            await self._count(room, channel, -1)
+        self.forget(sid)
+
+    async def emit(self, server, event: str, payload, room=None, to=None, **kwargs):
+        """
+        The emit function sends an event to one socket in its codec, or to a
+        room joined through enter_room in every codec one of its members
+        uses.
+
+        :param server: The socket.io AsyncServer
+        :param event: The name of the event
+        :param payload: A pydantic model, a list of them or plain data
+        :param room: The room to broadcast to
+        :param to: The sid of a single socket
+        :param kwargs: Passed on to AsyncServer.emit
+        """
+        if to is not None:
+            return await server.emit(
+                event, encode(self.version(to), event, payload), to=to, **kwargs
+            )
+        payload = to_json(payload)
+        if room is None:
+            return await server.emit(event, payload, **kwargs)
+        for channel, version, _ in await self.subscribed(room):
+            await server.emit(
+                event, encode(version, event, payload), room=channel, **kwargs
+            )
+
+
+connection_codecs = ConnectionCodecs()
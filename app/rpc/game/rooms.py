@@ -0,0 +1,255 @@
+"""
+@author: Kuro
+"""
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from redis.asyncio import Redis
+
+from settings import Config
+
+# Every key of a game carries the game id as a hash tag, so the scripts only
+# touch one slot and keep working against a Redis cluster.
+FREE_ROOMS = "rooms:{%s}:free"
+SEATS = "rooms:{%s}:seats"
+ROOM = "room:{%s}:%s"
+
+# KEYS: free rooms, seats of the game, candidate room, room to create
+# ARGV: game id, user id, candidate room name, room name to create, max seats,
+#       created at, 1 to create the room when the candidate is gone
+# When the candidate filled up while other rooms are free, only the name of
+# the fullest one is returned and the caller retries with it.
+CLAIM_SEAT = """
+local seated = redis.call('HGET', KEYS[2], ARGV[2])
+if seated then
+    local room, seat = string.match(seated, '^(.*):(%d+)$')
+    return {room, tonumber(seat), 0}
+end
+local created = 0
+local room, key, max_seats = ARGV[3], KEYS[3], nil
+if room ~= '' then
+    max_seats = tonumber(redis.call('HGET', key, 'max_seats'))
+    if not redis.call('ZSCORE', KEYS[1], room) then
+        room = ''
+    -- A stale entry is dropped and the player gets another room.
+    elseif not max_seats or tonumber(redis.call('HGET', key, 'players')) >= max_seats then
+        redis.call('ZREM', KEYS[1], room)
+        room = ''
+    end
+end
+if room == '' then
+    local fullest = redis.call('ZREVRANGE', KEYS[1], 0, 0)[1]
+    if ARGV[7] ~= '1' and fullest then
+        return {fullest}
+    end
+    room, key, created = ARGV[4], KEYS[4], 1
+    max_seats = tonumber(ARGV[5])
+    redis.call('HSET', key, 'game_id', ARGV[1], 'max_seats', ARGV[5],
+        'created_at', ARGV[6], 'players', 0)
+end
+local seat = 0
+while redis.call('HEXISTS', key, 'seat:' .. seat) == 1 do
+    seat = seat + 1
+end
+redis.call('HSET', key, 'seat:' .. seat, ARGV[2])
+local players = redis.call('HINCRBY', key, 'players', 1)
+if players >= max_seats then
+    redis.call('ZREM', KEYS[1], room)
+else
+    redis.call('ZADD', KEYS[1], players, room)
+end
+redis.call('HSET', KEYS[2], ARGV[2], room .. ':' .. seat)
+return {room, seat, created}
+"""
+
+# KEYS: free rooms, seats of the game, room of the seat
+# ARGV: user id, room name of the seat
+# Returns false when the player holds no seat, and a seat of -1 when the seat
+# moved to another room since it was read.
+RELEASE_SEAT = """
+local seated = redis.call('HGET', KEYS[2], ARGV[1])
+if not seated then
+    return false
+end
+local room, seat = string.match(seated, '^(.*):(%d+)$')
+if room ~= ARGV[2] then
+    return {room, -1}
+end
+redis.call('HDEL', KEYS[2], ARGV[1])
+redis.call('HDEL', KEYS[3], 'seat:' .. seat)
+local players = redis.call('HINCRBY', KEYS[3], 'players', -1)
+if players <= 0 then
+    redis.call('DEL', KEYS[3])
+    redis.call('ZREM', KEYS[1], room)
+else
+    redis.call('ZADD', KEYS[1], players, room)
+end
+return {room, tonumber(seat)}
+"""
+
+
+class RoomUnavailable(RuntimeError):
+    """
+    The RoomUnavailable error is raised when no seat could be claimed.
+    """
+
+
+@dataclass
+class SeatClaim:
+    """
+    The SeatClaim class is the seat a player got in a room.
+    """
+
+    game_id: int
+    room_name: str
+    seat_id: int
+    created: bool = False
+
+
+class RoomRegistry:
+    """
+    The RoomRegistry class keeps the game rooms in Redis as one hash per room
+    (its seats and player count), a hash per game of the seat each player
+    holds, and a sorted set per game of the rooms with free seats scored by
+    their player count. Seats are claimed and released by Lua scripts, so
+    concurrent joins from any socket worker never hand out the same seat. The
+    room a script touches is read first and passed in its keys, as Redis
+    requires of every key a script uses; when it changed in between, the
+    script refuses and the call is retried.
+    """
+
+    def __init__(self, redis: Optional[Redis] = None, attempts: int = 5):
+        self._redis = redis
+        # The last attempt creates a room instead of refusing, so there is one.
+        self.attempts = max(1, attempts)
+        self._claim = None
+        self._release = None
+
+    @property
+    def redis(self) -> Redis:
+        if self._redis is None:
+            self._redis = Redis.from_url(Config.redis_host, decode_responses=True)
+        return self._redis
+
+    def _scripts(self):
+        if self._claim is None:
+            self._claim = self.redis.register_script(CLAIM_SEAT)
+            self._release = self.redis.register_script(RELEASE_SEAT)
+        return self._claim, self._release
+
+    async def claim(
+        self, game_id: int, user_id: int, max_seats: int = Config.room_max_seats
+    ) -> SeatClaim:
+        """
+        The claim function seats a player in the fullest room of the game that
+        still has a free seat, or in a new room when every room is full. A
+        player that already holds a seat in the game gets that seat back.
+        When the rooms keep filling up under it, the last attempt creates a
+        new room rather than giving up.
+
+        :param game_id: The id of the game
+        :param user_id: The id of the player
+        :param max_seats: The seats of a new room
+        :return: The SeatClaim
+        :raises RoomUnavailable: When the script refused every attempt
+        """
+        claim, _ = self._scripts()
+        fullest = await self.redis.zrevrange(FREE_ROOMS % game_id, 0, 0)
+        candidate = fullest[0] if fullest else ""
+        for attempt in range(self.attempts):
+            new_room = f"{game_id}-{time.time_ns()}"
+            claimed = await claim(
+                keys=[
+                    FREE_ROOMS % game_id,
+                    SEATS % game_id,
+                    ROOM % (game_id, candidate),
+                    ROOM % (game_id, new_room),
+                ],
+                args=[
+                    game_id,
+                    user_id,
+                    candidate,
+                    new_room,
+                    max_seats,
+                    int(time.time()),
+                    int(attempt == self.attempts - 1),
+                ],
+            )
+            if len(claimed) == 3:
+                room_name, seat_id, created = claimed
+                return SeatClaim(game_id, room_name, int(seat_id), bool(created))
+            candidate = claimed[0]
+        raise RoomUnavailable(f"no seat claimed in game {game_id} for {user_id}")
+
+    async def release(self, game_id: int, user_id: int) -> Optional[SeatClaim]:
+        """
+        The release function frees the seat a player holds in a game. A room
+        left empty is deleted.
+
+        :param game_id: The id of the game
+        :param user_id: The id of the player
+        :return: The released SeatClaim, or None when the player had no seat
+        """
+        _, release = self._scripts()
+        seat = await self.seat_of(game_id, user_id)
+        for _ in range(self.attempts):
+            if seat is None:
+                return None
+            released = await release(
+                keys=[
+                    FREE_ROOMS % game_id,
+                    SEATS % game_id,
+                    ROOM % (game_id, seat.room_name),
+                ],
+                args=[user_id, seat.room_name],
+            )
+            if not released:
+                return None
+            room_name, seat_id = released
+            seat = SeatClaim(game_id, room_name, int(seat_id))
+            if seat.seat_id >= 0:
+                return seat
+        return None
+
+    async def seat_of(self, game_id: int, user_id: int) -> Optional[SeatClaim]:
+        if not (seated := await self.redis.hget(SEATS % game_id, user_id)):
+            return None
+        room_name, seat_id = seated.rsplit(":", 1)
+        return SeatClaim(game_id, room_name, int(seat_id))
+
+    async def room(self, game_id: int, room_name: str) -> Optional[Dict]:
+        """
+        The room function reads a room hash.
+
+        :param game_id: The id of the game
+        :param room_name: The name of the room
+        :return: The room with its seats as {seat id: user id}, or None
+        """
+        if not (fields := await self.redis.hgetall(ROOM % (game_id, room_name))):
+            return None
+        return {
+            "game_id": int(fields["game_id"]),
+            "room_name": room_name,
+            "max_seats": int(fields["max_seats"]),
+            "created_at": int(fields["created_at"]),
+            "seats": {
+                int(field.split(":", 1)[1]): int(value)
+                for field, value in fields.items()
+                if field.startswith("seat:")
+            },
+        }
+
+    async def free_rooms(self, game_id: int, limit: int = 100) -> List[str]:
+        """
+        The free_rooms function lists the rooms of a game with free seats,
+        fullest first.
+
+        :param game_id: The id of the game
+        :param limit: The max number of rooms returned
+        :return: The room names
+        """
+        return await self.redis.zrevrange(FREE_ROOMS % game_id, 0, limit - 1)
+
+
+room_registry = RoomRegistry()
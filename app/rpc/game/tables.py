@@ -0,0 +1,411 @@
+"""
+@author: Kuro
+"""
+import asyncio
+import bisect
+import hashlib
+import inspect
+import logging
+import pickle
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from redis.asyncio import Redis
+
+from app.rpc.manager import LocalBus, local_bus
+from settings import Config
+
+logger = logging.getLogger("tables")
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.DEBUG)
+
+WORKERS = "tables:workers"
+MEMBERS = "tables:members"
+WORKER = "tables:worker:%s"
+
+EVENT, HANDOFF = "event", "handoff"
+# Events are forwarded at most this many times while workers disagree on
+# the ring, then run where they are.
+MAX_HOPS = 3
+RELEASE = object()
+
+TableHandler = Callable[[dict, object], Optional[Awaitable]]
+
+
+def ring_hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    The HashRing class maps tables to workers with consistent hashing. Every
+    worker is placed on the ring replicas times, so tables spread evenly and
+    a worker joining or leaving only moves about 1/workers of them.
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), replicas: int = Config.table_ring_replicas):
+        self.replicas = replicas
+        self.hashes: List[int] = []
+        self.owners: List[str] = []
+        self.nodes = set()
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str) -> None:
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for replica in range(self.replicas):
+            point = ring_hash(f"{node}#{replica}")
+            i = bisect.bisect(self.hashes, point)
+            self.hashes.insert(i, point)
+            self.owners.insert(i, node)
+
+    def remove(self, node: str) -> None:
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        kept = [(h, owner) for h, owner in zip(self.hashes, self.owners) if owner != node]
+        self.hashes = [h for h, _ in kept]
+        self.owners = [owner for _, owner in kept]
+
+    def owner(self, key: str) -> Optional[str]:
+        """
+        The owner function returns the worker that owns a table.
+
+        :param key: The table
+        :return: The worker id, or None on an empty ring
+        """
+        if not self.hashes:
+            return None
+        i = bisect.bisect(self.hashes, ring_hash(key)) % len(self.hashes)
+        return self.owners[i]
+
+
+class Membership:
+    """
+    The Membership class keeps the live workers in a Redis sorted set scored
+    by when their heartbeat expires.
+    """
+
+    def __init__(self, redis: Optional[Redis] = None):
+        self._redis = redis
+
+    @property
+    def redis(self) -> Redis:
+        if self._redis is None:
+            self._redis = Redis.from_url(Config.redis_host, decode_responses=True)
+        return self._redis
+
+    async def join(self, worker_id: str, ttl: float) -> None:
+        await self.redis.zadd(WORKERS, {worker_id: time.time() + ttl})
+
+    async def leave(self, worker_id: str) -> None:
+        await self.redis.zrem(WORKERS, worker_id)
+
+    async def members(self) -> List[str]:
+        now = time.time()
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zremrangebyscore(WORKERS, "-inf", now)
+            pipe.zrangebyscore(WORKERS, now, "+inf")
+            _, members = await pipe.execute()
+        return members
+
+
+class RedisTableBus:
+    """
+    The RedisTableBus class carries table messages between workers over Redis
+    pub/sub.
+    """
+
+    def __init__(self, redis: Optional[Redis] = None):
+        self._redis = redis
+
+    @property
+    def redis(self) -> Redis:
+        if self._redis is None:
+            self._redis = Redis.from_url(Config.redis_host)
+        return self._redis
+
+    async def publish(self, channel: str, message: bytes) -> None:
+        await self.redis.publish(channel, message)
+
+    async def listen(self, *channels: str):
+        async with self.redis.pubsub() as pubsub:
+            await pubsub.subscribe(*channels)
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    yield message["data"]
+
+
+class LocalTableBus:
+    """
+    The LocalTableBus class carries table messages between routers in one
+    process over a LocalBus, for tests and local runs.
+    """
+
+    def __init__(self, bus: Optional[LocalBus] = None):
+        self.bus = bus or local_bus
+
+    async def publish(self, channel: str, message: bytes) -> None:
+        self.bus.publish(channel, message)
+
+    async def listen(self, *channels: str):
+        queue = asyncio.Queue()
+        for channel in channels:
+            self.bus.subscribe(channel, queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            for channel in channels:
+                self.bus.unsubscribe(channel, queue)
+
+
+def table_bus():
+    mode = Config.table_bus or ("local" if Config.socket_manager == "local" else "redis")
+    return LocalTableBus() if mode == "local" else RedisTableBus()
+
+
+class Table:
+    """
+    The Table class is a table owned by this worker: its state and the queue
+    of events that one task applies to it in order.
+    """
+
+    __slots__ = ("key", "state", "queue", "task", "ready")
+
+    def __init__(self, key: str, state: Optional[dict] = None):
+        self.key = key
+        self.state = state if state is not None else {}
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+        self.ready = asyncio.Event()
+
+
+class TableRouter:
+    """
+    The TableRouter class gives every table (a game room such as "7-1") a
+    single owner among the live socket workers and runs its events there.
+    Any worker may dispatch an event; the owner on the hash ring applies it
+    to the table state in one task per table, so fish lists, pools and hit
+    counters are mutated by one coroutine at a time without locks. Events
+    for tables owned elsewhere are published on the owner's channel.
+
+    Workers announce themselves with a heartbeat and rebuild the ring when
+    the members change. A worker losing a table finishes the queued events,
+    then hands the state to the new owner, which holds the table's events
+    until the state arrives or handoff_timeout passes. State on a worker
+    that dies is lost, as it was before.
+    """
+
+    def __init__(
+        self,
+        worker_id: str = Config.worker_id,
+        membership: Optional[Membership] = None,
+        bus=None,
+        replicas: int = Config.table_ring_replicas,
+        heartbeat_seconds: float = Config.table_heartbeat_seconds,
+        worker_ttl: float = Config.table_worker_ttl,
+        handoff_timeout: float = Config.table_handoff_timeout,
+    ):
+        self.worker_id = worker_id
+        self.membership = membership or Membership()
+        self._bus = bus
+        self.replicas = replicas
+        self.heartbeat_seconds = heartbeat_seconds
+        self.worker_ttl = worker_ttl
+        self.handoff_timeout = handoff_timeout
+        self.ring = HashRing([worker_id], replicas)
+        self.previous = self.ring
+        self.tables: Dict[str, Table] = {}
+        self.handlers: Dict[str, TableHandler] = {}
+        self.tasks: List[asyncio.Task] = []
+
+    @property
+    def bus(self):
+        if self._bus is None:
+            self._bus = table_bus()
+        return self._bus
+
+    def handler(self, event: str):
+        """
+        The handler function registers what an event does to a table. It is
+        called with the table state and the payload, on the owner only.
+
+        :param event: The name of the event
+        """
+
+        def decorator(handler: TableHandler):
+            self.handlers[event] = handler
+            return handler
+
+        return decorator
+
+    def owns(self, table: str) -> bool:
+        return self.ring.owner(table) == self.worker_id
+
+    async def dispatch(self, table: str, event: str, payload=None, hops: int = 0) -> None:
+        """
+        The dispatch function runs an event on the owner of its table.
+
+        :param table: The table
+        :param event: The name of a registered event
+        :param payload: The payload handed to the handler, picklable
+        :param hops: How many times the event was forwarded
+        """
+        await self.start()
+        owner = self.ring.owner(table)
+        if owner == self.worker_id or hops >= MAX_HOPS:
+            self._table(table).queue.put_nowait((event, payload))
+            return
+        await self.bus.publish(
+            WORKER % owner, pickle.dumps((EVENT, table, event, payload, hops + 1))
+        )
+
+    def _table(self, key: str, state: Optional[dict] = None) -> Table:
+        if (table := self.tables.get(key)) is not None:
+            return table
+        table = self.tables[key] = Table(key, state)
+        previous = self.previous.owner(key)
+        if state is not None or previous in (None, self.worker_id):
+            table.ready.set()
+        table.task = asyncio.get_running_loop().create_task(self._run(table))
+        return table
+
+    async def _run(self, table: Table) -> None:
+        if not table.ready.is_set():
+            try:
+                await asyncio.wait_for(table.ready.wait(), self.handoff_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"no handoff for table {table.key}, starting empty")
+        while True:
+            event, payload = await table.queue.get()
+            if event is RELEASE:
+                return
+            if (handler := self.handlers.get(event)) is None:
+                logger.error(f"no table handler for {event}")
+                continue
+            try:
+                result = handler(table.state, payload)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(f"table {table.key} failed on {event}: {e}")
+
+    async def _handoff(self, key: str, owner: str) -> None:
+        if (table := self.tables.pop(key, None)) is None:
+            return
+        table.queue.put_nowait((RELEASE, None))
+        await table.task
+        await self.bus.publish(WORKER % owner, pickle.dumps((HANDOFF, key, table.state)))
+        # Events queued behind the release follow the state.
+        while not table.queue.empty():
+            event, payload = table.queue.get_nowait()
+            await self.dispatch(key, event, payload, 1)
+
+    async def rebalance(self, members: Iterable[str]) -> None:
+        """
+        The rebalance function rebuilds the ring from the live workers and
+        hands the tables this worker lost to their new owners.
+
+        :param members: The ids of the live workers
+        """
+        members = set(members) | {self.worker_id}
+        if members == self.ring.nodes:
+            return
+        logger.info(f"table ring: {sorted(members)}")
+        self.previous, self.ring = self.ring, HashRing(members, self.replicas)
+        for key in list(self.tables):
+            if (owner := self.ring.owner(key)) != self.worker_id:
+                await self._handoff(key, owner)
+
+    async def receive(self, message: bytes) -> None:
+        kind, key, *rest = pickle.loads(message)
+        if kind == EVENT:
+            event, payload, hops = rest
+            await self.dispatch(key, event, payload, hops)
+        elif kind == HANDOFF:
+            (state,) = rest
+            if (table := self.tables.get(key)) is None:
+                self._table(key, state)
+            else:
+                table.state.update(state)
+                table.ready.set()
+
+    async def listen(self) -> None:
+        while True:
+            try:
+                async for message in self.bus.listen(WORKER % self.worker_id, MEMBERS):
+                    if message == MEMBERS.encode():
+                        await self.rebalance(await self.membership.members())
+                    else:
+                        await self.receive(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"table listener failed: {e}")
+                await asyncio.sleep(1)
+
+    async def heartbeat(self) -> None:
+        while True:
+            try:
+                await self.membership.join(self.worker_id, self.worker_ttl)
+                await self.rebalance(await self.membership.members())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"table heartbeat failed: {e}")
+            await asyncio.sleep(self.heartbeat_seconds)
+
+    async def start(self) -> None:
+        if self.tasks:
+            return
+        loop = asyncio.get_running_loop()
+        self.tasks = [loop.create_task(self.listen())]
+        await self.membership.join(self.worker_id, self.worker_ttl)
+        await self.rebalance(await self.membership.members())
+        self.tasks.append(loop.create_task(self.heartbeat()))
+        await self.bus.publish(MEMBERS, MEMBERS.encode())
+
+    async def stop(self) -> None:
+        """
+        The stop function leaves the ring and hands every table to the
+        workers that remain. Events still sent here while the others learn
+        of it are forwarded for handoff_timeout seconds.
+        """
+        if not self.tasks:
+            return
+        listener, *others = self.tasks
+        for task in others:
+            task.cancel()
+        await self.membership.leave(self.worker_id)
+        members = set(await self.membership.members()) - {self.worker_id}
+        if members:
+            self.previous, self.ring = self.ring, HashRing(members, self.replicas)
+            for key in list(self.tables):
+                await self._handoff(key, self.ring.owner(key))
+            await self.bus.publish(MEMBERS, MEMBERS.encode())
+            await asyncio.sleep(self.handoff_timeout)
+        listener.cancel()
+        self.tasks = []
+
+
+table_router = TableRouter()
+
+
+@table_router.handler("seat")
+def seat_player(state: dict, payload: dict) -> None:
+    """
+    The seat_player function keeps the seat a player claimed in the room
+    registry in the state of the table, on its owner.
+
+    :param state: The table state
+    :param payload: The user_id and seat of the player
+    """
+    state.setdefault("seats", {})[payload["user_id"]] = payload["seat"]
+
+
+@table_router.handler("unseat")
+def unseat_player(state: dict, payload: dict) -> None:
+    state.get("seats", {}).pop(payload["user_id"], None)
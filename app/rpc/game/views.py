@@ -1,30 +1,35 @@
 """
 @author: igor
 """
-import time
+import logging
 from datetime import datetime
 from typing import List, Optional
 
 import pytz
-from py_linq import Enumerable
-from pydantic import BaseModel, Field
+from pydantic import Field
 
 from app.rpc import socket
+from app.rpc.codec import connection_codecs
 
 from fastapi import Request
 
 from app.api.game.models import GameList
-from app.api.user.models import User
 from app.rpc.user.schema import BaseUser
-from app.rpc.game.schema import PlayerBet, RoomList, GameRoom
+from app.rpc.game.rooms import RoomUnavailable, room_registry
+from app.rpc.game.tables import table_router
+from app.rpc.rate_limit import rate_limiter
+from app.rpc.sessions import SessionRecord, session_store
+from app.rpc.game.schema import PlayerBet, GameRoom
 from app.rpc.game.schema import (
     PagedListAllGamesResponse,
     ListAllGames,
 )
 from app.shared.schemas.ResponseSchemas import BaseResponse
+from settings import Config
 
-# from app import redis
-redis = None
+logger = logging.getLogger("game")
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.DEBUG)
 
 
 def get_all_games(context: ListAllGames, request: Request):
@@ -48,69 +53,45 @@ def insert_player_bet_history(content: PlayerBet):
     """ """
 
 
-async def add_player_to_room(session: BaseModel, context: PlayerBet):
+async def add_player_to_room(record: SessionRecord, context: PlayerBet):
     """
     This function is used to add a player to a game room.
-    :return:
+    The seat is claimed atomically in the room registry, so concurrent joins
+    from any worker never share a seat.
+    :return: The GameRoom as json, or None when no seat was claimed
     """
     game = GameList.read(id=context.game_id)
-    user = User.read(id=session.user.id)
-    active_rooms = RoomList(
-        rooms=[GameRoom(**room) for room in await redis.get("rooms")]
-    )
-    if (
-        game_room := Enumerable(active_rooms.rooms)
-        .where(
-            lambda room: room.game_id == context.game_id
-            and len(room.players) < game.max_players
-            and Enumerable(room.players)
-            .where(lambda player: player.id != user.id)
-            .first()
+    try:
+        seat = await room_registry.claim(
+            context.game_id,
+            record.user_id,
+            getattr(game, "max_players", None) or Config.room_max_seats,
         )
-        .first()
-    ):
-        game_room.players.append(user)
-        updated_session = session.dict()
-        updated_session.get(user.phoneNumber).update(
-            {"game": {"game_id": context.game_id, "room": game_room.json()}}
-        )
-        await socket.save_session(session.sid, updated_session)
-        await redis.set("rooms", active_rooms.json())
-
-        active_rooms = RoomList(
-            rooms=[GameRoom(**room) for room in await redis.get("rooms")]
-        )
-
-        return active_rooms.json()
+    except RoomUnavailable as e:
+        logger.error(e)
+        return None
+    # The room is gone when the seat was released again in between.
+    if (room := await room_registry.room(context.game_id, seat.room_name)) is None:
+        return None
+    game_room = GameRoom(
+        game_id=context.game_id,
+        room_name=seat.room_name,
+        created_at=datetime.fromtimestamp(room["created_at"], pytz.utc),
+    )
+    record.join(context.game_id, seat.room_name, seat.seat_id)
+    return game_room.json()
 
 
-async def get_active_rooms(session: BaseModel, context: PlayerBet):
+async def get_active_rooms(record: SessionRecord, context: PlayerBet):
     """
-    This function is used to create a new game room.
-    :param session:
+    This function is used to seat the player in the fullest room of the game
+    with a free seat, or in a new room when there is none. Seats always go
+    through the room registry, so the session record holds the room joined.
+    :param record:
     :param context:
     :return:
     """
-    user = User.read(id=session.user.id)
-    active_rooms = RoomList(
-        rooms=[GameRoom(**room) for room in await redis.get("rooms")]
-    )
-
-    if not active_rooms:
-        room_name = f"{context.game_id}-{int(time.time())}"
-        active_rooms = RoomList(
-            rooms=[
-                GameRoom(
-                    game_id=context.game_id,
-                    room_name=room_name,
-                    players=[user],
-                    created_at=datetime.now(),
-                )
-            ]
-        )
-
-        await redis.set("rooms", active_rooms.json())
-        return active_rooms.json()
+    return await add_player_to_room(record, context)
 
     #     if (
     #             Enumerable(active_rooms.rooms)
@@ -138,6 +119,7 @@ async def get_active_rooms(session: BaseModel, context: PlayerBet):
 
 
 @socket.on("loginRoom")
+@rate_limiter.limit("loginRoom")
 async def login_room(socket_id, context: PlayerBet):
     """
     This function is used to login to a game room.
@@ -149,22 +131,22 @@ async def login_room(socket_id, context: PlayerBet):
     :return: None
     """
 
-    socket_session = socket.get_session(socket_id)
-    if not socket_session:
+    context = PlayerBet(**context)
+    record = session_store.get(socket_id)
+    if not record or not record.user_id:
         return BaseResponse(success=False, error="Session not found, log in again")
-    session_data = Enumerable(socket_session.dict().values()).first()
-    session = BaseModel(**session_data)
-    active_room = get_active_rooms(session, context)
+    active_room = await get_active_rooms(record, context)
     if not active_room:
         return BaseResponse(success=False, error="No room available")
-    await socket.enter_room(
-        socket_id, session.game.game_id, namespace=session.game.room.room_name
+    await table_router.dispatch(
+        record.table, "seat", {"user_id": record.user_id, "seat": record.seat}
     )
-    redis.set(f"{context.game_id}-{int(time.time())}", socket_id)
-    await socket.emit("loginRoom", data=context.dict(), room=context.game_id)
+    await connection_codecs.enter_room(socket, socket_id, record.table)
+    await connection_codecs.emit(socket, "loginRoom", context, room=record.table)
 
 
 @socket.on("logoutRoom")
+@rate_limiter.limit("logoutRoom")
 async def logout_room(socket_id, context: PlayerBet):
     """
     This function logs out a player from a game room and emits a "logoutRoom" event to all players in the room.
@@ -174,24 +156,18 @@ async def logout_room(socket_id, context: PlayerBet):
     player is currently in, so that the player can be logged out of that game's room
     :type context: PlayerBet
     """
-    game = GameList.read(id=context.game_id)
-
-    socket_session = socket.get_session(socket_id)
-    if not socket_session:
+    context = PlayerBet(**context)
+    record = session_store.get(socket_id)
+    if not record or not record.user_id:
         return BaseResponse(success=False, error="Session not found, log in again")
-    session_data = Enumerable(socket_session.dict().values()).first()
-    session = BaseModel(**session_data)
-    if not session.game:
+    if record.game_id is None:
         return BaseResponse(success=False, error="No game found")
-    if not session.game.room:
+    if record.table is None:
         return BaseResponse(success=False, error="No players found")
-
-    if not Enumerable(
-        session.game.room.players.where(
-            lambda player: player.id == session.user.id
-        ).first()
-    ):
-        pass
+    await room_registry.release(record.game_id, record.user_id)
+    await table_router.dispatch(record.table, "unseat", {"user_id": record.user_id})
+    await connection_codecs.leave_room(socket, socket_id, record.table)
+    record.leave()
 
     #     return BaseResponse(success=False, error="Player not found")
     # if not Enumerable(
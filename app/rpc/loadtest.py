@@ -0,0 +1,480 @@
+"""
+@author: Kuro
+
+Load test of a socket worker with simulated players:
+
+    docker-compose up -d redis postgres
+    python -m app.rpc.loadtest --serve --seed --clients 2000 --duration 60 \
+        --out loadtest-2000.json
+
+Every player is a python-socketio client that logs in (token login, or
+getOTP/verifySMS with --flow otp), joins a game room with loginRoom, sends
+hit events for --duration seconds and leaves with logoutRoom. The run stops
+before the hits when the server does not acknowledge --hit-event, as with
+fish_hit while the fish game handlers are not registered. Each phase
+reports its throughput, the p50/p95/p99 round trip of its events and the
+CPU and peak RSS of the server process, and the run is written as JSON so
+runs can be compared.
+
+--serve starts the worker (uvicorn app.rpc:app, without SSL) on --port with
+the environment of this process, so POSTGRES_CONNECTION and REDIS_HOST
+should point at local Postgres and Redis such as the docker-compose
+services. Without it, pass --url and the --server-pid of a running worker
+to sample. The OTP flow needs Twilio disabled or a sandbox account: the
+code is computed from OTP_BASE, not read from the SMS.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import secrets
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pyotp
+import pytz
+import socketio
+
+from app.shared.utils.timer import percentiles
+from settings import Config
+
+PHASES = ("connect", "login", "loginRoom", "hits", "logoutRoom", "disconnect")
+PHONE = "+1555%07d"
+USERNAME = "loadtest-%d"
+
+
+class ProcessSampler:
+    """
+    The ProcessSampler class reads the CPU time and RSS of the server
+    process from /proc, and samples the RSS in the background so a phase
+    reports its peak.
+    """
+
+    def __init__(self, pid: Optional[int], interval: float = 0.25):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def cpu_seconds(self) -> Optional[float]:
+        if not self.pid:
+            return None
+        try:
+            with open(f"/proc/{self.pid}/stat") as stat:
+                # The command may hold spaces, the fields after it do not.
+                fields = stat.read().rsplit(")", 1)[1].split()
+        except OSError:
+            return None
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def rss(self) -> Optional[int]:
+        if not self.pid:
+            return None
+        try:
+            with open(f"/proc/{self.pid}/status") as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            return None
+        return None
+
+    async def sample(self) -> None:
+        while True:
+            self.peak_rss = max(self.peak_rss, self.rss() or 0)
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        self.peak_rss = self.rss() or 0
+        self.task = asyncio.get_running_loop().create_task(self.sample())
+
+    def stop(self) -> int:
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        return max(self.peak_rss, self.rss() or 0)
+
+
+class Phase:
+    """
+    The Phase class collects the events, errors and round trips of one phase
+    of the run.
+    """
+
+    def __init__(self, name: str, sampler: ProcessSampler):
+        self.name = name
+        self.sampler = sampler
+        self.events = 0
+        self.errors = 0
+        self.latencies: List[float] = []
+
+    async def __aenter__(self):
+        self.cpu = self.sampler.cpu_seconds()
+        self.started = time.perf_counter()
+        self.sampler.start()
+        return self
+
+    async def __aexit__(self, *_):
+        self.elapsed = time.perf_counter() - self.started
+        self.peak_rss = self.sampler.stop()
+        cpu = self.sampler.cpu_seconds()
+        self.cpu = None if cpu is None or self.cpu is None else cpu - self.cpu
+        return False
+
+    def record(self, latency: Optional[float]) -> None:
+        self.events += 1
+        if latency is None:
+            self.errors += 1
+        else:
+            self.latencies.append(latency)
+
+    def result(self) -> dict:
+        return {
+            "phase": self.name,
+            "seconds": round(self.elapsed, 3),
+            "events": self.events,
+            "errors": self.errors,
+            "events_per_second": round((self.events - self.errors) / self.elapsed, 1)
+            if self.elapsed
+            else None,
+            "latency_ms": percentiles(self.latencies),
+            "server_cpu_percent": round(self.cpu / self.elapsed * 100, 1)
+            if self.cpu is not None and self.elapsed
+            else None,
+            "server_peak_rss_mb": round(self.peak_rss / 2**20, 1)
+            if self.peak_rss
+            else None,
+        }
+
+
+class Player:
+    """
+    The Player class is one simulated client. request emits an event and
+    times it until the acknowledgement, or until the reply event the server
+    emits back when the handler does not acknowledge.
+    """
+
+    def __init__(self, index: int, phone_number: str, token: Optional[str]):
+        self.index = index
+        self.phone_number = phone_number
+        self.token = token
+        self.client = socketio.AsyncClient(reconnection=False)
+        self.waiting: Dict[str, List[Tuple[Callable[[object], bool], asyncio.Future]]] = {}
+
+    def expect(self, event: str, match: Callable[[object], bool] = lambda _: True):
+        if event not in self.waiting:
+            self.waiting[event] = []
+            self.client.on(event, lambda data=None, event=event: self.reply(event, data))
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[event].append((match, future))
+        return future
+
+    def reply(self, event: str, data) -> None:
+        for i, (match, future) in enumerate(self.waiting[event]):
+            if not future.done() and match(data):
+                future.set_result(data)
+                del self.waiting[event][i]
+                return
+
+    async def connect(self, url: str, timeout: float) -> Optional[float]:
+        headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+        started = time.perf_counter()
+        try:
+            await self.client.connect(
+                url,
+                headers=headers,
+                auth={"codec": 0},
+                transports=["websocket"],
+                wait_timeout=timeout,
+            )
+        except Exception:
+            return None
+        return time.perf_counter() - started
+
+    async def request(
+        self,
+        event: str,
+        data=None,
+        reply: Optional[str] = None,
+        match: Callable[[object], bool] = lambda _: True,
+        timeout: float = 10,
+    ) -> Optional[float]:
+        """
+        The request function sends one event and waits for its answer.
+
+        :param event: The name of the event
+        :param data: The payload
+        :param reply: The event the server answers with, defaults to the
+            acknowledgement of the event
+        :param match: Picks this player's reply out of a room broadcast
+        :param timeout: The seconds to wait
+        :return: The round trip in seconds, or None on a timeout or error
+        """
+        started = time.perf_counter()
+        try:
+            if reply is None:
+                await self.client.call(event, data, timeout=timeout)
+            else:
+                answer = self.expect(reply, match)
+                await self.client.emit(event, data)
+                await asyncio.wait_for(answer, timeout)
+        except Exception:
+            return None
+        return time.perf_counter() - started
+
+
+def seed_players(count: int) -> List[Tuple[str, str]]:
+    """
+    The seed_players function replaces the load test users with count fresh
+    ones, each holding an access token.
+
+    :param count: The number of players
+    :return: The phone number and token of every player
+    """
+    from sqlalchemy import delete
+
+    from app.api.user.models import User
+    from app.shared.auth.token_cache import token_hash
+
+    players = [(PHONE % i, secrets.token_urlsafe(32)) for i in range(count)]
+    session = User.session
+    try:
+        session.execute(
+            delete(User)
+            .where(User.username.like("loadtest-%"))
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    created = User.bulk_create(
+        [
+            {
+                "phone": phone_number,
+                "phoneNumber": phone_number,
+                "username": USERNAME % i,
+                "accessToken": token,
+                "accessTokenHash": token_hash(token),
+                "active": True,
+                "online": False,
+            }
+            for i, (phone_number, token) in enumerate(players)
+        ]
+    )
+    if len(created) < count:
+        raise SystemExit(f"only {len(created)} of {count} load test users were created")
+    return players
+
+
+def load_players(count: int) -> List[Tuple[str, str]]:
+    from app.api.user.models import User
+
+    rows = (
+        User.session.query(User.phoneNumber, User.accessToken)
+        .filter(User.username.like("loadtest-%"), User.accessToken.isnot(None))
+        .order_by(User.id)
+        .limit(count)
+        .all()
+    )
+    if len(rows) < count:
+        raise SystemExit(f"only {len(rows)} load test users, run with --seed")
+    return [tuple(row) for row in rows]
+
+
+def serve(port: int) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.rpc:app",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ]
+    )
+    time.sleep(3)
+    if server.poll() is not None:
+        raise SystemExit("the socket worker did not start")
+    return server
+
+
+async def run_phase(
+    name: str,
+    players: List[Player],
+    step: Callable[[Player, Phase], object],
+    sampler: ProcessSampler,
+    concurrency: int,
+) -> dict:
+    limit = asyncio.Semaphore(concurrency)
+
+    async def run(player: Player):
+        async with limit:
+            await step(player, phase)
+
+    async with Phase(name, sampler) as phase:
+        await asyncio.gather(*(run(player) for player in players))
+    return phase.result()
+
+
+async def check_handled(players: List[Player], event: str, data, timeout: float):
+    """
+    The check_handled function sends one event from the first connected
+    player and stops the run when nothing acknowledges it: the server does
+    not answer an event without a handler, so every hit would only time out.
+
+    :param players: The players
+    :param event: The name of the event
+    :param data: The payload
+    :param timeout: The seconds to wait
+    """
+    player = next((player for player in players if player.client.connected), None)
+    if player is None:
+        raise SystemExit("no player is connected")
+    if await player.request(event, data, timeout=timeout) is None:
+        raise SystemExit(
+            f"the server did not acknowledge {event!r}, pass an event it "
+            "handles with --hit-event"
+        )
+
+
+async def run(args) -> dict:
+    url = args.url or f"http://127.0.0.1:{args.port}"
+    credentials = (seed_players if args.seed else load_players)(args.clients)
+    players = [
+        Player(i, phone_number, token if args.flow == "token" else None)
+        for i, (phone_number, token) in enumerate(credentials)
+    ]
+    sampler = ProcessSampler(args.server_pid)
+    totp = pyotp.TOTP(Config.otp_base, interval=60)
+    room = {"gameId": args.game_id}
+    timeout = args.timeout
+
+    async def connect(player: Player, phase: Phase):
+        phase.record(await player.connect(url, timeout))
+
+    async def login(player: Player, phase: Phase):
+        if not player.client.connected:
+            return
+        if args.flow == "otp":
+            otp = {"phoneNumber": player.phone_number}
+            phase.record(await player.request("getOTP", otp, "getOTP", timeout=timeout))
+            otp["code"] = totp.now()
+            phase.record(
+                await player.request("verifySMS", otp, "loginResult", timeout=timeout)
+            )
+        else:
+            phase.record(await player.request("login", {}, "loginResult", timeout=timeout))
+
+    async def login_room(player: Player, phase: Phase):
+        if not player.client.connected:
+            return
+        context = dict(room, id=player.index)
+        phase.record(
+            await player.request(
+                "loginRoom",
+                context,
+                "loginRoom",
+                match=lambda data: isinstance(data, dict) and data.get("id") == player.index,
+                timeout=timeout,
+            )
+        )
+
+    def hit() -> dict:
+        return {"gameId": args.game_id, "fishId": secrets.randbelow(2**16), "bet": 1}
+
+    async def hits(player: Player, phase: Phase):
+        if not player.client.connected:
+            return
+        interval = 1 / args.hit_rate
+        ends = time.perf_counter() + args.duration
+        # Spread the players over the first interval.
+        await asyncio.sleep(interval * player.index / len(players))
+        while time.perf_counter() < ends:
+            started = time.perf_counter()
+            phase.record(await player.request(args.hit_event, hit(), timeout=timeout))
+            await asyncio.sleep(max(0.0, interval - (time.perf_counter() - started)))
+
+    async def logout_room(player: Player, phase: Phase):
+        if not player.client.connected:
+            return
+        phase.record(
+            await player.request("logoutRoom", dict(room, id=player.index), timeout=timeout)
+        )
+
+    async def disconnect(player: Player, phase: Phase):
+        if not player.client.connected:
+            return
+        started = time.perf_counter()
+        try:
+            await player.client.disconnect()
+            phase.record(time.perf_counter() - started)
+        except Exception:
+            phase.record(None)
+
+    steps = dict(
+        zip(PHASES, (connect, login, login_room, hits, logout_room, disconnect))
+    )
+    phases = []
+    for name in PHASES:
+        if name == "hits":
+            await check_handled(players, args.hit_event, hit(), timeout)
+        phases.append(await run_phase(name, players, steps[name], sampler, args.concurrency))
+        print(json.dumps(phases[-1]), file=sys.stderr)
+
+    return {
+        "started_at": datetime.now(pytz.utc).isoformat(),
+        "url": url,
+        "clients": args.clients,
+        "flow": args.flow,
+        "duration": args.duration,
+        "hit_rate": args.hit_rate,
+        "hit_event": args.hit_event,
+        "concurrency": args.concurrency,
+        "host": {"python": platform.python_version(), "cpus": os.cpu_count()},
+        "phases": phases,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--url", help="defaults to the worker started by --serve")
+    parser.add_argument("--serve", action="store_true")
+    parser.add_argument("--port", type=int, default=Config.fastapi_port + 1)
+    parser.add_argument("--server-pid", type=int)
+    parser.add_argument("--seed", action="store_true", help="create the load test users")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--flow", choices=("token", "otp"), default="token")
+    parser.add_argument("--game-id", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--hit-rate", type=float, default=2, help="hits per player per second")
+    parser.add_argument(
+        "--hit-event", default="fish_hit", help="an event the server acknowledges"
+    )
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--out", default="loadtest-results.json")
+    args = parser.parse_args()
+
+    server = serve(args.port) if args.serve else None
+    if server:
+        args.server_pid = server.pid
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+    with open(args.out, "w") as out:
+        json.dump(results, out, indent=2)
+    print(json.dumps(results["phases"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
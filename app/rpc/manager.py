@@ -0,0 +1,104 @@
+"""
+@author: Kuro
+"""
+import asyncio
+import logging
+import pickle
+from collections import defaultdict
+from typing import Dict, Optional, Set
+
+from socketio import AsyncRedisManager
+from socketio.asyncio_pubsub_manager import AsyncPubSubManager
+
+from settings import Config
+
+logger = logging.getLogger("socket_manager")
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.DEBUG)
+
+
+class LocalBus:
+    """
+    The LocalBus class is an in-process stand-in for Redis pub/sub: every
+    queue subscribed to a channel gets a copy of each message published on it.
+    """
+
+    def __init__(self):
+        self.subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+
+    def subscribe(self, channel: str, queue: Optional[asyncio.Queue] = None) -> asyncio.Queue:
+        queue = queue or asyncio.Queue()
+        self.subscribers[channel].add(queue)
+        return queue
+
+    def unsubscribe(self, channel: str, queue: asyncio.Queue) -> None:
+        self.subscribers[channel].discard(queue)
+
+    def publish(self, channel: str, message: bytes) -> int:
+        for queue in self.subscribers[channel]:
+            queue.put_nowait(message)
+        return len(self.subscribers[channel])
+
+
+local_bus = LocalBus()
+
+
+class AsyncLocalManager(AsyncPubSubManager):
+    """
+    The AsyncLocalManager class runs the pub/sub client manager over a
+    LocalBus, so several AsyncServer instances in one process behave like
+    socket workers sharing Redis. Messages are pickled on the way through, as
+    they are by AsyncRedisManager, so payloads that would not cross a process
+    boundary fail here too. It is meant for tests and local runs.
+    """
+
+    name = "asynclocal"
+
+    def __init__(
+        self,
+        channel: str = Config.socket_channel,
+        write_only: bool = False,
+        logger=None,
+        bus: Optional[LocalBus] = None,
+    ):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.bus = bus or local_bus
+
+    async def _publish(self, data):
+        return self.bus.publish(self.channel, pickle.dumps(data))
+
+    async def _listen(self):
+        queue = self.bus.subscribe(self.channel)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self.bus.unsubscribe(self.channel, queue)
+
+
+def manager_mode(mode: Optional[str] = None) -> str:
+    return mode or Config.socket_manager or (
+        "redis" if Config.socket_workers > 1 else "memory"
+    )
+
+
+def client_manager(mode: Optional[str] = None):
+    """
+    The client_manager function builds the Socket.IO client manager of the
+    socket tier. With more than one socket worker the Redis manager is the
+    default, so emits to a room reach its members on every worker and host.
+
+    :param mode: redis, local (in-process stand-in) or memory (single process)
+    :return: The client manager, or None for the default in-memory manager
+    """
+    mode = manager_mode(mode)
+    if mode == "redis":
+        logger.info(f"socket.io messages go through redis channel {Config.socket_channel}")
+        return AsyncRedisManager(Config.socket_redis_url, channel=Config.socket_channel)
+    if mode == "local":
+        return AsyncLocalManager()
+    if mode != "memory":
+        raise ValueError(f"unknown socket manager {mode}")
+    if Config.socket_workers > 1:
+        logger.warning("socket workers do not share rooms without the redis manager")
+    return None
@@ -0,0 +1,267 @@
+"""
+@author: Kuro
+"""
+import asyncio
+import contextlib
+import logging
+import time
+from typing import Dict, Iterable, List, Optional
+
+from redis.asyncio import Redis
+from sqlalchemy import bindparam
+from sqlalchemy.orm import Session
+
+from app.api.user.models import User
+from app.rpc.sessions import session_store
+from settings import Config
+
+logger = logging.getLogger("presence")
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.DEBUG)
+
+ONLINE = "presence:online"
+CHANGES = "presence:changes"
+
+# KEYS: online set, pending changes
+# ARGV: oldest live heartbeat
+REAP = """
+local stale = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', '(' .. ARGV[1])
+for _, user_id in ipairs(stale) do
+    redis.call('HSET', KEYS[2], user_id, 0)
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', '(' .. ARGV[1])
+return #stale
+"""
+
+# KEYS: online set, pending changes
+# ARGV: now, user ids
+# Users that had expired are recorded as back online.
+REFRESH = """
+for i = 2, #ARGV do
+    if redis.call('ZADD', KEYS[1], ARGV[1], ARGV[i]) == 1 then
+        redis.call('HSET', KEYS[2], ARGV[i], 1)
+    end
+end
+return #ARGV - 1
+"""
+
+# KEYS: pending changes
+# Pops every pending change at once, so two flushers never write the same one.
+POP_CHANGES = """
+local changes = redis.call('HGETALL', KEYS[1])
+redis.call('DEL', KEYS[1])
+return changes
+"""
+
+
+class Presence:
+    """
+    The Presence class tracks who is online in a Redis sorted set of user ids
+    scored by their last heartbeat. A user counts as online until
+    presence_ttl seconds without a heartbeat, so "who is online" and the
+    online count never touch Postgres. Every presence_flush_seconds each
+    worker refreshes the heartbeat of the users logged in on its sockets, so
+    a user stays online as long as a connection is open and expires once the
+    worker holding it is gone. Logins, logouts and expiries are recorded in a
+    hash of pending changes that is written to User.online in one
+    executemany on the same schedule.
+    """
+
+    def __init__(
+        self,
+        redis: Optional[Redis] = None,
+        ttl: float = Config.presence_ttl,
+        flush_seconds: float = Config.presence_flush_seconds,
+    ):
+        self._redis = redis
+        self.ttl = ttl
+        self.flush_seconds = flush_seconds
+        self._reap = None
+        self._refresh = None
+        self._pop_changes = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def redis(self) -> Redis:
+        if self._redis is None:
+            self._redis = Redis.from_url(Config.redis_host, decode_responses=True)
+        return self._redis
+
+    def _scripts(self):
+        if self._reap is None:
+            self._reap = self.redis.register_script(REAP)
+            self._refresh = self.redis.register_script(REFRESH)
+            self._pop_changes = self.redis.register_script(POP_CHANGES)
+        return self._reap, self._pop_changes
+
+    async def online(self, user_id: int) -> None:
+        """
+        The online function marks a user online, e.g. on login.
+
+        :param user_id: The id of the user
+        """
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zadd(ONLINE, {user_id: time.time()})
+            pipe.hset(CHANGES, user_id, 1)
+            await pipe.execute()
+
+    async def offline(self, user_id: int) -> None:
+        """
+        The offline function marks a user offline, e.g. on logout.
+
+        :param user_id: The id of the user
+        """
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zrem(ONLINE, user_id)
+            pipe.hset(CHANGES, user_id, 0)
+            await pipe.execute()
+
+    async def heartbeat(self, user_id: int) -> None:
+        """
+        The heartbeat function keeps a user online. A user that had already
+        expired comes back online.
+
+        :param user_id: The id of the user
+        """
+        if await self.redis.zadd(ONLINE, {user_id: time.time()}):
+            await self.redis.hset(CHANGES, user_id, 1)
+
+    async def refresh(self, user_ids: Iterable[int]) -> int:
+        """
+        The refresh function keeps users online in one round trip, e.g. the
+        users logged in on the sockets of this worker.
+
+        :param user_ids: The ids of the users
+        :return: The number of users refreshed
+        """
+        if not (user_ids := set(user_ids)):
+            return 0
+        self._scripts()
+        return await self._refresh(
+            keys=[ONLINE, CHANGES], args=[time.time(), *user_ids]
+        )
+
+    async def is_online(self, user_id: int) -> bool:
+        seen = await self.redis.zscore(ONLINE, user_id)
+        return seen is not None and seen >= time.time() - self.ttl
+
+    async def count(self) -> int:
+        return await self.redis.zcount(ONLINE, time.time() - self.ttl, "+inf")
+
+    async def online_users(self, offset: int = 0, limit: int = 100) -> List[int]:
+        """
+        The online_users function lists the users online, most recently seen
+        first.
+
+        :param offset: The number of users to skip
+        :param limit: The max number of users returned
+        :return: The user ids
+        """
+        user_ids = await self.redis.zrevrangebyscore(
+            ONLINE, "+inf", time.time() - self.ttl, start=offset, num=limit
+        )
+        return [int(user_id) for user_id in user_ids]
+
+    async def reap(self) -> int:
+        """
+        The reap function takes the users whose heartbeat expired offline.
+
+        :return: The number of users taken offline
+        """
+        reap, _ = self._scripts()
+        return await reap(keys=[ONLINE, CHANGES], args=[time.time() - self.ttl])
+
+    @staticmethod
+    def _write(changes: Dict[int, bool], session=None) -> None:
+        # Runs in an executor thread, so it opens a session of its own rather
+        # than sharing the models' one with the event loop.
+        opened = (
+            contextlib.nullcontext(session)
+            if session is not None
+            else contextlib.closing(Session(bind=User.session.get_bind()))
+        )
+        with opened as session:
+            try:
+                session.execute(
+                    User.__table__.update()
+                    .where(User.id == bindparam("user_id"))
+                    .values(online=bindparam("online")),
+                    [
+                        {"user_id": user_id, "online": online}
+                        for user_id, online in changes.items()
+                    ],
+                )
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+
+    async def flush(self, session=None) -> Dict[int, bool]:
+        """
+        The flush function writes the pending changes to User.online off the
+        event loop. When the write fails they are put back, unless a newer
+        change came in.
+
+        :param session: The database session, defaults to a session of its own
+        :return: The changes written, as {user id: online}
+        """
+        _, pop_changes = self._scripts()
+        flat = await pop_changes(keys=[CHANGES])
+        changes = {
+            int(user_id): bool(int(online))
+            for user_id, online in zip(flat[::2], flat[1::2])
+        }
+        if not changes:
+            return changes
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._write, changes, session
+            )
+        except Exception as e:
+            logger.error(e)
+            async with self.redis.pipeline(transaction=True) as pipe:
+                for user_id, online in changes.items():
+                    pipe.hsetnx(CHANGES, user_id, int(online))
+                await pipe.execute()
+            return {}
+        return changes
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.refresh(
+                    record.user_id for record in session_store if record.user_id
+                )
+                await self.reap()
+                await self.flush()
+            except Exception as e:
+                logger.exception(f"presence flush failed: {e}")
+
+    def start(self) -> None:
+        """
+        The start function starts the refresh and flush loop, as the startup
+        hook does. Without Redis there is nothing to track and it is not
+        started.
+        """
+        if self._redis is None and not Config.redis_host:
+            logger.warning("presence is not tracked without redis")
+            return
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self) -> None:
+        """
+        The stop function stops the loop and writes the changes still
+        pending, as the shutdown hook does. It does nothing when the loop was
+        never started.
+        """
+        if self.task is None:
+            return
+        self.task.cancel()
+        self.task = None
+        await self.reap()
+        await self.flush()
+
+
+presence = Presence()
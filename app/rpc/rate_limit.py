@@ -0,0 +1,180 @@
+"""
+@author: Kuro
+"""
+import asyncio
+import functools
+import json
+import logging
+import time
+from array import array
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from settings import Config
+
+logger = logging.getLogger("rate_limit")
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.DEBUG)
+
+# event: (tokens per second, burst)
+DEFAULT_LIMITS: Dict[str, Tuple[float, float]] = {
+    "fish_hit": (20, 40),
+    "loginRoom": (1, 3),
+    "logoutRoom": (1, 3),
+    "getOTP": (0.2, 2),
+    "verifySMS": (0.5, 3),
+    "login": (1, 3),
+    "logout": (1, 3),
+    "heartbeat": (1, 5),
+}
+# Events without a limit of their own share this bucket.
+OTHER = "*"
+
+ALLOWED, DELAYED, DROPPED = range(3)
+OUTCOMES = ("allowed", "delayed", "dropped")
+
+
+def configured_limits() -> Dict[str, Tuple[float, float]]:
+    limits = dict(DEFAULT_LIMITS)
+    limits[OTHER] = (Config.rate_limit_rate, Config.rate_limit_burst)
+    if Config.rate_limits:
+        limits.update(
+            {event: tuple(limit) for event, limit in json.loads(Config.rate_limits).items()}
+        )
+    return limits
+
+
+class RateLimiter:
+    """
+    The RateLimiter class keeps a token bucket per connection and event type
+    and is checked before a handler does any DB or pydantic work. Every
+    connection gets a slot, reused after it disconnects, and the buckets of
+    all slots live in two flat arrays of doubles (tokens, last refill) with
+    one column per event type, so a check is a few float operations.
+
+    An event over its limit is delayed when a token comes back within
+    max_delay seconds, and dropped otherwise. The allowed, delayed and
+    dropped counts of every event type are kept for monitoring.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Mapping[str, Tuple[float, float]]] = None,
+        max_delay: float = Config.rate_limit_max_delay,
+    ):
+        limits = dict(limits or configured_limits())
+        limits.setdefault(OTHER, (Config.rate_limit_rate, Config.rate_limit_burst))
+        self.events: List[str] = list(limits)
+        self.columns: Dict[str, int] = {event: i for i, event in enumerate(self.events)}
+        self.rates = array("d", (float(limits[event][0]) for event in self.events))
+        self.bursts = array("d", (float(limits[event][1]) for event in self.events))
+        self.max_delay = max_delay
+        self.slots: Dict[str, int] = {}
+        self.free: List[int] = []
+        self.tokens = array("d")
+        self.stamps = array("d")
+        self.counts = array("Q", bytes(8 * 3 * len(self.events)))
+
+    def slot(self, sid: str) -> int:
+        """
+        The slot function returns the slot of a connection, giving it a free
+        one with full buckets on its first event.
+
+        :param sid: The id of the socket
+        :return: The slot
+        """
+        if (slot := self.slots.get(sid)) is not None:
+            return slot
+        width = len(self.events)
+        if self.free:
+            slot = self.free.pop()
+        else:
+            slot = len(self.tokens) // width
+            self.tokens.extend(self.bursts)
+            self.stamps.extend(self.bursts)
+        now = time.monotonic()
+        start = slot * width
+        self.tokens[start : start + width] = self.bursts
+        for i in range(start, start + width):
+            self.stamps[i] = now
+        self.slots[sid] = slot
+        return slot
+
+    def release(self, sid: str) -> None:
+        if (slot := self.slots.pop(sid, None)) is not None:
+            self.free.append(slot)
+
+    def check(self, sid: str, event: str) -> float:
+        """
+        The check function takes a token for an event.
+
+        :param sid: The id of the socket
+        :param event: The name of the event
+        :return: 0 to run the event now, the seconds to delay it by, or -1 to
+            drop it
+        """
+        column = self.columns.get(event, self.columns[OTHER])
+        i = self.slot(sid) * len(self.events) + column
+        rate = self.rates[column]
+        now = time.monotonic()
+        tokens = min(self.bursts[column], self.tokens[i] + (now - self.stamps[i]) * rate)
+        self.stamps[i] = now
+        if tokens >= 1:
+            self.tokens[i] = tokens - 1
+            self.counts[column * 3 + ALLOWED] += 1
+            return 0.0
+        wait = (1 - tokens) / rate if rate > 0 else float("inf")
+        if wait <= self.max_delay:
+            # The token is spent ahead, so the bucket goes negative and
+            # later events wait behind this one.
+            self.tokens[i] = tokens - 1
+            self.counts[column * 3 + DELAYED] += 1
+            return wait
+        self.tokens[i] = tokens
+        self.counts[column * 3 + DROPPED] += 1
+        return -1.0
+
+    async def admit(self, sid: str, event: str) -> bool:
+        """
+        The admit function waits out a delayed event.
+
+        :param sid: The id of the socket
+        :param event: The name of the event
+        :return: False when the event is dropped
+        """
+        if (wait := self.check(sid, event)) < 0:
+            return False
+        if wait:
+            await asyncio.sleep(wait)
+        return True
+
+    def limit(self, event: Optional[str] = None):
+        """
+        The limit function decorates a socket handler so that events over the
+        limit are delayed or dropped before the handler runs.
+
+        :param event: The name of the event, defaults to the handler's name
+        """
+
+        def decorator(handler):
+            name = event or handler.__name__
+
+            @functools.wraps(handler)
+            async def limited(sid, *args, **kwargs):
+                if not await self.admit(sid, name):
+                    return None
+                return await handler(sid, *args, **kwargs)
+
+            return limited
+
+        return decorator
+
+    def counters(self) -> Dict[str, Dict[str, int]]:
+        return {
+            event: {
+                outcome: self.counts[column * 3 + i] for i, outcome in enumerate(OUTCOMES)
+            }
+            for event, column in self.columns.items()
+        }
+
+
+rate_limiter = RateLimiter()
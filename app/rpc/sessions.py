@@ -0,0 +1,179 @@
+"""
+@author: Kuro
+"""
+import json
+from typing import Dict, Iterator, Optional
+
+from redis.asyncio import Redis
+
+from settings import Config
+
+# Where the record of a user is kept in Redis between two connections.
+SESSION_KEY = "session:{user_id}"
+
+
+def connection_token(environ: dict, auth: Optional[dict] = None) -> Optional[str]:
+    """
+    The connection_token function returns the access token a client connected
+    with, from the socket.io auth payload or the Authorization header.
+
+    :param environ: The WSGI environ of the connection
+    :param auth: The auth payload of the connection, if any
+    :return: The access token, or None when the client sent none
+    """
+    if isinstance(auth, dict) and auth.get("token"):
+        return auth["token"]
+    parts = (environ or {}).get("HTTP_AUTHORIZATION", "").split(" ")
+    return parts[1] if len(parts) > 1 else None
+
+
+class SessionRecord:
+    """
+    The SessionRecord class is what the socket tier keeps per connection:
+    the ids of the user, table and seat and the login state, instead of the
+    pydantic Session and User schemas. It is only turned into a dict when it
+    is persisted or migrated to another worker.
+    """
+
+    __slots__ = (
+        "sid",
+        "user_id",
+        "phone_number",
+        "access_token",
+        "state",
+        "game_id",
+        "table",
+        "seat",
+    )
+
+    def __init__(
+        self,
+        sid: str,
+        user_id: Optional[int] = None,
+        phone_number: Optional[str] = None,
+        access_token: Optional[str] = None,
+        state: Optional[str] = None,
+        game_id: Optional[int] = None,
+        table: Optional[str] = None,
+        seat: Optional[int] = None,
+    ):
+        self.sid = sid
+        self.user_id = user_id
+        self.phone_number = phone_number
+        self.access_token = access_token
+        self.state = state
+        self.game_id = game_id
+        self.table = table
+        self.seat = seat
+
+    def __repr__(self) -> str:
+        return (
+            f"SessionRecord(sid={self.sid!r}, user_id={self.user_id}, "
+            f"state={self.state!r}, table={self.table!r}, seat={self.seat})"
+        )
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SessionRecord":
+        return cls(**{name: data.get(name) for name in cls.__slots__})
+
+    def join(self, game_id: int, table: str, seat: int) -> None:
+        self.game_id = game_id
+        self.table = table
+        self.seat = seat
+
+    def leave(self) -> None:
+        self.game_id = None
+        self.table = None
+        self.seat = None
+
+
+class SessionStore:
+    """
+    The SessionStore class keeps the SessionRecord of every connection of
+    this worker in a dict keyed by sid, so the socket handlers read and
+    update plain attributes with no validation on every event.
+
+    A reconnect gets a new sid and may land on another worker, so the record
+    of a logged in user is persisted to Redis under their user id when the
+    connection closes, and restored from there when they connect again.
+    """
+
+    def __init__(self, redis: Optional[Redis] = None, ttl: float = Config.session_ttl):
+        self._redis = redis
+        self.ttl = ttl
+        self.records: Dict[str, SessionRecord] = {}
+
+    @property
+    def redis(self) -> Redis:
+        if self._redis is None:
+            self._redis = Redis.from_url(Config.redis_host, decode_responses=True)
+        return self._redis
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self) -> Iterator[SessionRecord]:
+        return iter(self.records.values())
+
+    def get(self, sid: str) -> Optional[SessionRecord]:
+        return self.records.get(sid)
+
+    def open(self, sid: str) -> SessionRecord:
+        """
+        The open function returns the record of a connection, creating it on
+        the first event of the connection.
+
+        :param sid: The id of the socket
+        :return: The SessionRecord
+        """
+        if (record := self.records.get(sid)) is None:
+            record = self.records[sid] = SessionRecord(sid)
+        return record
+
+    def drop(self, sid: str) -> Optional[SessionRecord]:
+        return self.records.pop(sid, None)
+
+    async def persist(self, record: SessionRecord) -> None:
+        """
+        The persist function saves the record of a user for ttl seconds, as
+        the disconnect handler does once the record is dropped here.
+        Anonymous records are not kept: nothing identifies their next
+        connection.
+
+        :param record: The SessionRecord of the closed connection
+        """
+        if not record.user_id:
+            return
+        key = SESSION_KEY.format(user_id=record.user_id)
+        await self.redis.set(key, json.dumps(record.to_dict()), ex=int(self.ttl))
+
+    async def restore(
+        self, sid: str, user_id: Optional[int]
+    ) -> Optional[SessionRecord]:
+        """
+        The restore function returns the record of a connection, taking the
+        record persisted for its user when this worker does not hold it, as
+        the connect handler does before opening a new one. The persisted
+        record is removed, so only one connection restores it.
+
+        :param sid: The id of the socket
+        :param user_id: The id of the user the socket's token resolves to
+        :return: The SessionRecord, or None when none is held or persisted
+        """
+        if (record := self.records.get(sid)) is not None:
+            return record
+        if not user_id:
+            return None
+        data = await self.redis.getdel(SESSION_KEY.format(user_id=user_id))
+        if not data:
+            return None
+        record = SessionRecord.from_dict(json.loads(data))
+        record.sid = sid
+        self.records[sid] = record
+        return record
+
+
+session_store = SessionStore()
@@ -0,0 +1,7 @@
+from sqlalchemy.orm import configure_mappers
+
+
+def test_models_of_the_socket_app_configure():
+    import app.rpc  # noqa: F401  loaded as run.py loads it
+
+    configure_mappers()
@@ -0,0 +1,94 @@
+import asyncio
+
+from app.rpc.broadcast import RoomBroadcaster
+from app.rpc.codec import ConnectionCodecs, decode
+
+
+class Server:
+    class Manager:
+        rooms = {}
+
+    manager = Manager()
+
+    def __init__(self):
+        self.sent = []
+
+    async def emit(self, event, data, room=None):
+        self.sent.append((room, event, data))
+
+    def enter_room(self, sid, room, namespace=None):
+        pass
+
+
+async def seated(server, room, **connections):
+    codecs = ConnectionCodecs(shared=False)
+    for sid, auth in connections.items():
+        codecs.negotiate(
+            sid, codecs.offered(auth=auth), codecs.wants_batches(auth=auth)
+        )
+        await codecs.enter_room(server, sid, room)
+    return codecs
+
+
+def test_tick_events_go_out_as_one_batch_per_codec():
+    async def main():
+        server = Server()
+        codecs = await seated(
+            server, "table0", a={}, b={"batch": True}, c={"codec": [1]}
+        )
+        broadcaster = RoomBroadcaster(server, codecs, flush_ms=10_000)
+        broadcaster.queue("table0", "pool", {"pool": 1, "virtualPool": 0})
+        broadcaster.queue(
+            "table0", "fish_hit", [{"user_id": 1, "reward_id": 2, "win": 3}]
+        )
+        assert await broadcaster.flush("table0") == 2
+        return server.sent
+
+    sent = asyncio.run(main())
+    legacy = [(event, data) for room, event, data in sent if room == "table0"]
+    assert [event for event, _ in legacy] == ["pool", "fish_hit"]
+    assert [(room, event) for room, event, _ in sent if room != "table0"] == [
+        ("table0#batch", "batch"),
+        ("table0#v1", "batch"),
+    ]
+    assert sent[2][2] == [list(event) for event in legacy]
+    assert decode(sent[3][2]) == ("batch", [tuple(event) for event in legacy])
+
+
+def test_deadline_and_byte_cap_flush_the_room():
+    async def main():
+        server = Server()
+        codecs = await seated(server, "table0", a={})
+        broadcaster = RoomBroadcaster(server, codecs, flush_ms=20, max_events=2)
+        broadcaster.queue("table0", "pool", {"pool": 1})
+        await asyncio.sleep(0.05)
+        after_deadline = broadcaster.sent_batches
+        broadcaster.queue("table1", "pool", {"pool": 1})
+        broadcaster.queue("table1", "pool", {"pool": 2})
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return after_deadline, broadcaster.sent_batches, broadcaster.rooms
+
+    after_deadline, sent_batches, rooms = asyncio.run(main())
+    assert after_deadline == 1
+    assert sent_batches == 2
+    assert rooms == {}
+
+
+def test_only_channels_with_members_are_sent_to():
+    async def main():
+        server = Server()
+        codecs = await seated(server, "table0", a={"codec": [1]}, b={"codec": [1]})
+        broadcaster = RoomBroadcaster(server, codecs, flush_ms=10_000)
+        broadcaster.queue("table0", "pool", {"pool": 1})
+        broadcaster.queue("table1", "pool", {"pool": 1})
+        await broadcaster.flush_all()
+        await codecs.close("a")
+        await codecs.close("b")
+        broadcaster.queue("table0", "pool", {"pool": 2})
+        await broadcaster.flush_all()
+        return server.sent, codecs.members
+
+    sent, members = asyncio.run(main())
+    assert [(room, event) for room, event, _ in sent] == [("table0#v1", "batch")]
+    assert members == {}
@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from app.games.fish.schema import Fish, Pool
+from app.rpc.broadcast import RoomBroadcaster
+from app.rpc.codec import JSON, ConnectionCodecs, decode, encode
+
+
+def test_hot_events_round_trip():
+    fish = Fish(fish_id=9, fish_type=3, fish_path="p-1", coin=50, fish_count=1)
+    assert decode(encode(1, "FishOut", fish)) == ("FishOut", fish.dict())
+
+    hits = [
+        {"user_id": 1, "reward_id": 2, "win": 300},
+        {"user_id": 3, "reward_id": 2, "win": 0},
+    ]
+    assert decode(encode(1, "fish_hit", hits)) == ("fish_hit", hits)
+
+    assert decode(encode(1, "pool", Pool(pool=7))) == (
+        "pool",
+        {"pool": 7, "virtualPool": None},
+    )
+    room = {"id": 1, "game_id": 2, "balance": None, "ip": None}
+    event, decoded = decode(encode(1, "loginRoom", room))
+    assert event == "loginRoom" and decoded["balance"] is None and decoded["ip"] is None
+
+    assert encode(JSON, "pool", Pool(pool=7)) == {"pool": 7}
+    assert encode(1, "getOTP", {"a": 1}) == {"a": 1}
+
+
+def test_broadcast_is_encoded_once_per_codec():
+    class Server:
+        def __init__(self):
+            self.sent = []
+
+        async def emit(self, event, data, room=None, to=None):
+            self.sent.append((room or to, data))
+
+        def enter_room(self, sid, room, namespace=None):
+            pass
+
+    async def main():
+        for sid in ("a", "b", "c"):
+            await codecs.enter_room(server, sid, "table0")
+        await codecs.emit(server, "pool", Pool(pool=7), room="table0")
+
+    codecs = ConnectionCodecs(shared=False)
+    assert codecs.negotiate("a", codecs.offered(auth={"codec": [1, 99]})) == 1
+    assert codecs.negotiate("b", codecs.offered({"QUERY_STRING": "EIO=4"})) == JSON
+    assert codecs.negotiate("c", [], batch=True) == JSON
+    server = Server()
+    asyncio.run(main())
+    assert server.sent[0] == ("table0", {"pool": 7})
+    assert server.sent[1] == ("table0#batch", {"pool": 7})
+    assert server.sent[2][0] == "table0#v1"
+    assert decode(server.sent[2][1]) == ("pool", {"pool": 7, "virtualPool": None})
+
+
+def test_workers_share_the_members_of_a_channel():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    class Server:
+        def enter_room(self, sid, room, namespace=None):
+            pass
+
+        leave_room = enter_room
+
+    async def main():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        worker, other = ConnectionCodecs(redis, True), ConnectionCodecs(redis, True)
+        other.negotiate("a", [1])
+        other.negotiate("b", [1])
+        await other.enter_room(Server(), "a", "table0")
+        await other.enter_room(Server(), "b", "table0")
+        await other.leave_room(Server(), "a", "table0")
+        joined = await worker.subscribed("table0")
+        await other.close("b")
+        return joined, await worker.subscribed("table0")
+
+    joined, after = asyncio.run(main())
+    assert joined == [("table0#v1", 1, True)]
+    assert after == []
+
+
+def test_a_client_that_never_negotiated_gets_json_everywhere():
+    class Server:
+        class Manager:
+            rooms = {}
+
+        manager = Manager()
+
+        def __init__(self):
+            self.sent = []
+
+        async def emit(self, event, data, room=None, to=None):
+            self.sent.append((room or to, event, data))
+
+        def enter_room(self, sid, room, namespace=None):
+            self.sent.append((sid, "entered", room))
+
+    async def main():
+        server, codecs = Server(), ConnectionCodecs(shared=False)
+        await codecs.enter_room(server, "x", "table0")
+        await codecs.emit(server, "pool", Pool(pool=7), to="x")
+        await codecs.emit(server, "pool", Pool(pool=7), room="table0")
+        broadcaster = RoomBroadcaster(server, codecs, flush_ms=10_000)
+        broadcaster.queue(
+            "table0", "fish_hit", [{"user_id": 1, "reward_id": 2, "win": 3}]
+        )
+        await broadcaster.flush("table0")
+        return server.sent
+
+    pool = Pool(pool=7).dict()
+    assert asyncio.run(main()) == [
+        ("x", "entered", "table0"),
+        ("x", "pool", pool),
+        ("table0", "pool", pool),
+        ("table0", "fish_hit", [{"user_id": 1, "reward_id": 2, "win": 3}]),
+    ]
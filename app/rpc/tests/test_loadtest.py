@@ -0,0 +1,45 @@
+import asyncio
+import os
+
+import pytest
+
+from app.rpc.loadtest import Phase, ProcessSampler, check_handled, percentiles
+
+
+def test_percentiles_are_in_milliseconds():
+    summary = percentiles([i / 1000 for i in range(1, 101)])
+    assert summary["p50"] == 50.5 and summary["p99"] == 99.01 and summary["max"] == 100
+    assert percentiles([])["p95"] is None
+
+
+def test_phase_reports_server_usage():
+    async def main():
+        async with Phase("hits", ProcessSampler(os.getpid(), interval=0.01)) as phase:
+            for latency in (0.001, None, 0.003):
+                phase.record(latency)
+            sum(range(10**6))
+            await asyncio.sleep(0.05)
+        return phase.result()
+
+    result = asyncio.run(main())
+    assert (result["events"], result["errors"]) == (3, 1)
+    assert result["latency_ms"]["max"] == 3
+    assert result["server_cpu_percent"] > 0 and result["server_peak_rss_mb"] > 0
+
+
+def test_an_unhandled_hit_event_stops_the_run():
+    class Client:
+        connected = True
+
+    class Player:
+        client = Client()
+
+        def __init__(self, answer):
+            self.answer = answer
+
+        async def request(self, event, data=None, timeout=10):
+            return self.answer
+
+    asyncio.run(check_handled([Player(0.002)], "heartbeat", {}, 1))
+    with pytest.raises(SystemExit, match="fish_hit"):
+        asyncio.run(check_handled([Player(None)], "fish_hit", {}, 1))
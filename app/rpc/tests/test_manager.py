@@ -0,0 +1,40 @@
+import asyncio
+
+from socketio import AsyncServer
+
+from app.rpc.manager import AsyncLocalManager, LocalBus
+
+
+def test_room_emits_reach_every_worker():
+    async def main():
+        bus = LocalBus()
+        workers = [
+            AsyncServer(async_mode="asgi", client_manager=AsyncLocalManager(bus=bus))
+            for _ in range(2)
+        ]
+        sent = {0: [], 1: []}
+        for i, worker in enumerate(workers):
+            worker.manager.initialize()
+
+            async def send_packet(eio_sid, packet, i=i):
+                sent[i].append((eio_sid, packet.data))
+
+            worker._send_eio_packet = send_packet
+        await asyncio.sleep(0)
+
+        sid = workers[1].manager.connect("eio-1", "/")
+        workers[1].manager.enter_room(sid, "/", "table-1")
+        workers[0].manager.connect("eio-0", "/")
+
+        await workers[0].emit("FishOut", {"fish_id": 1}, room="table-1")
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+        for worker in workers:
+            worker.manager.thread.cancel()
+        return sent
+
+    sent = asyncio.run(main())
+
+    assert sent[0] == []
+    assert sent[1] == [("eio-1", '2["FishOut",{"fish_id":1}]')]
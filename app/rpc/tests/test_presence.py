@@ -0,0 +1,97 @@
+import asyncio
+import time
+
+import pytest
+
+from app.rpc.presence import CHANGES, ONLINE, Presence
+from settings import Config
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+
+def tracker(server=None, **kwargs):
+    redis = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    presence = Presence(redis, **kwargs)
+    presence.written = []
+    presence._write = lambda changes, session=None: presence.written.append(changes)
+    return presence
+
+
+def test_reap_takes_expired_users_offline():
+    async def main():
+        presence = tracker(ttl=60)
+        now = time.time()
+        await presence.redis.zadd(ONLINE, {1: now - 120, 2: now - 61, 3: now})
+        return (
+            await presence.reap(),
+            await presence.redis.zrange(ONLINE, 0, -1),
+            await presence.redis.hgetall(CHANGES),
+        )
+
+    reaped, online, changes = asyncio.run(main())
+    assert (reaped, online, changes) == (2, ["3"], {"1": "0", "2": "0"})
+
+
+def test_refresh_records_only_users_that_came_back():
+    async def main():
+        presence = tracker()
+        await presence.redis.zadd(ONLINE, {1: 0})
+        refreshed = await presence.refresh([1, 2, 2])
+        return (
+            refreshed,
+            await presence.redis.zscore(ONLINE, 1),
+            await presence.redis.hgetall(CHANGES),
+            await presence.refresh([]),
+        )
+
+    refreshed, seen, changes, none = asyncio.run(main())
+    assert refreshed == 2 and seen > 0
+    assert changes == {"2": "1"}
+    assert none == 0
+
+
+def test_flush_pops_the_changes_once():
+    async def main():
+        presence = tracker()
+        await presence.online(1)
+        await presence.offline(2)
+        first, second = await presence.flush(), await presence.flush()
+        return first, second, presence.written, presence.task
+
+    first, second, written, task = asyncio.run(main())
+    assert first == {1: True, 2: False} and second == {}
+    assert written == [first]
+    assert task is None
+
+
+def test_a_failed_flush_puts_the_changes_back():
+    server = fakeredis.FakeServer()
+
+    def fail(changes, session=None):
+        # A newer change comes in while the write is failing.
+        fakeredis.FakeRedis(server=server).hset(CHANGES, 2, 1)
+        raise RuntimeError("database is down")
+
+    async def main():
+        presence = tracker(server)
+        presence._write = fail
+        await presence.offline(1)
+        await presence.offline(2)
+        return await presence.flush(), await presence.redis.hgetall(CHANGES)
+
+    written, changes = asyncio.run(main())
+    assert written == {}
+    assert changes == {"1": "0", "2": "1"}
+
+
+def test_stop_without_redis_does_nothing(monkeypatch):
+    monkeypatch.setattr(Config, "redis_host", "")
+
+    async def main():
+        presence = Presence()
+        presence.start()
+        await presence.stop()
+        return presence.task, presence._redis
+
+    assert asyncio.run(main()) == (None, None)
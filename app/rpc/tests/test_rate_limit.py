@@ -0,0 +1,45 @@
+import asyncio
+
+from app.rpc.rate_limit import RateLimiter
+
+
+def test_bucket_allows_burst_then_delays_then_drops():
+    limiter = RateLimiter({"fish_hit": (10, 3)}, max_delay=0.15)
+    outcomes = [limiter.check("a", "fish_hit") for _ in range(6)]
+    assert outcomes[:3] == [0.0, 0.0, 0.0]
+    assert 0 < outcomes[3] <= 0.15
+    assert outcomes[-1] == -1.0
+    # Another connection and another event type have buckets of their own.
+    assert limiter.check("b", "fish_hit") == 0.0
+    assert limiter.check("a", "loginRoom") == 0.0
+
+    counters = limiter.counters()["fish_hit"]
+    assert counters["allowed"] == 4 and counters["delayed"] >= 1
+    assert sum(counters.values()) == 7
+
+
+def test_released_slot_is_reused_with_full_buckets():
+    limiter = RateLimiter({"fish_hit": (1, 1)}, max_delay=0)
+    assert limiter.check("a", "fish_hit") == 0.0
+    assert limiter.check("a", "fish_hit") == -1.0
+    slot = limiter.slots["a"]
+    limiter.release("a")
+    assert limiter.slot("b") == slot
+    assert limiter.check("b", "fish_hit") == 0.0
+    assert len(limiter.tokens) == len(limiter.events)
+
+
+def test_limited_handler_skips_dropped_events():
+    limiter = RateLimiter({"loginRoom": (1, 2)}, max_delay=0)
+    calls = []
+
+    @limiter.limit("loginRoom")
+    async def login_room(sid, context):
+        calls.append(context)
+        return context
+
+    async def main():
+        return [await login_room("a", i) for i in range(4)]
+
+    assert asyncio.run(main()) == [0, 1, None, None]
+    assert calls == [0, 1]
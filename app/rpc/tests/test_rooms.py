@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from app.rpc.game.rooms import (
+    FREE_ROOMS,
+    ROOM,
+    SEATS,
+    RoomRegistry,
+    RoomUnavailable,
+    SeatClaim,
+)
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+
+def registry(**kwargs):
+    return RoomRegistry(fakeredis.FakeAsyncRedis(decode_responses=True), **kwargs)
+
+
+def test_concurrent_claims_never_share_a_seat():
+    async def main():
+        rooms = registry()
+        seats = await asyncio.gather(*(rooms.claim(1, user, 4) for user in range(10)))
+        held = {
+            name: await rooms.room(1, name) for name in {s.room_name for s in seats}
+        }
+        return seats, held, await rooms.free_rooms(1)
+
+    seats, held, free = asyncio.run(main())
+    assert len({(s.room_name, s.seat_id) for s in seats}) == 10
+    assert sorted(len(room["seats"]) for room in held.values()) == [2, 4, 4]
+    assert free == [name for name, room in held.items() if len(room["seats"]) < 4]
+
+
+def test_a_full_room_sends_the_next_player_to_a_new_one():
+    async def main():
+        rooms = registry()
+        first = [await rooms.claim(1, user, 2) for user in range(2)]
+        return first, await rooms.claim(1, 2, 2), await rooms.claim(1, 0, 2)
+
+    (a, b), third, again = asyncio.run(main())
+    assert a.room_name == b.room_name and (a.seat_id, b.seat_id) == (0, 1)
+    assert third.created and third.room_name != a.room_name
+    assert again == SeatClaim(1, a.room_name, 0)
+
+
+def test_stale_free_room_entries_are_dropped():
+    async def main():
+        rooms = registry()
+        await rooms.redis.zadd(FREE_ROOMS % 1, {"1-gone": 3})
+        seat = await rooms.claim(1, 7, 4)
+        return seat, await rooms.free_rooms(1)
+
+    seat, free = asyncio.run(main())
+    assert seat.created and seat.room_name != "1-gone"
+    assert free == [seat.room_name]
+
+
+def test_release_follows_a_seat_that_moved():
+    async def main():
+        rooms = registry()
+        seat = await rooms.claim(1, 7, 4)
+        await rooms.claim(1, 8, 4)
+        read = rooms.seat_of
+
+        async def stale(game_id, user_id):
+            rooms.seat_of = read
+            return SeatClaim(game_id, "1-moved", 0)
+
+        rooms.seat_of = stale
+        released = await rooms.release(1, 7)
+        return seat, released, await rooms.room(1, seat.room_name), rooms.redis
+
+    seat, released, room, redis = asyncio.run(main())
+    assert released == SeatClaim(1, seat.room_name, seat.seat_id)
+    assert room["seats"] == {1: 8}
+    assert asyncio.run(redis.hget(SEATS % 1, 7)) is None
+
+
+def test_release_deletes_an_empty_room():
+    async def main():
+        rooms = registry()
+        seat = await rooms.claim(1, 7, 4)
+        await rooms.release(1, 7)
+        return (
+            seat,
+            await rooms.redis.exists(ROOM % (1, seat.room_name)),
+            await rooms.free_rooms(1),
+            await rooms.release(1, 7),
+        )
+
+    _, exists, free, again = asyncio.run(main())
+    assert (exists, free, again) == (0, [], None)
+
+
+def test_the_last_attempt_creates_a_room():
+    async def main(refuse_all):
+        rooms = registry(attempts=3)
+        claim, _ = rooms._scripts()
+        forced = []
+
+        async def refusing(keys, args):
+            forced.append(args[-1])
+            if refuse_all or not args[-1]:
+                return ["1-elsewhere"]
+            return await claim(keys=keys, args=args)
+
+        rooms._claim = refusing
+        return await rooms.claim(1, 7, 4), forced
+
+    seat, forced = asyncio.run(main(False))
+    assert seat.created and forced == [0, 0, 1]
+    with pytest.raises(RoomUnavailable):
+        asyncio.run(main(True))
@@ -0,0 +1,71 @@
+import asyncio
+
+from app.rpc.sessions import SessionRecord, SessionStore, connection_token
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    async def getdel(self, key):
+        return self.values.pop(key, None)
+
+
+def test_records_are_compact_and_round_trip():
+    store = SessionStore()
+    record = store.open("sid-1")
+    assert store.open("sid-1") is record
+    record.user_id = 42
+    record.state = "login_success"
+    record.join(7, "7-1", 2)
+
+    assert not hasattr(record, "__dict__")
+    assert SessionRecord.from_dict(record.to_dict()).to_dict() == record.to_dict()
+
+    record.leave()
+    assert (record.game_id, record.table, record.seat) == (None, None, None)
+    assert store.drop("sid-1") is record and store.get("sid-1") is None
+
+
+def test_persisted_record_is_restored_on_another_worker():
+    async def main():
+        redis = FakeRedis()
+        store, other = SessionStore(redis), SessionStore(redis)
+        record = store.open("sid-1")
+        record.user_id = 42
+        record.state = "login_success"
+        await store.persist(store.drop("sid-1"))
+
+        # The reconnect has a new sid and lands on another worker.
+        restored = await other.restore("sid-2", 42)
+        return restored, await other.restore("sid-3", 42), other.get("sid-2")
+
+    restored, again, held = asyncio.run(main())
+    assert (restored.sid, restored.user_id, restored.state) == (
+        "sid-2",
+        42,
+        "login_success",
+    )
+    assert held is restored
+    assert again is None
+
+
+def test_anonymous_records_are_not_persisted():
+    async def main():
+        redis = FakeRedis()
+        store = SessionStore(redis)
+        await store.persist(store.open("sid-1"))
+        return redis.values, await SessionStore(redis).restore("sid-2", None)
+
+    values, restored = asyncio.run(main())
+    assert values == {} and restored is None
+
+
+def test_the_token_is_read_from_auth_or_the_header():
+    environ = {"HTTP_AUTHORIZATION": "Bearer header-token"}
+    assert connection_token(environ, {"token": "auth-token"}) == "auth-token"
+    assert connection_token(environ, None) == "header-token"
+    assert connection_token({}, None) is None
@@ -0,0 +1,87 @@
+import asyncio
+
+from app.rpc.game.tables import (
+    HashRing,
+    LocalTableBus,
+    TableRouter,
+    seat_player,
+    unseat_player,
+)
+from app.rpc.manager import LocalBus
+
+
+class Members:
+    def __init__(self):
+        self.workers = set()
+
+    async def join(self, worker_id, ttl):
+        self.workers.add(worker_id)
+
+    async def leave(self, worker_id):
+        self.workers.discard(worker_id)
+
+    async def members(self):
+        return list(self.workers)
+
+
+def test_ring_moves_few_tables_when_a_worker_joins():
+    tables = [f"7-{i}" for i in range(2000)]
+    ring = HashRing(["a", "b", "c"])
+    before = {table: ring.owner(table) for table in tables}
+    assert set(before.values()) == {"a", "b", "c"}
+    ring.add("d")
+    moved = [table for table in tables if ring.owner(table) != before[table]]
+    assert all(ring.owner(table) == "d" for table in moved)
+    assert 300 < len(moved) < 700
+
+
+def test_events_run_on_the_owner_and_follow_a_handoff():
+    async def main():
+        members, bus = Members(), LocalTableBus(LocalBus())
+        routers = {
+            worker: TableRouter(worker, members, bus, handoff_timeout=0.2)
+            for worker in ("a", "b")
+        }
+        runs = []
+        for worker, router in routers.items():
+
+            @router.handler("fish_hit")
+            def hit(state, payload, worker=worker):
+                state["hits"] = state.get("hits", 0) + payload
+                runs.append(worker)
+
+        await routers["a"].start()
+        await routers["b"].start()
+        await asyncio.sleep(0.05)
+        table = next(f"7-{i}" for i in range(100) if routers["a"].ring.owner(f"7-{i}") == "b")
+        for _ in range(3):
+            await routers["a"].dispatch(table, "fish_hit", 1)
+        await asyncio.sleep(0.05)
+        assert runs == ["b"] * 3 and routers["b"].tables[table].state == {"hits": 3}
+        assert table not in routers["a"].tables
+
+        await routers["b"].stop()
+        await routers["a"].dispatch(table, "fish_hit", 1)
+        await asyncio.sleep(0.05)
+        assert routers["a"].tables[table].state == {"hits": 4} and runs[-1] == "a"
+        await routers["a"].stop()
+
+    asyncio.run(main())
+
+
+def test_seats_are_kept_on_the_owner_of_the_table():
+    async def main():
+        router = TableRouter("a", Members(), LocalTableBus(LocalBus()))
+        router.handler("seat")(seat_player)
+        router.handler("unseat")(unseat_player)
+        await router.start()
+        await router.dispatch("7-1", "seat", {"user_id": 1, "seat": 0})
+        await router.dispatch("7-1", "seat", {"user_id": 2, "seat": 1})
+        await router.dispatch("7-1", "unseat", {"user_id": 1})
+        await router.dispatch("7-1", "unseat", {"user_id": 3})
+        await asyncio.sleep(0.05)
+        state = router.tables["7-1"].state
+        await router.stop()
+        return state
+
+    assert asyncio.run(main()) == {"seats": {2: 1}}
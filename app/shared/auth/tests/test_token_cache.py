@@ -0,0 +1,83 @@
+import asyncio
+
+from app.shared.auth.token_cache import TokenCache, token_hash
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+        self.published = []
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = str(value)
+
+    def pipeline(self, transaction=True):
+        redis = self
+
+        class Pipeline:
+            async def __aenter__(self):
+                self.calls = []
+                return self
+
+            async def __aexit__(self, *_):
+                return False
+
+            def delete(self, key):
+                self.calls.append(lambda: redis.values.pop(key, None))
+
+            def publish(self, channel, message):
+                self.calls.append(lambda: redis.published.append((channel, message)))
+
+            async def execute(self):
+                return [call() for call in self.calls]
+
+        return Pipeline()
+
+
+def cache_with(users, redis=None, **kwargs):
+    cache = TokenCache(redis or FakeRedis(), **kwargs)
+    cache.start = lambda: None
+    cache.lookups = 0
+
+    def lookup(digest):
+        cache.lookups += 1
+        return users.get(digest)
+
+    cache._lookup = lookup
+    return cache
+
+
+def test_tokens_resolve_from_the_fastest_layer():
+    async def main():
+        redis = FakeRedis()
+        users = {token_hash("a"): 1}
+        cache = cache_with(users, redis)
+        assert [await cache.resolve("a") for _ in range(3)] == [1, 1, 1]
+        assert await cache.resolve("unknown") is None
+        assert await cache.resolve("unknown") is None
+        assert cache.lookups == 2
+
+        other_worker = cache_with(users, redis)
+        assert await other_worker.resolve("a") == 1
+        assert other_worker.lookups == 0
+
+    asyncio.run(main())
+
+
+def test_issue_and_logout_invalidate_the_token():
+    async def main():
+        cache = cache_with({}, max_entries=2)
+        await cache.remember("new", 5)
+        assert await cache.resolve("new") == 5 and cache.lookups == 0
+        await cache.forget("new")
+        assert await cache.resolve("new") is None
+        assert cache.redis.published == [("token:invalidate", token_hash("new"))]
+
+        for token in ("x", "y", "z"):
+            await cache.remember(token, 1)
+        assert len(cache.entries) == 2 and token_hash("x") not in cache.entries
+
+    asyncio.run(main())
@@ -0,0 +1,202 @@
+"""
+@author: Kuro
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from redis.asyncio import Redis
+from sqlalchemy import text
+
+from app.api.user.models import User
+from settings import Config
+
+logger = logging.getLogger("token_cache")
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.DEBUG)
+
+TOKEN = "token:%s"
+INVALIDATE = "token:invalidate"
+
+# Tokens issued before User.accessTokenHash existed.
+BACKFILL = text(
+    'UPDATE "User" SET "accessTokenHash" = encode(sha256(convert_to("accessToken", '
+    "'UTF8')), 'hex') WHERE \"accessToken\" IS NOT NULL AND \"accessTokenHash\" IS NULL"
+)
+
+
+def token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class TokenCache:
+    """
+    The TokenCache class resolves access tokens to user ids. A token is
+    looked up by its SHA-256 in an in-process TTL LRU, then in Redis, and
+    only then in Postgres through the indexed User.accessTokenHash column,
+    so a reconnect storm costs one dict lookup per socket once the tokens are
+    warm. Unknown tokens are cached briefly too.
+
+    Issuing a token (remember) and clearing it (forget) update both layers,
+    and forget tells the other workers to drop the token through Redis
+    pub/sub.
+    """
+
+    def __init__(
+        self,
+        redis: Optional[Redis] = None,
+        ttl: float = Config.token_cache_ttl,
+        max_entries: int = Config.token_cache_size,
+        negative_ttl: float = Config.token_cache_negative_ttl,
+    ):
+        self._redis = redis
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.negative_ttl = negative_ttl
+        self.entries: "OrderedDict[str, Tuple[Optional[int], float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def redis(self) -> Redis:
+        if self._redis is None:
+            self._redis = Redis.from_url(Config.redis_host, decode_responses=True)
+        return self._redis
+
+    def _get(self, digest: str):
+        if (entry := self.entries.get(digest)) is None:
+            return False, None
+        user_id, expires_at = entry
+        if expires_at < time.monotonic():
+            del self.entries[digest]
+            return False, None
+        self.entries.move_to_end(digest)
+        return True, user_id
+
+    def _put(self, digest: str, user_id: Optional[int]) -> None:
+        ttl = self.ttl if user_id is not None else self.negative_ttl
+        self.entries[digest] = (user_id, time.monotonic() + ttl)
+        self.entries.move_to_end(digest)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    @staticmethod
+    def _lookup(digest: str) -> Optional[int]:
+        row = User.session.query(User.id).filter(User.accessTokenHash == digest).first()
+        return row and row[0]
+
+    async def resolve(self, token: Optional[str]) -> Optional[int]:
+        """
+        The resolve function returns the id of the user holding a token.
+
+        :param token: The access token
+        :return: The user id, or None when no user holds the token
+        """
+        if not token:
+            return None
+        self.start()
+        digest = token_hash(token)
+        found, user_id = self._get(digest)
+        if found:
+            self.hits += 1
+            return user_id
+        self.misses += 1
+        try:
+            cached = await self.redis.get(TOKEN % digest)
+        except Exception as e:
+            logger.error(e)
+            cached = None
+        if cached is not None:
+            user_id = int(cached) or None
+        else:
+            user_id = self._lookup(digest)
+            await self._store(digest, user_id)
+        self._put(digest, user_id)
+        return user_id
+
+    async def _store(self, digest: str, user_id: Optional[int]) -> None:
+        ttl = self.ttl if user_id is not None else self.negative_ttl
+        try:
+            await self.redis.set(TOKEN % digest, user_id or 0, ex=max(int(ttl), 1))
+        except Exception as e:
+            logger.error(e)
+
+    async def remember(self, token: str, user_id: int) -> None:
+        """
+        The remember function caches a token that was just issued.
+
+        :param token: The access token
+        :param user_id: The id of the user it was issued to
+        """
+        digest = token_hash(token)
+        self._put(digest, user_id)
+        await self._store(digest, user_id)
+
+    async def forget(self, token: Optional[str]) -> None:
+        """
+        The forget function drops a cleared token from every worker's cache.
+
+        :param token: The access token
+        """
+        if not token:
+            return
+        digest = token_hash(token)
+        self.entries.pop(digest, None)
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.delete(TOKEN % digest)
+                pipe.publish(INVALIDATE, digest)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(e)
+
+    async def listen(self) -> None:
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(INVALIDATE)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self.entries.pop(message["data"], None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Entries missed meanwhile still expire after ttl.
+                logger.error(f"token invalidation listener failed: {e}")
+                await asyncio.sleep(1)
+
+    def start(self) -> None:
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.listen())
+
+    async def stop(self) -> None:
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    @staticmethod
+    def backfill(session=None) -> int:
+        """
+        The backfill function hashes the tokens stored before
+        User.accessTokenHash existed, so their holders resolve without
+        logging in again.
+
+        :param session: The database session, defaults to the models' session
+        :return: The number of users updated
+        """
+        session = session or User.session
+        try:
+            updated = session.execute(BACKFILL).rowcount
+            session.commit()
+            return updated
+        except Exception as e:
+            logger.error(e)
+            session.rollback()
+            return 0
+
+
+token_cache = TokenCache()
@@ -0,0 +1,266 @@
+"""
+@author: Kuro
+
+Benchmark of concurrent HTTP requests served by the synchronous models
+against the same requests on the async session:
+
+    docker-compose up -d postgres
+    python -m app.shared.bases.async_bench --seed --requests 2000 \
+        --concurrency 100 --slow-every 50 --slow-ms 200 --out async-bench.json
+
+Unless --url names a running one, a worker (uvicorn) is started with two
+routes running the query of the action history view: /sync calls
+ActionHistory.read_all from an async handler, as the views did, and /async
+awaits async_read_all.
+Every --slow-every request first runs a pg_sleep of --slow-ms, standing in
+for one slow query among fast ones. Each mode reports its requests per
+second and the p50/p95/p99 latency of all requests and of the fast ones
+alone, which on the synchronous path wait behind every slow query in the
+worker. POSTGRES_CONNECTION should point at a local Postgres.
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import List
+
+import aiohttp
+import pytz
+from fastapi import FastAPI
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from app.api.history.models import ActionHistory
+from app.api.user.models import User
+from app.endpoints.urls import APIPrefix
+from app.shared.bases.async_session import async_db
+from app.shared.bases.base_model import ModelMixin
+from app.shared.middleware.async_session import AsyncSessionMiddleware
+from app.shared.utils.timer import percentiles
+from settings import Config
+
+MODES = ("sync", "async")
+USERNAME = "bench-%d"
+SLEEP = text("SELECT pg_sleep(:seconds)")
+
+# The relationships of the two models read here name models of other apps.
+for route in APIPrefix.include:
+    with contextlib.suppress(ImportError):
+        importlib.import_module(f"app.api.{route}.models")
+
+bench_app = FastAPI()
+bench_app.add_middleware(AsyncSessionMiddleware)
+
+
+def bind_sync_session() -> None:
+    engine = create_engine(f"postgresql+psycopg2://{Config.postgres_connection}")
+    ModelMixin.set_session(Session(engine))
+
+
+@bench_app.on_event("startup")
+async def startup():
+    bind_sync_session()
+
+
+@bench_app.on_event("shutdown")
+async def shutdown():
+    await async_db.dispose()
+
+
+@bench_app.get("/sync/{user_id}")
+async def sync_history(user_id: int, slow: float = 0):
+    if slow:
+        ActionHistory.session.execute(SLEEP, {"seconds": slow})
+    history = ActionHistory.read_all(userId=user_id)
+    return {"rows": len(history)}
+
+
+@bench_app.get("/async/{user_id}")
+async def async_history(user_id: int, slow: float = 0):
+    if slow:
+        async with async_db.session() as session:
+            await session.execute(SLEEP, {"seconds": slow})
+    history = await ActionHistory.async_read_all(userId=user_id)
+    return {"rows": len(history)}
+
+
+def seed(users: int, actions: int) -> List[int]:
+    """
+    The seed function replaces the benchmark users with fresh ones,
+    each with actions rows of action history.
+
+    :param users: The number of users
+    :param actions: The action history rows of every user
+    :return: The ids of the users
+    """
+    from sqlalchemy import delete
+
+    session = User.session
+    try:
+        session.execute(
+            delete(User)
+            .where(User.username.like("bench-%"))
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    created = User.bulk_create(
+        [{"phone": USERNAME % i, "username": USERNAME % i} for i in range(users)]
+    )
+    ActionHistory.bulk_create(
+        [
+            {"userId": user.id, "path": "/bench", "ip": "127.0.0.1"}
+            for user in created
+            for _ in range(actions)
+        ]
+    )
+    return [user.id for user in created]
+
+
+def load_users() -> List[int]:
+    ids = [
+        user_id
+        for (user_id,) in User.session.query(User.id)
+        .filter(User.username.like("bench-%"))
+        .order_by(User.id)
+    ]
+    if not ids:
+        raise SystemExit("no benchmark users, run with --seed")
+    return ids
+
+
+def serve(port: int) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.shared.bases.async_bench:bench_app",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ]
+    )
+    time.sleep(3)
+    if server.poll() is not None:
+        raise SystemExit("the benchmark worker did not start")
+    return server
+
+
+async def run_mode(mode: str, url: str, user_ids: List[int], args) -> dict:
+    """
+    The run_mode function sends --requests requests to one route,
+    --concurrency at a time.
+
+    :param mode: sync or async
+    :param url: The worker
+    :param user_ids: The users whose history is read
+    :return: The throughput and latencies of the mode
+    """
+    latencies, fast, errors = [], [], 0
+    slow = args.slow_ms / 1000
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(args.requests):
+        queue.put_nowait(i)
+
+    async def client(http: aiohttp.ClientSession):
+        nonlocal errors
+        while not queue.empty():
+            i = queue.get_nowait()
+            is_slow = args.slow_every and i % args.slow_every == 0
+            params = {"slow": slow} if is_slow else {}
+            started = time.perf_counter()
+            try:
+                async with http.get(
+                    f"{url}/{mode}/{user_ids[i % len(user_ids)]}", params=params
+                ) as response:
+                    await response.read()
+                    if response.status != 200:
+                        errors += 1
+                        continue
+            except aiohttp.ClientError:
+                errors += 1
+                continue
+            latency = time.perf_counter() - started
+            latencies.append(latency)
+            if not is_slow:
+                fast.append(latency)
+
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as http:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(http) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+    return {
+        "mode": mode,
+        "requests": args.requests,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "latency_ms": percentiles(latencies),
+        "fast_latency_ms": percentiles(fast),
+    }
+
+
+async def run(args, user_ids: List[int]) -> dict:
+    url = args.url or f"http://127.0.0.1:{args.port}"
+    modes = []
+    for mode in MODES:
+        modes.append(await run_mode(mode, url, user_ids, args))
+        print(json.dumps(modes[-1]), file=sys.stderr)
+    return {
+        "started_at": datetime.now(pytz.utc).isoformat(),
+        "url": url,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "slow_every": args.slow_every,
+        "slow_ms": args.slow_ms,
+        "host": {"python": platform.python_version(), "cpus": os.cpu_count()},
+        "modes": modes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--url", help="defaults to the worker started here")
+    parser.add_argument("--port", type=int, default=Config.fastapi_port + 2)
+    parser.add_argument(
+        "--seed", action="store_true", help="create the benchmark users"
+    )
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--actions", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--slow-every", type=int, default=50)
+    parser.add_argument("--slow-ms", type=float, default=200)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--out", default="async-bench.json")
+    args = parser.parse_args()
+
+    bind_sync_session()
+    user_ids = seed(args.users, args.actions) if args.seed else load_users()
+    server = None if args.url else serve(args.port)
+    try:
+        results = asyncio.run(run(args, user_ids))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+    with open(args.out, "w") as out:
+        json.dump(results, out, indent=2)
+    print(json.dumps(results["modes"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
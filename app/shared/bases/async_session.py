@@ -0,0 +1,128 @@
+"""
+@author: Kuro
+"""
+import contextlib
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from settings import Config
+
+PG_EPOCH = datetime(2000, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def encode_timestamp(value: datetime) -> Tuple[int]:
+    """
+    The encode_timestamp function writes a datetime to a timestamp column
+    the way psycopg2 does. The models stamp rows with aware UTC datetimes,
+    which asyncpg refuses for a column without a time zone, so they are
+    stored as naive UTC.
+
+    :param value: The datetime
+    :return: The microseconds since the Postgres epoch
+    """
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return ((value - PG_EPOCH) // MICROSECOND,)
+
+
+def decode_timestamp(value: Tuple[int]) -> datetime:
+    return PG_EPOCH + value[0] * MICROSECOND
+
+
+async def set_codecs(connection) -> None:
+    await connection.set_type_codec(
+        "timestamp",
+        schema="pg_catalog",
+        encoder=encode_timestamp,
+        decoder=decode_timestamp,
+        format="tuple",
+    )
+
+
+class AsyncDatabase:
+    """
+    The AsyncDatabase class is the asyncpg side of the models: an engine
+    and pool of its own next to the psycopg2 one, and the AsyncSession of
+    the request being served. A query awaited on it gives the event loop
+    back while Postgres works, where a call on the synchronous session
+    holds every other request on the worker until it returns.
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        pool_size: int = Config.async_pool_size,
+        max_overflow: int = Config.async_max_overflow,
+    ):
+        self.url = url or f"postgresql+asyncpg://{Config.postgres_connection}"
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self._engine: Optional[AsyncEngine] = None
+        self._sessionmaker: Optional[sessionmaker] = None
+        self.current: ContextVar[Optional[AsyncSession]] = ContextVar(
+            "async_session", default=None
+        )
+
+    @property
+    def engine(self) -> AsyncEngine:
+        if self._engine is None:
+            self._engine = create_async_engine(
+                self.url,
+                pool_size=self.pool_size,
+                max_overflow=self.max_overflow,
+                pool_pre_ping=True,
+            )
+            event.listen(self._engine.sync_engine, "connect", self.on_connect)
+        return self._engine
+
+    @staticmethod
+    def on_connect(dbapi_connection, _) -> None:
+        dbapi_connection.run_async(set_codecs)
+
+    @property
+    def sessionmaker(self) -> sessionmaker:
+        if self._sessionmaker is None:
+            self._sessionmaker = sessionmaker(
+                self.engine, class_=AsyncSession, expire_on_commit=False
+            )
+        return self._sessionmaker
+
+    @contextlib.asynccontextmanager
+    async def session(self) -> AsyncIterator[AsyncSession]:
+        """
+        The session function gives the AsyncSession of the current request,
+        or outside of one a session that is closed on exit.
+        """
+        if (session := self.current.get()) is not None:
+            yield session
+            return
+        async with self.scope() as session:
+            yield session
+
+    @contextlib.asynccontextmanager
+    async def scope(self) -> AsyncIterator[AsyncSession]:
+        """
+        The scope function opens the session every async model call inside
+        it shares, as AsyncSessionMiddleware does for each request.
+        """
+        session = self.sessionmaker()
+        token = self.current.set(session)
+        try:
+            yield session
+        finally:
+            self.current.reset(token)
+            await session.close()
+
+    async def dispose(self) -> None:
+        if self._engine is not None:
+            await self._engine.dispose()
+            self._engine = self._sessionmaker = None
+
+
+async_db = AsyncDatabase()
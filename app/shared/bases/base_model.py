@@ -1,7 +1,9 @@
 """
 @author: Kuro
 """
+import base64
 import contextlib
+import json
 import logging
 import math
 import uuid
@@ -10,7 +12,7 @@ from enum import Enum
 from operator import or_
 from random import randint, choice
 from types import SimpleNamespace
-from typing import Type, Union, Tuple, List, Any, Generic
+from typing import Type, Union, Tuple, List, Any, Generic, Optional
 from typing import TypeVar
 
 import pytz
@@ -25,23 +27,36 @@ from sqlalchemy import (
     Float,
     String,
     Integer,
+    BigInteger,
     Boolean,
     Interval,
+    bindparam,
+    cast,
+    column,
+    func,
+    literal,
+    literal_column,
+    select,
+    tuple_,
+    update,
+    values,
 )
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import JSONB, UUID, insert
 from sqlalchemy.engine import Row
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import registry, sessionmaker
+from sqlalchemy.orm import Query, registry, sessionmaker
 from sqlalchemy_mixins import AllFeaturesMixin
 from sqlalchemy_mixins.activerecord import ActiveRecordMixin
 from sqlalchemy_mixins.inspection import InspectionMixin
-from sqlalchemy_mixins.smartquery import SmartQueryMixin
+from sqlalchemy_mixins.smartquery import SmartQueryMixin, smart_query
 from starlette.requests import Request
 
 from app.api.auth.schema import UserClaim
 from app.endpoints.urls import APIPrefix
 from app.shared.auth.password_handler import verify_password
+from app.shared.bases.async_session import async_db
+from app.shared.bases.page_count import page_counter
 from app.shared.exception.exceptions import PredicateConditionException
 from app.shared.schemas.ResponseSchemas import BaseResponse
 from app.shared.schemas.page_schema import PagedResponse
@@ -170,7 +185,8 @@ class ModelMixin(AllFeaturesMixin):
         """
         timestamp = datetime.now(pytz.utc)
         new_kwargs = dict(kwargs)
-        new_kwargs["createdAt"] = timestamp
+        if "createdAt" in cls.__table__.columns:
+            new_kwargs["createdAt"] = timestamp
         return new_kwargs
 
     @classmethod
@@ -313,21 +329,52 @@ class ModelMixin(AllFeaturesMixin):
             )
             return UserClaim()
 
+    @classmethod
+    def _returning(cls, statement):
+        """
+        The _returning function makes an INSERT that skips rows violating a
+        unique constraint return the inserted rows as instances of the model.
+
+        :param statement: The INSERT
+        :return: The statement, to run with session.execute
+        """
+        statement = statement.on_conflict_do_nothing().returning(*cls.__table__.columns)
+        return (
+            select(cls)
+            .from_statement(statement)
+            .execution_options(populate_existing=True)
+        )
+
+    @classmethod
+    def _defaults(cls, row: dict) -> dict:
+        """
+        The _defaults function fills in the Python side column defaults of a
+        row, which an INSERT ... SELECT does not apply.
+
+        :param row: The column values of the row
+        :return: The row with its defaults
+        """
+        for column in cls.__table__.columns:
+            default = column.default
+            if column.key in row or default is None or default.is_sequence:
+                continue
+            row[column.key] = default.arg(None) if default.is_callable else default.arg
+        return row
+
     @classmethod
     def create(cls, *_, **kwargs) -> ModelType:
         """
         It takes a class, and a dictionary of arguments, and creates a new
-        object of that class with the arguments
+        object of that class with the arguments in a single
+        INSERT ... ON CONFLICT DO NOTHING RETURNING round trip
 
         :param cls: The class that the method is being called on
-        :return: The id of the new object
+        :return: The new object, or None when it violates a unique constraint
         """
         object_data = cls.rebuild(kwargs)
-        new_object = cls(**object_data)
+        statement = cls._returning(insert(cls.__table__).values(**object_data))
         try:
-            if cls.where(**object_data).first():
-                return
-            cls.session.add(new_object)
+            new_object = cls.session.execute(statement).scalars().first()
             cls.session.commit()
             return new_object
         except Exception as e:
@@ -335,6 +382,47 @@ class ModelMixin(AllFeaturesMixin):
             cls.session.rollback()
             return
 
+    @classmethod
+    def bulk_create(cls, rows: List[dict]) -> List[ModelType]:
+        """
+        The bulk_create function inserts many rows in one transaction. The
+        rows are sent as a single JSON parameter and expanded by
+        jsonb_populate_recordset, so thousands of rows are one statement
+        that compiles once, rather than a VALUES list with a bind parameter
+        per value. Rows violating a unique constraint are skipped, as create
+        does.
+
+        :param rows: The column values of every row
+        :return: The new objects
+        """
+        by_keys = {}
+        for row in rows:
+            row = cls._defaults(cls.rebuild(row))
+            by_keys.setdefault(tuple(sorted(row)), []).append(row)
+        table = cls.__table__
+        created = []
+        try:
+            for keys, group in by_keys.items():
+                records = func.jsonb_populate_recordset(
+                    literal_column(f'NULL::"{table.name}"'),
+                    cast(bindparam("rows", type_=String), JSONB),
+                ).table_valued(*keys)
+                statement = cls._returning(
+                    insert(table).from_select(
+                        keys, select(*(records.c[key] for key in keys))
+                    )
+                )
+                rows_json = json.dumps(group, default=str)
+                created.extend(
+                    cls.session.execute(statement, {"rows": rows_json}).scalars().all()
+                )
+            cls.session.commit()
+            return created
+        except Exception as e:
+            logger.error(e)
+            cls.session.rollback()
+            return []
+
     @classmethod
     def update(cls, *_, **kwargs) -> ModelType:
         """
@@ -370,6 +458,77 @@ class ModelMixin(AllFeaturesMixin):
             cls.session.rollback()
             return
 
+    @classmethod
+    def update_many(
+        cls,
+        rows: Optional[List[dict]] = None,
+        filters: Optional[dict] = None,
+        patch: Optional[dict] = None,
+        commit: bool = True,
+    ) -> List[Any]:
+        """
+        The update_many function updates many rows in one transaction, either
+        from a list of rows each carrying its id and the columns to set, in
+        one UPDATE ... FROM (VALUES ...) per set of columns, or by setting
+        the same patch on every row matching the filters, which take the
+        same operators as where. updatedAt is set on every row touched. A
+        patch without filters is refused rather than applied to the table.
+
+        :param rows: The id and new column values of every row
+        :param filters: The filters of the rows to patch
+        :param patch: The column values to set on the filtered rows
+        :param commit: False to leave the transaction open for the caller
+        :return: The ids of the updated rows
+        """
+        if patch and not filters:
+            raise ValueError(f"update_many of {cls.__name__} needs filters for a patch")
+        table = cls.__table__
+        stamp = {"updatedAt": datetime.now(pytz.utc)} if "updatedAt" in table.c else {}
+        updated = []
+        try:
+            statements = []
+            by_keys = {}
+            for row in rows or []:
+                keys = tuple(sorted(key for key in row if key != "id"))
+                by_keys.setdefault(keys, []).append(row)
+            for keys, group in by_keys.items():
+                names = ("id",) + keys
+                data = values(
+                    *(column(name, table.c[name].type) for name in names), name="v"
+                ).data([tuple(row[name] for name in names) for row in group])
+                statements.append(
+                    update(table)
+                    .where(table.c.id == cast(data.c.id, table.c.id.type))
+                    .values(
+                        {
+                            **{
+                                key: cast(data.c[key], table.c[key].type)
+                                for key in keys
+                            },
+                            **stamp,
+                        }
+                    )
+                )
+            if patch:
+                ids = cls.where(**filters).with_entities(cls.id).subquery()
+                statements.append(
+                    update(table)
+                    .where(table.c.id.in_(select(ids.c.id)))
+                    .values({**patch, **stamp})
+                )
+            for statement in statements:
+                statement = statement.returning(table.c.id).execution_options(
+                    synchronize_session=False
+                )
+                updated.extend(cls.session.execute(statement).scalars().all())
+            if commit:
+                cls.session.commit()
+            return updated
+        except Exception as e:
+            logger.error(e)
+            cls.session.rollback()
+            return []
+
     @classmethod
     def remove(cls, *_, **kwargs) -> BaseResponse:
         """
@@ -434,6 +593,117 @@ class ModelMixin(AllFeaturesMixin):
             cls.session.rollback()
             return
 
+    @classmethod
+    def select_where(cls, *options, **filters):
+        """
+        The select_where function builds the select of where, with the same
+        filters and operators, for an AsyncSession to run.
+
+        :param options: Loader options, such as joinedload of the
+            relationships the response reads
+        :param filters: The filters, as for where
+        :return: The select statement
+        """
+        return smart_query(Query(cls), filters).options(*options).statement
+
+    @classmethod
+    async def async_read(cls, *options, **kwargs) -> ModelType:
+        """
+        The async_read function is read on the async session, so the event
+        loop serves other requests while the query runs. Relationships are
+        not lazy loaded on an AsyncSession: pass loader options for the
+        ones the caller reads.
+
+        :param options: Loader options for the relationships to load
+        :return: The first row that matches the filters
+        """
+        async with async_db.session() as session:
+            result = await session.execute(
+                cls.select_where(*options, **kwargs).limit(1)
+            )
+            return result.scalars().first()
+
+    @classmethod
+    async def async_read_all(cls, *options, **kwargs) -> List[ModelType]:
+        """
+        The async_read_all function is read_all on the async session.
+
+        :param options: Loader options for the relationships to load
+        :return: Every row that matches the filters
+        """
+        async with async_db.session() as session:
+            try:
+                result = await session.execute(cls.select_where(*options, **kwargs))
+                return result.unique().scalars().all()
+            except Exception as e:
+                logger.error(e)
+                await session.rollback()
+                return
+
+    @classmethod
+    async def async_create(cls, *_, **kwargs) -> ModelType:
+        """
+        The async_create function is create on the async session.
+
+        :return: The new object, or None when it violates a unique constraint
+        """
+        statement = cls._returning(insert(cls.__table__).values(**cls.rebuild(kwargs)))
+        async with async_db.session() as session:
+            try:
+                new_object = (await session.execute(statement)).scalars().first()
+                await session.commit()
+                return new_object
+            except Exception as e:
+                logger.info(e)
+                await session.rollback()
+                return
+
+    @classmethod
+    async def async_update(cls, *_, **kwargs) -> ModelType:
+        """
+        The async_update function is update on the async session. The id
+        and owner keys filter the rows, the other keys are set on them.
+
+        :return: The first updated object, or None when nothing matched
+        """
+        filters = {
+            k: kwargs.pop(k)
+            for k in [
+                "id",
+                "ownerId",
+                "agentId",
+                "adminId",
+                "userId",
+                "createdByAdminId",
+                "createdByAgentId",
+            ]
+            if k in kwargs
+        }
+        table = cls.__table__
+        if "updatedAt" in table.c:
+            kwargs["updatedAt"] = datetime.now(pytz.utc)
+        ids = cls.select_where(**filters).with_only_columns(cls.id).subquery()
+        statement = (
+            update(table)
+            .where(table.c.id.in_(select(ids.c.id)))
+            .values(**kwargs)
+            .returning(*table.columns)
+        )
+        statement = (
+            select(cls)
+            .from_statement(statement)
+            .execution_options(populate_existing=True)
+        )
+        async with async_db.session() as session:
+            try:
+                updated = (await session.execute(statement)).scalars().first()
+                await session.commit()
+                return updated
+            except Exception as e:
+                logger.error(e)
+                await session.rollback()
+                return
+
     @classmethod
     def search(cls, *_, **kwargs) -> list:
         """
@@ -511,9 +781,7 @@ class DataSeeder:
         :param row_data: A dictionary of the row data
         """
         try:
-            model.get_or_create(model, **row_data)
-            # commit changes to the database
-            model.session.commit()
+            model.create(**row_data)
         except IntegrityError:
             # handle unique constraint violation by rolling back the transaction
             model.session.rollback()
@@ -643,10 +911,12 @@ class DataSeeder:
         for model, table in list(self.get_model_metadata()):
             if table.name in self.exclude_list:
                 continue
-            for _ in range(self.number_of_records):
-                row_data = self.generate_fake_row_data(table)
-                self.save_model(model, row_data)
-            print(model, f"{self.number_of_records} records added to db")
+            rows = [
+                self.generate_fake_row_data(table)
+                for _ in range(self.number_of_records)
+            ]
+            created = model.bulk_create(rows)
+            logger.info(f"{model}: {len(created)} records added to db")
 
 
 class Page(Generic[T]):
@@ -654,7 +924,16 @@ class Page(Generic[T]):
     Pagination class to allow for paging of database data
     """
 
-    def __init__(self, items: list, page: int = 1, page_size: int = 10, total: int = 0):
+    def __init__(
+        self,
+        items: list,
+        page: int = 1,
+        page_size: int = 10,
+        total: int = 0,
+        next_cursor: Optional[str] = None,
+        has_next: Optional[bool] = None,
+        exact: bool = True,
+    ):
         self.items = items
         self.dict_items = [
             isinstance(_item, Row) and _item._asdict() or _item for _item in items
@@ -662,14 +941,19 @@ class Page(Generic[T]):
         self.page = page
         self.page_size = page_size
         self.total = total
+        # False when total is the planner's estimate, see PageCounter.
+        self.exact = exact
         self.previous_page = None
         self.next_page = None
         self.has_previous = page > 1
         if self.has_previous:
             self.previous_page = page - 1
+        self.next_cursor = next_cursor
         previous_items = (page - 1) * page_size
-        self.has_next = previous_items + len(items) < total
-        if self.has_next:
+        self.has_next = (
+            previous_items + len(items) < total if has_next is None else has_next
+        )
+        if self.has_next and next_cursor is None:
             self.next_page = page + 1
         self.pages = int(math.ceil(total / float(page_size)))
 
@@ -701,20 +985,239 @@ class Page(Generic[T]):
         """
 
 
-def paginate(cls, page: int, page_size: int):
+def keyset_columns(query) -> list:
+    """
+    The keyset_columns function returns the columns a query is ordered by in
+    keyset mode: createdAt then id, or id alone for tables without createdAt.
+
+    :param query: The query being paged
+    :return: The columns
+    """
+    entity = query.column_descriptions[0]["entity"]
+    if hasattr(entity, "createdAt"):
+        return [entity.createdAt, entity.id]
+    return [entity.id]
+
+
+def encode_cursor(values: list) -> str:
+    """
+    The encode_cursor function turns the ordering values of the last row of
+    a page into the opaque cursor of the next page.
+
+    :param values: The values of the keyset columns
+    :return: The cursor
+    """
+    plain = []
+    for value in values:
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, uuid.UUID):
+            value = str(value)
+        plain.append(value)
+    return base64.urlsafe_b64encode(json.dumps(plain).encode()).decode()
+
+
+def decode_cursor(cursor: str, columns: list) -> list:
+    """
+    The decode_cursor function reads the ordering values back out of a
+    cursor. A value that does not fit its column is refused here, rather
+    than reaching the database.
+
+    :param cursor: The cursor from encode_cursor
+    :param columns: The keyset columns of the query
+    :return: The values, typed as the columns are
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError(cursor)
+        typed = []
+        for value, column in zip(values, columns):
+            if value is not None:
+                value = cursor_value(value, column.type)
+            typed.append(value)
+        return typed
+    except (ValueError, TypeError):
+        raise HTTPException(400, detail="invalid cursor")
+
+
+def cursor_value(value, column_type):
+    """
+    The cursor_value function types one value of a cursor as its column.
+
+    :param value: The value read from the cursor
+    :param column_type: The type of the keyset column
+    :return: The typed value
+    """
+    if isinstance(column_type, (DateTime, UUID, String)):
+        if not isinstance(value, str):
+            raise TypeError(value)
+        if isinstance(column_type, DateTime):
+            return datetime.fromisoformat(value)
+        return uuid.UUID(value) if isinstance(column_type, UUID) else value
+    if isinstance(column_type, Integer):
+        bits = 63 if isinstance(column_type, BigInteger) else 31
+        if type(value) is not int or not -(2**bits) <= value < 2**bits:
+            raise TypeError(value)
+    return value
+
+
+def keyset_query(query, columns: list, cursor: str, descending: bool = False):
+    """
+    The keyset_query function orders a query or select by its keyset columns
+    and starts it after the row a cursor points at.
+
+    :param query: The query or select being paged
+    :param columns: The keyset columns of the query
+    :param cursor: The cursor of the page, or "" for the first
+    :param descending: Page from the newest row instead of the oldest
+    :return: The query, to limit to page_size + 1 rows
+    """
+    if cursor:
+        after = tuple_(
+            *(
+                literal(value, column.type)
+                for value, column in zip(decode_cursor(cursor, columns), columns)
+            )
+        )
+        keys = tuple_(*columns)
+        query = query.filter(keys < after if descending else keys > after)
+    # The keyset replaces any ordering the query had, which would break it.
+    return query.order_by(None).order_by(
+        *(column.desc() if descending else column for column in columns)
+    )
+
+
+def keyset_page(rows: list, columns: list, page_size: int):
+    """
+    The keyset_page function splits the page_size + 1 rows read for a page
+    into its items, whether there is a next page and the cursor to it.
+
+    :param rows: The rows read
+    :param columns: The keyset columns of the query
+    :param page_size: How many items to show on each page
+    :return: The items, has_next and next_cursor
+    """
+    items, has_next = rows[:page_size], len(rows) > page_size
+    next_cursor = (
+        encode_cursor([getattr(items[-1], column.key) for column in columns])
+        if has_next
+        else None
+    )
+    return items, has_next, next_cursor
+
+
+def keyset_paginate(cls, page_size: int, cursor: str, descending: bool = False):
+    """
+    The keyset_paginate function returns the page after a cursor. Rows are
+    ordered by keyset_columns and the page starts with a row value comparison
+    against the cursor, so with an index on those columns every page costs
+    the same however deep it is, where an OFFSET reads and drops every
+    earlier row.
+
+    :param cls: The query being paged
+    :param page_size: How many items to show on each page
+    :param cursor: The next_cursor of the previous page, or "" for the first
+    :param descending: Page from the newest row instead of the oldest
+    :return: The Page, with the cursor of the next one
+    """
+    columns = keyset_columns(cls)
+    rows = keyset_query(cls, columns, cursor, descending).limit(page_size + 1).all()
+    items, has_next, next_cursor = keyset_page(rows, columns, page_size)
+    total, exact = page_counter.total(cls)
+    return Page(
+        items,
+        1,
+        page_size,
+        total,
+        next_cursor=next_cursor,
+        has_next=has_next,
+        exact=exact,
+    )
+
+
+def paginate(
+    cls,
+    page: int,
+    page_size: int,
+    cursor: Optional[str] = None,
+    descending: bool = False,
+):
     """
     The paginate function takes a query, the page number and page size as arguments.
     It then returns a tuple of the items on that page and the total number of items.
+    Given a cursor, even an empty one, it pages by keyset instead of by page number.
 
     :param query: Used to Pass a query object to the paginate function.
     :param page: Used to Determine which page of results to return.
     :param page_size: Used to Determine how many items to show on each page.
+    :param cursor: Used to Continue from the next_cursor of a keyset page.
+    :param descending: Used to Page by keyset from the newest row instead of the oldest.
     :return: A tuple containing the list of items for that page, and a total number of pages.
     """
-    if page <= 0:
+    if page_size <= 0:
+        raise HTTPException(400, detail="page_size needs to be >= 1")
+    if cursor is not None:
+        return keyset_paginate(cls, page_size, cursor, descending)
+    if not page or page <= 0:
         raise HTTPException(400, detail="page needs to be >= 1")
+    rows: list[Row] = (
+        cls.where().limit(page_size + 1).offset((page - 1) * page_size).all()
+    )
+    total_items, exact = page_counter.total(cls)
+    return Page(
+        rows[:page_size],
+        page,
+        page_size,
+        total_items,
+        has_next=len(rows) > page_size,
+        exact=exact,
+    )
+
+
+async def async_paginate(
+    statement,
+    page: int,
+    page_size: int,
+    cursor: Optional[str] = None,
+    descending: bool = False,
+):
+    """
+    The async_paginate function is paginate for a select built by
+    select_where, read on the async session. It pages by page number, or
+    by keyset given a cursor, and counts the total as paginate does.
+
+    :param statement: The select being paged
+    :param page: Which page of results to return
+    :param page_size: How many items to show on each page
+    :param cursor: The next_cursor of the previous keyset page
+    :param descending: Page by keyset from the newest row instead of the oldest
+    :return: The Page
+    """
     if page_size <= 0:
         raise HTTPException(400, detail="page_size needs to be >= 1")
-    items: list[Row] = cls.where().limit(page_size).offset((page - 1) * page_size).all()
-    total_items = cls.count()
-    return Page(items, page, page_size, total_items)
+    if cursor is None and (not page or page <= 0):
+        raise HTTPException(400, detail="page needs to be >= 1")
+    async with async_db.session() as session:
+        if cursor is not None:
+            columns = keyset_columns(statement)
+            query = keyset_query(statement, columns, cursor, descending)
+            page = 1
+        else:
+            query = statement.offset((page - 1) * page_size)
+        result = await session.execute(query.limit(page_size + 1))
+        rows = result.unique().scalars().all()
+        total, exact = await page_counter.async_total(statement, session)
+    if cursor is not None:
+        items, has_next, next_cursor = keyset_page(rows, columns, page_size)
+    else:
+        items, has_next, next_cursor = rows[:page_size], len(rows) > page_size, None
+    return Page(
+        items,
+        page,
+        page_size,
+        total,
+        next_cursor=next_cursor,
+        has_next=has_next,
+        exact=exact,
+    )
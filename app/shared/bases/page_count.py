@@ -0,0 +1,198 @@
+"""
+@author: Kuro
+"""
+
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from settings import Config
+
+logger = logging.getLogger("page_count")
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.DEBUG)
+
+RELTUPLES = text(
+    "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)"
+)
+
+
+class Explain(Executable, ClauseElement):
+    """
+    The Explain class is the JSON query plan of a statement, compiled with
+    its parameters by the dialect that runs it.
+    """
+
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain)
+def compile_explain(element, compiler, **kw):
+    return f"EXPLAIN (FORMAT JSON) {compiler.process(element.statement, **kw)}"
+
+
+def plan_rows(plan) -> int:
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def statement_of(query):
+    return query.statement if hasattr(query, "session") else query
+
+
+class PageCounter:
+    """
+    The PageCounter class gives paginate the total of the query it pages,
+    choosing how to count it:
+
+    - exact: COUNT(*) of the filtered query, when the planner expects fewer
+      than exact_limit rows;
+    - estimated: the planner's row estimate, pg_class.reltuples for an
+      unfiltered table and the EXPLAIN rows of a filtered query, when more;
+    - cached: whichever of the two was last taken for the same statement
+      and parameters, for ttl seconds, so scrolling through a listing does
+      not count it again on every page.
+
+    total returns whether the count is exact along with it.
+    """
+
+    def __init__(
+        self,
+        ttl: float = Config.page_count_ttl,
+        exact_limit: int = Config.page_count_exact_limit,
+        max_entries: int = 1024,
+    ):
+        self.ttl = ttl
+        self.exact_limit = exact_limit
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Tuple[int, bool, float]]" = OrderedDict()
+
+    @staticmethod
+    def key(query, dialect=None) -> str:
+        dialect = dialect or query.session.get_bind().dialect
+        compiled = statement_of(query).compile(dialect=dialect)
+        params = sorted((name, repr(value)) for name, value in compiled.params.items())
+        return f"{compiled}|{params}"
+
+    @staticmethod
+    def _exact(query) -> int:
+        return query.order_by(None).count()
+
+    @staticmethod
+    def _reltuples(query) -> Optional[int]:
+        """
+        The _reltuples function reads the planner's row count of the table a
+        query selects from, None when the query is filtered or the table was
+        never analyzed.
+        """
+        if (table := PageCounter._table(query)) is None:
+            return None
+        rows = query.session.execute(RELTUPLES, {"table": table}).scalar()
+        return rows if rows is not None and rows >= 0 else None
+
+    @staticmethod
+    def _table(query) -> Optional[str]:
+        if query.whereclause is not None:
+            return None
+        return f'"{query.column_descriptions[0]["entity"].__table__.name}"'
+
+    @staticmethod
+    def _explain(query) -> int:
+        return plan_rows(
+            query.session.execute(Explain(query.order_by(None).statement)).scalar()
+        )
+
+    def _count(self, query) -> Tuple[int, bool]:
+        estimate = self._reltuples(query)
+        if estimate is None:
+            estimate = self._explain(query)
+        if estimate < self.exact_limit:
+            return self._exact(query), True
+        return estimate, False
+
+    def total(self, query) -> Tuple[int, bool]:
+        """
+        The total function counts the rows of a query.
+
+        :param query: The filtered query being paged
+        :return: The total, and whether it is exact
+        """
+        try:
+            key = self.key(query)
+        except Exception as e:
+            logger.error(e)
+            return self._exact(query), True
+        if entry := self._cached(key):
+            return entry
+        try:
+            total, exact = self._count(query)
+        except Exception as e:
+            logger.error(e)
+            query.session.rollback()
+            total, exact = self._exact(query), True
+        return self._store(key, total, exact)
+
+    async def async_total(self, statement, session) -> Tuple[int, bool]:
+        """
+        The async_total function counts the rows of a select statement on an
+        AsyncSession, as total does for a query.
+
+        :param statement: The filtered select being paged
+        :param session: The AsyncSession to count it on
+        :return: The total, and whether it is exact
+        """
+        exact_count = select(func.count()).select_from(
+            statement.order_by(None).subquery()
+        )
+        try:
+            key = self.key(statement, session.bind.dialect)
+        except Exception as e:
+            logger.error(e)
+            return (await session.execute(exact_count)).scalar(), True
+        if entry := self._cached(key):
+            return entry
+        try:
+            estimate = None
+            if (table := self._table(statement)) is not None:
+                estimate = (await session.execute(RELTUPLES, {"table": table})).scalar()
+            if estimate is None or estimate < 0:
+                plan = await session.execute(Explain(statement.order_by(None)))
+                estimate = plan_rows(plan.scalar())
+            if estimate < self.exact_limit:
+                total, exact = (await session.execute(exact_count)).scalar(), True
+            else:
+                total, exact = estimate, False
+        except Exception as e:
+            logger.error(e)
+            await session.rollback()
+            total, exact = (await session.execute(exact_count)).scalar(), True
+        return self._store(key, total, exact)
+
+    def _cached(self, key: str) -> Optional[Tuple[int, bool]]:
+        if (entry := self.entries.get(key)) and entry[2] > time.monotonic():
+            self.entries.move_to_end(key)
+            return entry[0], entry[1]
+        return None
+
+    def _store(self, key: str, total: int, exact: bool) -> Tuple[int, bool]:
+        self.entries[key] = (total, exact, time.monotonic() + self.ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return total, exact
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+
+page_counter = PageCounter()
@@ -0,0 +1,30 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from app.shared.bases.async_session import (
+    AsyncDatabase,
+    decode_timestamp,
+    encode_timestamp,
+)
+
+
+def test_aware_timestamps_are_stored_as_naive_utc():
+    naive = datetime(2023, 5, 1, 12, 30, 15, 250)
+    aware = naive.replace(tzinfo=timezone(timedelta(hours=7))) + timedelta(hours=7)
+    assert encode_timestamp(aware) == encode_timestamp(naive)
+    assert decode_timestamp(encode_timestamp(naive)) == naive
+    assert encode_timestamp(datetime(2000, 1, 1)) == (0,)
+
+
+def test_calls_share_the_session_of_their_scope():
+    database = AsyncDatabase("postgresql+asyncpg://bench@localhost/bench")
+
+    async def main():
+        async with database.scope() as scoped:
+            async with database.session() as first, database.session() as second:
+                assert first is scoped and second is scoped
+        async with database.session() as outside:
+            assert outside is not scoped
+        assert database.current.get() is None
+
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+import uuid
+
+from sqlalchemy import event, select
+
+from app.api.agent.models import Agent
+from app.api.user.models import User
+
+
+def name():
+    return f"create-{uuid.uuid4().hex[:12]}"
+
+
+def executed(session):
+    statements = []
+
+    @event.listens_for(session.connection(), "before_cursor_execute")
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    return statements
+
+
+def test_create_returns_the_inserted_row(session):
+    phone = name()
+
+    user = User.create(phone=phone, username=phone)
+
+    assert isinstance(user, User) and user.id is not None
+    assert (user.phone, user.active, user.rtp, user.online) == (phone, True, 0, False)
+    assert user.createdAt is not None
+    assert session.get(User, user.id) is user
+
+
+def test_create_skips_a_conflicting_row(session):
+    phone = name()
+    first = User.create(phone=phone, username=phone)
+
+    assert User.create(phone=phone, username=name()) is None
+    assert session.execute(
+        select(User.id).where(User.phone == phone)
+    ).scalars().all() == [first.id]
+    assert User.create(phone=name(), username=name()) is not None
+
+
+def test_bulk_create_expands_one_json_parameter_per_set_of_columns(session):
+    statements = executed(session)
+    names, other = [name() for _ in range(50)], name()
+
+    users = User.bulk_create(
+        [{"phone": phone, "username": phone} for phone in names]
+        + [{"phone": other, "username": other, "firstName": "full"}]
+    )
+
+    inserts = [statement for statement in statements if statement.startswith("INSERT")]
+    assert len(inserts) == 2
+    assert all("jsonb_populate_recordset" in statement for statement in inserts)
+    assert len(users) == 51 and all(isinstance(user, User) for user in users)
+    assert sorted(user.phone for user in users[:50]) == sorted(names)
+    assert users[50].firstName == "full"
+
+
+def test_bulk_create_fills_the_defaults(session):
+    phone = name()
+
+    (user,) = User.bulk_create([{"phone": phone, "username": phone}])
+    (agent,) = Agent.bulk_create([{"email": f"{phone}@example.com", "password": "x"}])
+
+    assert (user.active, user.rtp, user.online) == (True, 0, False)
+    assert user.createdAt is not None and user.updatedAt is not None
+    assert isinstance(agent.id, uuid.UUID) and agent.active is True
+
+
+def test_bulk_create_skips_conflicting_rows(session):
+    taken, fresh = name(), name()
+    User.bulk_create([{"phone": taken, "username": taken}])
+
+    users = User.bulk_create(
+        [
+            {"phone": taken, "username": name()},
+            {"phone": fresh, "username": fresh},
+            {"phone": fresh, "username": name()},
+        ]
+    )
+
+    assert [user.phone for user in users] == [fresh]
+    phones = select(User.phone).where(User.phone.in_([taken, fresh]))
+    assert sorted(session.execute(phones).scalars()) == sorted([taken, fresh])
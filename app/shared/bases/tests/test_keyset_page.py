@@ -0,0 +1,109 @@
+import uuid
+from datetime import datetime
+
+import pytest
+from fastapi.exceptions import HTTPException
+from sqlalchemy import update
+
+from app.api.agent.models import Agent
+from app.api.user.models import User
+from app.shared.bases.base_model import (
+    decode_cursor,
+    encode_cursor,
+    keyset_paginate,
+    paginate,
+)
+
+
+def test_cursor_round_trips_typed_values():
+    values = [datetime(2023, 5, 1, 12, 30, 15, 250), uuid.uuid4()]
+    columns = [Agent.createdAt, Agent.id]
+
+    assert decode_cursor(encode_cursor(values), columns) == values
+    assert decode_cursor(encode_cursor([None, 7]), [User.createdAt, User.id]) == [
+        None,
+        7,
+    ]
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not a cursor",
+        encode_cursor([7]),
+        encode_cursor(["yesterday", 7]),
+        encode_cursor({"id": 7}),
+        encode_cursor([7, 7]),
+        encode_cursor(["2023-05-01T12:00:00", "7"]),
+        encode_cursor(["2023-05-01T12:00:00", 7.5]),
+        encode_cursor(["2023-05-01T12:00:00", True]),
+        encode_cursor(["2023-05-01T12:00:00", 2**31]),
+    ],
+)
+def test_malformed_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as raised:
+        decode_cursor(cursor, [User.createdAt, User.id])
+    assert raised.value.status_code == 400
+
+
+def test_uuid_cursor_values_must_be_strings():
+    with pytest.raises(HTTPException) as raised:
+        decode_cursor(
+            encode_cursor(["2023-05-01T12:00:00", 7]), [Agent.createdAt, Agent.id]
+        )
+    assert raised.value.status_code == 400
+
+
+def seed(session, count):
+    names = [f"page-{uuid.uuid4().hex[:12]}" for _ in range(count)]
+    users = [User(phone=phone, username=phone) for phone in names]
+    session.add_all(users)
+    session.flush()
+    ids = sorted(user.id for user in users)
+    # Rows created in one batch share their createdAt.
+    stamp = datetime(2023, 5, 1, 12, 0)
+    session.execute(update(User).where(User.id.in_(ids)).values(createdAt=stamp))
+    return ids
+
+
+def pages(query, page_size, descending=False):
+    seen, cursor = [], ""
+    while cursor is not None:
+        page = keyset_paginate(query, page_size, cursor, descending)
+        seen.append([user.id for user in page.items])
+        cursor = page.next_cursor
+        assert page.has_next is (cursor is not None)
+    return seen
+
+
+def test_pages_split_rows_with_equal_created_at_by_id(session):
+    ids = seed(session, 7)
+    query = User.query.filter(User.id.in_(ids))
+
+    newest = ids[::-1]
+    assert pages(query, 3) == [ids[:3], ids[3:6], ids[6:]]
+    assert pages(query, 3, descending=True) == [newest[:3], newest[3:6], newest[6:]]
+
+
+def test_paginate_rejects_a_malformed_cursor(session):
+    ids = seed(session, 2)
+
+    with pytest.raises(HTTPException) as raised:
+        paginate(User.query.filter(User.id.in_(ids)), 1, 10, "not a cursor")
+    assert raised.value.status_code == 400
+
+
+def test_keyset_replaces_the_ordering_of_the_query(session):
+    ids = seed(session, 5)
+    query = User.query.filter(User.id.in_(ids)).order_by(User.phone.desc())
+
+    assert pages(query, 2) == [ids[:2], ids[2:4], ids[4:]]
+
+
+def test_paginate_pages_descending(session):
+    ids = seed(session, 3)
+    query = User.query.filter(User.id.in_(ids))
+
+    first = paginate(query, 1, 2, "", descending=True)
+    second = paginate(query, 1, 2, first.next_cursor, descending=True)
+    assert [user.id for user in first.items + second.items] == ids[::-1]
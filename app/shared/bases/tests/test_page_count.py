@@ -0,0 +1,135 @@
+import asyncio
+import uuid
+
+from sqlalchemy import Column, Integer, String, create_engine, func, select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session, declarative_base
+
+from app.api.user.models import User
+from app.shared.bases.async_session import AsyncDatabase
+from app.shared.bases.page_count import Explain, PageCounter
+from settings import Config
+
+Base = declarative_base()
+
+
+class Row(Base):
+    __tablename__ = "Row"
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+
+def counter_with(reltuples, explain, **kwargs):
+    counter = PageCounter(**kwargs)
+    counter.calls = []
+
+    def estimate(kind, rows):
+        def run(query):
+            counter.calls.append(kind)
+            return rows
+
+        return run
+
+    counter._reltuples = lambda query: (
+        None
+        if query.whereclause is not None
+        else estimate("reltuples", reltuples)(query)
+    )
+    counter._explain = estimate("explain", explain)
+    return counter
+
+
+def session_with_rows(count):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = Session(engine)
+    session.add_all(Row(name="a" if i % 2 else "b") for i in range(count))
+    session.commit()
+    return session
+
+
+def test_small_queries_are_counted_exactly_and_cached():
+    session = session_with_rows(30)
+    counter = counter_with(reltuples=30, explain=15, exact_limit=100, ttl=60)
+    assert counter.total(session.query(Row)) == (30, True)
+    assert counter.total(session.query(Row).filter(Row.name == "a")) == (15, True)
+    assert counter.total(session.query(Row).filter(Row.name == "b")) == (15, True)
+    assert counter.calls == ["reltuples", "explain", "explain"]
+
+    session.add(Row(name="a"))
+    session.commit()
+    assert counter.total(session.query(Row).filter(Row.name == "a")) == (15, True)
+    counter.clear()
+    assert counter.total(session.query(Row).filter(Row.name == "a")) == (16, True)
+
+
+def test_large_queries_use_the_planner_estimate():
+    session = session_with_rows(5)
+    counter = counter_with(reltuples=2_000_000, explain=400_000, exact_limit=100)
+    assert counter.total(session.query(Row)) == (2_000_000, False)
+    assert counter.total(session.query(Row).filter(Row.id > 1)) == (400_000, False)
+
+
+def test_explain_compiles_to_a_json_plan_with_its_parameters():
+    statement = select(User.id).where(User.phone == "page-count")
+    compiled = Explain(statement).compile(dialect=postgresql.dialect())
+
+    assert str(compiled).startswith('EXPLAIN (FORMAT JSON) SELECT "User".id')
+    assert 'WHERE "User".phone = %(phone_1)s' in str(compiled)
+    assert compiled.params == {"phone_1": "page-count"}
+
+
+def seed(session, count):
+    names = [f"count-{uuid.uuid4().hex[:12]}" for _ in range(count)]
+    # Through the test's session, so the rows roll back with it.
+    session.add_all(User(phone=phone, username=phone) for phone in names)
+    session.flush()
+    session.execute(text('ANALYZE "User"'))
+    return names
+
+
+def test_unfiltered_tables_are_estimated_from_reltuples(session):
+    seed(session, 40)
+    rows = session.execute(select(func.count()).select_from(User)).scalar()
+    counter = PageCounter(exact_limit=1)
+
+    assert PageCounter._reltuples(session.query(User)) == rows
+    assert counter.total(session.query(User)) == (rows, False)
+    assert counter.total(session.query(User).filter(User.id > 0))[1] is False
+
+
+def test_filtered_queries_are_estimated_by_explain(session):
+    names = seed(session, 40)
+    query = session.query(User).filter(User.phone.in_(names[:10]))
+
+    assert PageCounter._reltuples(query) is None
+    assert 1 <= PageCounter._explain(query) <= 40
+    assert PageCounter(exact_limit=1).total(query) == (
+        PageCounter._explain(query),
+        False,
+    )
+    assert PageCounter(exact_limit=1000).total(query) == (10, True)
+
+
+def test_async_total_counts_on_the_async_session(engine):
+    database = AsyncDatabase(f"postgresql+asyncpg://{Config.postgres_connection}")
+    statement = select(User).where(User.id > 0)
+    exact_count = select(func.count()).select_from(statement.subquery())
+
+    async def main():
+        try:
+            async with database.session() as session:
+                rows = (await session.execute(exact_count)).scalar()
+                exact = await PageCounter(exact_limit=10**9).async_total(
+                    statement, session
+                )
+                estimated = await PageCounter(exact_limit=0).async_total(
+                    statement, session
+                )
+                return rows, exact, estimated
+        finally:
+            await database.dispose()
+
+    rows, exact, (estimate, is_exact) = asyncio.run(main())
+    assert exact == (rows, True)
+    assert isinstance(estimate, int) and is_exact is False
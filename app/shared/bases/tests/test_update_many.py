@@ -0,0 +1,77 @@
+import uuid
+
+import pytest
+from sqlalchemy import select
+
+from app.api.user.models import User
+
+
+def create_users(count):
+    names = [f"update-{uuid.uuid4().hex[:12]}" for _ in range(count)]
+    return User.bulk_create([{"phone": name, "username": name} for name in names])
+
+
+def read(session, ids, *columns):
+    rows = session.execute(select(User.id, *columns).where(User.id.in_(ids)))
+    return {row[0]: tuple(row[1:]) for row in rows}
+
+
+def test_rows_are_updated_by_id(session):
+    users = create_users(3)
+    first, second, third = (user.id for user in users)
+
+    updated = User.update_many(
+        rows=[
+            {"id": first, "username": "renamed-1", "active": False},
+            {"id": second, "username": "renamed-2", "active": True},
+            {"id": third, "firstName": "solo"},
+        ]
+    )
+
+    assert sorted(updated) == sorted([first, second, third])
+    rows = read(session, updated, User.username, User.active, User.firstName)
+    assert rows[first] == ("renamed-1", False, None)
+    assert rows[second] == ("renamed-2", True, None)
+    assert rows[third][2] == "solo"
+    stamps = read(session, updated, User.updatedAt)
+    assert all(stamp is not None for (stamp,) in stamps.values())
+
+
+def test_patch_sets_the_filtered_rows(session):
+    users = create_users(4)
+    ids = [user.id for user in users]
+
+    updated = User.update_many(
+        filters={"id__in": ids[:3]}, patch={"firstName": "patched"}
+    )
+
+    assert sorted(updated) == sorted(ids[:3])
+    rows = read(session, ids, User.firstName)
+    assert [rows[user_id] for user_id in ids] == [("patched",)] * 3 + [(None,)]
+
+
+def test_patch_without_filters_is_refused(session):
+    create_users(2)
+
+    with pytest.raises(ValueError):
+        User.update_many(patch={"firstName": "everyone"})
+    with pytest.raises(ValueError):
+        User.update_many(filters={}, patch={"firstName": "everyone"})
+
+
+def test_failed_update_is_rolled_back(session):
+    users = create_users(2)
+    ids = [user.id for user in users]
+    taken = users[1].phone
+
+    updated = User.update_many(
+        rows=[
+            {"id": ids[0], "username": "kept-back"},
+            {"id": ids[1], "phone": users[0].phone},
+        ]
+    )
+
+    assert updated == []
+    rows = read(session, ids, User.username, User.phone)
+    assert rows[ids[0]][0] != "kept-back"
+    assert rows[ids[1]][1] == taken
@@ -0,0 +1,24 @@
+"""
+@author: Kuro
+"""
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.shared.bases.async_session import async_db
+
+
+class AsyncSessionMiddleware:
+    """
+    The AsyncSessionMiddleware class opens one AsyncSession per HTTP request
+    for the async model methods of its handler, and closes it, returning
+    the connection to the pool, when the response is sent.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        async with async_db.scope():
+            await self.app(scope, receive, send)
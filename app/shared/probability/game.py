@@ -1,13 +1,17 @@
-import random
 
 from dataclasses import dataclass
 from py_linq import Enumerable
 
 import settings
-from app.api.game.models import Paths, GameSession
+from app.api.game.models import Paths
 from app.api.user.models import User
-from app.games.fish.models import GameResult, BetEvent, Reward
+from app.games.fish.hit_resolution import kill_bounds
+from app.games.fish.ledger import bet_ledger
+from app.games.fish.path_catalog import path_catalog
+from app.games.fish.models import BetEvent, Reward
 from app.games.fish.schema import Objective
+from app.games.fish.table_rng import TableStream, TableStreams
+from app.shared.probability.rtp import RtpAccounts
 from app.rpc.game.schema import Session
 from app.shared.schemas.ResponseSchemas import BaseResponse
 
@@ -36,21 +40,26 @@ class GameProbability:
 
         if not user:
             return BaseResponse(error="User not found")
-        if user.balance.amount < bet_amount:
+        # The committed amount and the buffered changes, read as one.
+        if bet_ledger.balance(user.id) < bet_amount:
             return BaseResponse(error="Insufficient balance")
         # if bullet_id := Bullet.read(id=bullet_id):
         # return BaseResponse(error="Bullet ID already in use")
         player_session = user.userSessions[-1]
-        event = BetEvent.create(bet=bet_amount, player_session_id=player_session.id)
-        event.save()
-        user.balance.amount -= bet_amount
-        user.rtp += bet_amount
-        user.save()
+        try:
+            event_id = bet_ledger.append_bet(user.id, bet_amount, player_session.id)
+        except Exception as e:
+            # Only the sync ledger raises, when the bet could not be written.
+            return BaseResponse(error=f"Bet not recorded: {e}")
+        aggregate = RtpAccounts.get(player_session.gameSessionId)
+        aggregate.seen(user.id, user.rtp)
+        aggregate.record_bet(user.id, bet_amount)
+        RtpAccounts.maybe_checkpoint(aggregate)
 
         # Deprecated because bullet is created at the time
         # of the shoot event, adding it to the list automatically
         # self.append_bullet_list(bullet_id, bet_amount, owner=user)
-        return BaseResponse(success=True, response=event.id)
+        return BaseResponse(success=True, response=event_id)
 
     @classmethod
     def bet_close(cls, event: BetEvent, user: User, reward_id: int) -> BaseResponse:
@@ -58,9 +67,9 @@ class GameProbability:
         Checks if fish is hit (according to probability distribution)
         and updates game result accordingly.
         """
-        event = BetEvent.read(id=event.id)
+        exists = bet_ledger.is_pending(event.id) or BetEvent.read(id=event.id)
         for reward in cls.reward_pool:
-            if reward.get(reward_id) == reward_id and event:
+            if reward.get(reward_id) == reward_id and exists:
                 if _killed := cls.get_prob_distribution(reward.difficulty):
                     return cls.check_win(reward, user, event.id)
             return BaseResponse()
@@ -70,7 +79,8 @@ class GameProbability:
         """
         The check_win function is used to determine if the user has won or lost.
         The function takes in a fish object, a user object, and the bullet_id of the bullet that hit it.
-        It then calculates how much money was bet on this game session by all users combined (total_bets).
+        It then looks up how much money was bet on this game session by all users combined (total_bets)
+        from the running RtpAggregate of the session, so the check does not re-sum every player session.
         If total bets is greater than or equal to reward + rtp (the amount of money left over from previous games),
         then we can pay out our reward without going below our minimum RTP threshold for either users or the pool as a whole.
         If not, we return 0 as our winnings.
@@ -89,33 +99,49 @@ class GameProbability:
             A  object
 
         """
-        total_bets = (
-            sum(x.betAmount for x in GameSession.userSessions) * cls.rtp_pool_max
-        )
+        session = Enumerable(user.userSessions).last()
+        aggregate = RtpAccounts.get(session.gameSessionId)
+        aggregate.seen(user.id, user.rtp)
 
         def _save_results(_reward, _bullet_id):
-            user.rtp -= _reward * cls.rtp_pool_max
-            user.save()
-            session = Enumerable(user.userSessions).last()
-            game_result = GameResult(
-                player_session_id=session.id, event_id=event_id, win=_reward
-            )
-            game_result.save()
+            aggregate.record_win(user.id, _reward)
+            bet_ledger.append_result(session.id, event_id, _reward)
+            RtpAccounts.maybe_checkpoint(aggregate)
             return BaseResponse(success=True, response=_reward)
 
-        if user.rtp > cls.rtp_user_min and total_bets >= objective.reward + user.rtp:
+        if aggregate.can_pay(user.id, objective.reward):
             return _save_results(objective.reward, event_id)
 
-    @staticmethod
-    def get_prob_distribution(difficulty: int) -> int:
+    @classmethod
+    def get_prob_distribution(cls, difficulty: int) -> int:
         """
         Returns the probability distribution for hitting a fish based on its property value.
         Assumes higher property values have lower probabilities.
         """
-        seeds: float = random.random()
-        difficulty_level: float = difficulty / 100
-        prob_range: list = [(difficulty_level - 1) * 0.05, difficulty_level * 0.05]
-        return prob_range[0] <= seeds < prob_range[1]
+        seeds: float = cls.rng().random()
+        low, high = kill_bounds(difficulty)
+        return bool(low <= seeds < high)
+
+    @classmethod
+    def table_key(cls):
+        game = cls.session.game
+        return game.room.room_name if game.room else game.game_id
+
+    @classmethod
+    def rng(cls) -> TableStream:
+        """
+        Returns the table's random stream, so its outcomes can be replayed
+        from the recorded seed and draw counter.
+        """
+        return TableStreams.get(cls.table_key())
+
+    @classmethod
+    def release_path(cls, path_id: int) -> None:
+        """
+        Puts the path of a fish that died or left the screen back in the
+        table's free list.
+        """
+        path_catalog.allocator(cls.table_key(), cls.rng()).release(path_id)
 
     @classmethod
     def reward_out(cls):
@@ -132,12 +158,7 @@ class GameProbability:
         """
 
         def _take_path():
-            paths = Enumerable(cls.session.game.paths)
-            taken_paths = paths.select(lambda x: not x.taken).to_list()
-            path = random.choice(Paths.all())
-            if path not in taken_paths:
-                paths.first(lambda x: x.id == path.id).taken = True
-                return path
+            return path_catalog.allocator(cls.table_key(), cls.rng()).take()
 
         def _generate_reward(_reward_type: int):
             path = _take_path()
@@ -146,8 +167,9 @@ class GameProbability:
                 reward_data.path = path
                 yield _reward_type
 
-        reward_type = random.randint(1, 25)
+        rng = cls.rng()
+        reward_type = rng.randint(1, 25)
         if reward_type < 5:
-            for _ in range(random.randint(3, 5)):
+            for _ in range(rng.randint(3, 5)):
                 return list(_generate_reward(_reward_type=reward_type))
         return list(_generate_reward(reward_type))
@@ -0,0 +1,309 @@
+"""
+@author: Kuro
+"""
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+from uuid import UUID
+
+from sqlalchemy import bindparam, func, select
+
+from app.api.game.models import GameSession, PlayerSession
+from app.api.user.models import User
+from app.games.fish.models import BetEvent, GameResult
+from settings import Config
+
+logger = logging.getLogger("rtp")
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.DEBUG)
+
+
+@dataclass
+class RtpAggregate:
+    """
+    The RtpAggregate class keeps the running totals of one game session so a
+    win check is O(1) instead of summing every PlayerSession of the game.
+    user_rtp mirrors the User.rtp column of the players seen in the session.
+    The changes since the last checkpoint are kept apart as deltas, so a
+    checkpoint adds to the rows instead of overwriting what other workers
+    wrote to them.
+    """
+
+    game_session_id: UUID
+    total_bet: int = 0
+    total_win: int = 0
+    user_rtp: Dict[int, int] = field(default_factory=dict)
+    bet_delta: int = 0
+    win_delta: int = 0
+    rtp_deltas: Dict[int, int] = field(default_factory=dict)
+    pending: int = 0
+    checkpointed_at: float = field(default_factory=time.monotonic)
+    rtp_pool_max: float = Config.rtp_pool_max
+    rtp_user_min: int = Config.rtp_user_min
+
+    def seen(self, user_id: int, rtp: Optional[int] = None) -> None:
+        """
+        The seen function seeds a player's rtp the first time they show up in
+        the session, from the given value or else from the User row.
+
+        :param user_id: The id of the player
+        :param rtp: The player's current User.rtp, if already loaded
+        """
+        if user_id in self.user_rtp:
+            return
+        if rtp is None:
+            user = User.read(id=user_id)
+            rtp = user.rtp if user else 0
+        self.user_rtp[user_id] = rtp or 0
+
+    def record_bet(self, user_id: int, amount: int) -> None:
+        """
+        The record_bet function adds a bet to the session and player totals.
+
+        :param user_id: The id of the player placing the bet
+        :param amount: The bet amount
+        """
+        self.seen(user_id)
+        self.total_bet += amount
+        self.bet_delta += amount
+        self.user_rtp[user_id] += amount
+        self.rtp_deltas[user_id] = self.rtp_deltas.get(user_id, 0) + amount
+        self.pending += 1
+
+    def record_win(self, user_id: int, amount: int) -> None:
+        """
+        The record_win function adds a payout to the session and player totals.
+
+        :param user_id: The id of the player being paid
+        :param amount: The payout
+        """
+        rtp = int(amount * float(self.rtp_pool_max))
+        self.seen(user_id)
+        self.total_win += amount
+        self.win_delta += amount
+        self.user_rtp[user_id] -= rtp
+        self.rtp_deltas[user_id] = self.rtp_deltas.get(user_id, 0) - rtp
+        self.pending += 1
+
+    def can_pay(self, user_id: int, reward: int, approved: int = 0) -> bool:
+        """
+        The can_pay function applies the check_win rule against the running
+        totals: the player's rtp has to be above the minimum and the session's
+        bets, scaled by rtp_pool_max, have to cover the reward plus that rtp.
+
+        :param user_id: The id of the player that would be paid
+        :param reward: The payout
+        :param approved: Payouts of the player approved but not yet recorded
+        :return: True when the reward can be paid
+        """
+        self.seen(user_id)
+        user_rtp = self.user_rtp[user_id] - int(approved * float(self.rtp_pool_max))
+        total_bets = self.total_bet * float(self.rtp_pool_max)
+        return user_rtp > int(self.rtp_user_min) and total_bets >= reward + user_rtp
+
+    def due(self) -> bool:
+        return self.pending >= Config.rtp_checkpoint_events or (
+            self.pending
+            and time.monotonic() - self.checkpointed_at >= Config.rtp_checkpoint_seconds
+        )
+
+    def checkpoint(self, session=None) -> None:
+        """
+        The checkpoint function adds the changes to the session totals and to
+        the rtp of every player since the last checkpoint in one transaction.
+        On failure the deltas are kept for the next checkpoint.
+
+        :param session: The database session, defaults to the models' session
+        """
+        session = session or GameSession.session
+        try:
+            session.execute(
+                GameSession.__table__.update()
+                .where(GameSession.id == self.game_session_id)
+                .values(
+                    totalBet=func.coalesce(GameSession.totalBet, 0) + self.bet_delta,
+                    totalWin=func.coalesce(GameSession.totalWin, 0) + self.win_delta,
+                )
+            )
+            if self.rtp_deltas:
+                session.execute(
+                    User.__table__.update()
+                    .where(User.id == bindparam("user_id"))
+                    .values(rtp=func.coalesce(User.rtp, 0) + bindparam("delta")),
+                    [
+                        {"user_id": user_id, "delta": delta}
+                        for user_id, delta in self.rtp_deltas.items()
+                    ],
+                )
+            session.commit()
+        except Exception as e:
+            logger.error(e)
+            session.rollback()
+            return
+        self.checkpointed()
+
+    def checkpointed(self) -> None:
+        self.bet_delta = self.win_delta = 0
+        self.rtp_deltas.clear()
+        self.pending = 0
+        self.checkpointed_at = time.monotonic()
+
+    def store(self, session=None) -> None:
+        """
+        The store function overwrites the session totals and the rtp of its
+        players with the values of the aggregate, for an aggregate rebuilt
+        from the history.
+
+        :param session: The database session, defaults to the models' session
+        """
+        session = session or GameSession.session
+        try:
+            session.execute(
+                GameSession.__table__.update()
+                .where(GameSession.id == self.game_session_id)
+                .values(totalBet=self.total_bet, totalWin=self.total_win)
+            )
+            if self.user_rtp:
+                session.execute(
+                    User.__table__.update()
+                    .where(User.id == bindparam("user_id"))
+                    .values(rtp=bindparam("user_rtp")),
+                    [
+                        {"user_id": user_id, "user_rtp": user_rtp}
+                        for user_id, user_rtp in self.user_rtp.items()
+                    ],
+                )
+            session.commit()
+        except Exception as e:
+            logger.error(e)
+            session.rollback()
+            return
+        self.checkpointed()
+
+    @classmethod
+    def reconcile(cls, game_session_id: UUID, session=None) -> "RtpAggregate":
+        """
+        The reconcile function rebuilds the aggregate of a game session from
+        BetEvent and GameResult, e.g. after a crash lost the in-memory totals
+        since the last checkpoint. The rtp of each player of the session is
+        rebuilt from their whole history, as User.rtp accumulates across
+        sessions.
+
+        :param game_session_id: The id of the game session
+        :param session: The database session, defaults to the models' session
+        :return: The rebuilt RtpAggregate, already stored
+        """
+        session = session or GameSession.session
+        aggregate = cls(game_session_id=game_session_id)
+        aggregate.total_bet = int(
+            session.query(func.coalesce(func.sum(BetEvent.bet), 0))
+            .join(PlayerSession, BetEvent.player_session_id == PlayerSession.id)
+            .filter(PlayerSession.gameSessionId == game_session_id)
+            .scalar()
+        )
+        aggregate.total_win = int(
+            session.query(func.coalesce(func.sum(GameResult.win), 0))
+            .join(PlayerSession, GameResult.player_session_id == PlayerSession.id)
+            .filter(PlayerSession.gameSessionId == game_session_id)
+            .scalar()
+        )
+
+        players = (
+            session.query(PlayerSession.userId)
+            .filter(PlayerSession.gameSessionId == game_session_id)
+            .distinct()
+            .subquery()
+        )
+        player_ids = select(players.c.userId)
+        bets = dict(
+            session.query(PlayerSession.userId, func.sum(BetEvent.bet))
+            .join(BetEvent, BetEvent.player_session_id == PlayerSession.id)
+            .filter(PlayerSession.userId.in_(player_ids))
+            .group_by(PlayerSession.userId)
+            .all()
+        )
+        wins = dict(
+            session.query(PlayerSession.userId, func.sum(GameResult.win))
+            .join(GameResult, GameResult.player_session_id == PlayerSession.id)
+            .filter(PlayerSession.userId.in_(player_ids))
+            .group_by(PlayerSession.userId)
+            .all()
+        )
+        rtp_pool_max = float(aggregate.rtp_pool_max)
+        aggregate.user_rtp = {
+            user_id: int(bet or 0) - int((wins.get(user_id) or 0) * rtp_pool_max)
+            for user_id, bet in bets.items()
+        }
+        aggregate.store(session)
+        logger.info(
+            f"rtp aggregate of {game_session_id} reconciled: "
+            f"bet={aggregate.total_bet} win={aggregate.total_win}"
+        )
+        return aggregate
+
+
+class RtpAccounts:
+    """
+    The RtpAccounts class is the per-process registry of RtpAggregate objects,
+    one per active game session. A session seen for the first time is seeded
+    from its last checkpoint on the GameSession row.
+    """
+
+    aggregates: Dict[UUID, RtpAggregate] = {}
+
+    @classmethod
+    def get(cls, game_session_id: UUID) -> RtpAggregate:
+        if aggregate := cls.aggregates.get(game_session_id):
+            return aggregate
+        aggregate = RtpAggregate(game_session_id=game_session_id)
+        if game_session := GameSession.read(id=game_session_id):
+            aggregate.total_bet = game_session.totalBet or 0
+            aggregate.total_win = game_session.totalWin or 0
+        cls.aggregates[game_session_id] = aggregate
+        return aggregate
+
+    @classmethod
+    def reconcile(cls, game_session_id: UUID) -> RtpAggregate:
+        """
+        The reconcile function replaces the tracked aggregate of a game session
+        with one rebuilt from the database.
+
+        :param game_session_id: The id of the game session
+        :return: The rebuilt RtpAggregate
+        """
+        aggregate = RtpAggregate.reconcile(game_session_id)
+        cls.aggregates[game_session_id] = aggregate
+        return aggregate
+
+    @classmethod
+    def maybe_checkpoint(cls, aggregate: RtpAggregate) -> None:
+        if aggregate.due():
+            aggregate.checkpoint()
+
+    @classmethod
+    def checkpoint_all(cls) -> None:
+        for aggregate in cls.aggregates.values():
+            if aggregate.pending:
+                aggregate.checkpoint()
+
+    @classmethod
+    def close(cls, game_session_id: UUID) -> Optional[RtpAggregate]:
+        """
+        The close function checkpoints a finished game session and drops it.
+
+        :param game_session_id: The id of the game session
+        :return: The final RtpAggregate, if the session was tracked
+        """
+        if aggregate := cls.aggregates.pop(game_session_id, None):
+            aggregate.checkpoint()
+        return aggregate
+
+    @classmethod
+    def close_all(cls) -> None:
+        """
+        The close_all function checkpoints and drops every tracked game session,
+        on shutdown.
+        """
+        for game_session_id in list(cls.aggregates):
+            cls.close(game_session_id)
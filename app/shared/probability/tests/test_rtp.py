@@ -0,0 +1,75 @@
+import uuid
+
+from app.shared.probability.rtp import RtpAccounts, RtpAggregate
+
+
+class FakeSession:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        if self.fail:
+            raise RuntimeError("write failed")
+        self.statements.append((statement, params))
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+def aggregate():
+    aggregate = RtpAggregate(
+        game_session_id=uuid.uuid4(), total_bet=100, rtp_pool_max=0.5
+    )
+    aggregate.seen(7, rtp=40)
+    aggregate.record_bet(7, 10)
+    aggregate.record_win(7, 8)
+    return aggregate
+
+
+def test_checkpoint_adds_the_deltas():
+    tracked = aggregate()
+    session = FakeSession()
+
+    tracked.checkpoint(session)
+
+    totals, rtp = session.statements
+    assert "+" in str(totals[0].compile())
+    assert {10, 8} <= set(totals[0].compile().params.values())
+    assert rtp[1] == [{"user_id": 7, "delta": 6}]
+    assert tracked.total_bet == 110 and tracked.user_rtp[7] == 46
+    assert (tracked.bet_delta, tracked.win_delta, tracked.rtp_deltas) == (0, 0, {})
+    assert not tracked.pending
+
+
+def test_failed_checkpoint_keeps_the_deltas():
+    tracked = aggregate()
+
+    tracked.checkpoint(FakeSession(fail=True))
+
+    assert (tracked.bet_delta, tracked.win_delta, tracked.rtp_deltas) == (
+        10,
+        8,
+        {7: 6},
+    )
+
+
+def test_close_all_checkpoints_every_session(monkeypatch):
+    tracked = [aggregate(), aggregate()]
+    checkpointed = []
+    monkeypatch.setattr(
+        RtpAggregate, "checkpoint", lambda self, session=None: checkpointed.append(self)
+    )
+    monkeypatch.setattr(
+        RtpAccounts,
+        "aggregates",
+        {aggregate.game_session_id: aggregate for aggregate in tracked},
+    )
+
+    RtpAccounts.close_all()
+
+    assert checkpointed == tracked
+    assert RtpAccounts.aggregates == {}
@@ -10,8 +10,11 @@ from app.shared.schemas.orm_schema import ORMCamelModel
 
 
 class Params(CamelModel):
-    page: int
+    page: Optional[int] = 1
     size: int
+    # Keyset paging instead of page: "" for the first page, then the
+    # nextCursor of the previous one.
+    cursor: Optional[str] = None
 
     class Config:
         schema_extra = {"example": {"page": "1", "size": "10"}}
@@ -50,3 +53,6 @@ class PagedResponse(ORMCamelModel):
     page_size: int
     pages: int
     total: int
+    # False when total is an estimate.
+    exact: Optional[bool] = True
+    next_cursor: Optional[str]
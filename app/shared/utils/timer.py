@@ -2,6 +2,9 @@
 @author: Kuro
 """
 from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
 
 
 class Timer:
@@ -15,3 +18,22 @@ class Timer:
     def end(self):
         end = datetime.now()
         print("Execution time: ", abs(self.time_start - end))
+
+
+def percentiles(latencies: List[float]) -> Dict[str, Optional[float]]:
+    """
+    The percentiles function summarises round trips in milliseconds.
+
+    :param latencies: The round trips in seconds
+    :return: p50, p95, p99 and max, None when nothing was measured
+    """
+    if not latencies:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    ms = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "p50": round(float(p50), 2),
+        "p95": round(float(p95), 2),
+        "p99": round(float(p99), 2),
+        "max": round(float(ms.max()), 2),
+    }
@@ -4,9 +4,11 @@
 import asyncio
 import logging
 import os
+import socket
+from multiprocessing import Process
 
 from py_linq import Enumerable
-from uvicorn import Server, Config
+from uvicorn import Server, Config, run as uvicorn_run
 
 from app import app
 from app.endpoints.routes import add_routes
@@ -33,6 +35,41 @@ class SocketServer(Server):
         return await self.serve(sockets=sockets)
 
 
+def run_socket_worker(port: int):
+    """
+    Runs one socket worker. The worker id is taken again in the worker, as
+    the one of settings was computed in the parent process.
+    """
+    if "WORKER_ID" not in os.environ:
+        config.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    uvicorn_run(
+        "app.rpc:app",
+        host=config.fastapi_host,
+        port=port,
+        ssl_keyfile="certs/local.key",
+        ssl_certfile="certs/local.pem",
+    )
+
+
+def run_socket_workers():
+    """
+    Runs the socket tier as SOCKET_WORKERS uvicorn processes, each listening on
+    a port of its own from the socket port up. An Engine.IO session lives in
+    the process that opened it and the polling transport sends every request
+    of it separately, so the workers cannot share one listening socket: a load
+    balancer with sticky sessions (e.g. nginx ip_hash) has to spread the
+    clients over the ports. Rooms and emits are shared through the redis
+    client manager.
+    """
+    workers = [
+        Process(target=run_socket_worker, args=(config.fastapi_port + 1 + i,))
+        for i in range(config.socket_workers)
+    ]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
 async def run():
     app_configs = [
         {
@@ -55,6 +92,9 @@ async def run():
             )
         },
     ]
+    if config.socket_workers > 1:
+        app_configs.pop()
+        run_socket_workers()
 
     apps = [
         SocketServer(config=Enumerable(_config.values()).first()).run()
@@ -1,4 +1,5 @@
 import os
+import socket
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -54,3 +55,59 @@ class Config:
     otp_reset_time = os.getenv("OTP_RESET_TIME", "minutes=3")
     rtp_pool_max: float = os.getenv("RTP_POOL_MAX", 0.85)
     rtp_user_min: int = os.getenv("RTP_USER_MIN", 0)
+    hit_schedule_path: str = os.getenv(
+        "HIT_SCHEDULE_PATH", f"{base_dir}/data/hit_schedule.npz"
+    )
+    hit_schedule_seed: int = (
+        int(os.getenv("HIT_SCHEDULE_SEED")) if os.getenv("HIT_SCHEDULE_SEED") else None
+    )
+    hit_schedule_shm: str = os.getenv("HIT_SCHEDULE_SHM", "casino_hit_schedule")
+    hit_schedule_attach_timeout: float = float(
+        os.getenv("HIT_SCHEDULE_ATTACH_TIMEOUT", 5)
+    )
+    rtp_checkpoint_events: int = int(os.getenv("RTP_CHECKPOINT_EVENTS", 100))
+    rtp_checkpoint_seconds: float = float(os.getenv("RTP_CHECKPOINT_SECONDS", 5))
+    ledger_mode: str = os.getenv("LEDGER_MODE", "batched")
+    ledger_flush_events: int = int(os.getenv("LEDGER_FLUSH_EVENTS", 500))
+    ledger_flush_ms: int = int(os.getenv("LEDGER_FLUSH_MS", 50))
+    page_count_ttl: float = float(os.getenv("PAGE_COUNT_TTL", 30))
+    page_count_exact_limit: int = int(os.getenv("PAGE_COUNT_EXACT_LIMIT", 10000))
+    async_pool_size: int = int(os.getenv("ASYNC_POOL_SIZE", 20))
+    async_max_overflow: int = int(os.getenv("ASYNC_MAX_OVERFLOW", 10))
+    ledger_capacity: int = int(os.getenv("LEDGER_CAPACITY", 100000))
+    ledger_id_block: int = int(os.getenv("LEDGER_ID_BLOCK", 1000))
+    ledger_use_copy: bool = os.getenv("LEDGER_USE_COPY", "true").lower() == "true"
+    path_catalog_poll_seconds: float = float(
+        os.getenv("PATH_CATALOG_POLL_SECONDS", 30)
+    )
+    table_rng_seed: int = (
+        int(os.getenv("TABLE_RNG_SEED")) if os.getenv("TABLE_RNG_SEED") else None
+    )
+    table_rng_block: int = int(os.getenv("TABLE_RNG_BLOCK", 4096))
+    tick_rate: float = float(os.getenv("TICK_RATE", 1))
+    tick_max_catch_up: int = int(os.getenv("TICK_MAX_CATCH_UP", 30))
+    scene_change_seconds: float = float(os.getenv("SCENE_CHANGE_SECONDS", 1200))
+    room_max_seats: int = int(os.getenv("ROOM_MAX_SEATS", 4))
+    socket_manager: str = os.getenv("SOCKET_MANAGER", "")
+    socket_redis_url: str = os.getenv("SOCKET_REDIS_URL", redis_host)
+    socket_channel: str = os.getenv("SOCKET_CHANNEL", "socketio")
+    socket_workers: int = int(os.getenv("SOCKET_WORKERS", 1))
+    session_ttl: float = float(os.getenv("SESSION_TTL", 3600))
+    presence_ttl: float = float(os.getenv("PRESENCE_TTL", 60))
+    presence_flush_seconds: float = float(os.getenv("PRESENCE_FLUSH_SECONDS", 5))
+    broadcast_flush_ms: float = float(os.getenv("BROADCAST_FLUSH_MS", 50))
+    broadcast_max_events: int = int(os.getenv("BROADCAST_MAX_EVENTS", 512))
+    broadcast_max_backlog: int = int(os.getenv("BROADCAST_MAX_BACKLOG", 256))
+    token_cache_ttl: float = float(os.getenv("TOKEN_CACHE_TTL", 300))
+    token_cache_size: int = int(os.getenv("TOKEN_CACHE_SIZE", 100000))
+    token_cache_negative_ttl: float = float(os.getenv("TOKEN_CACHE_NEGATIVE_TTL", 5))
+    rate_limits: str = os.getenv("RATE_LIMITS", "")
+    rate_limit_rate: float = float(os.getenv("RATE_LIMIT_RATE", 10))
+    rate_limit_burst: float = float(os.getenv("RATE_LIMIT_BURST", 20))
+    rate_limit_max_delay: float = float(os.getenv("RATE_LIMIT_MAX_DELAY", 0.25))
+    worker_id: str = os.getenv("WORKER_ID", f"{socket.gethostname()}:{os.getpid()}")
+    table_bus: str = os.getenv("TABLE_BUS", "")
+    table_ring_replicas: int = int(os.getenv("TABLE_RING_REPLICAS", 128))
+    table_heartbeat_seconds: float = float(os.getenv("TABLE_HEARTBEAT_SECONDS", 5))
+    table_worker_ttl: float = float(os.getenv("TABLE_WORKER_TTL", 15))
+    table_handoff_timeout: float = float(os.getenv("TABLE_HANDOFF_TIMEOUT", 2))